@@ -0,0 +1,125 @@
+"""
+Buffers for captured command output that outgrow memory
+"""
+
+import mmap
+import os
+
+# Captured output beyond this many bytes is moved out of memory
+DEFAULT_LIMIT = 16 * 1024 * 1024
+
+# Size of the reads a spilled buffer is copied out with
+COPY_SIZE = 1024 * 1024
+
+
+def anonymous_file():
+    """
+    A read-write file without a name, gone once closed
+
+    A temporary file comes first since it takes the data out of memory,
+    a memfd is the fallback when the temporary directory can't be written.
+    """
+    # Only needed once output gets large, kept out of the shell's startup
+    import tempfile
+    try:
+        return tempfile.TemporaryFile()
+    except OSError:
+        if not hasattr(os, "memfd_create"):
+            raise
+        return open(os.memfd_create("echocraft-capture", os.MFD_CLOEXEC), "w+b")
+
+
+class CaptureBuffer:
+    """
+    Binary output kept in memory up to a limit, then in an anonymous file
+
+    Writes go to a list of chunks until they add up to more than limit
+    bytes; from then on everything lives in a file instead, so capturing a
+    huge output costs disk space rather than memory. The content is read
+    back as one piece through view(), which maps the file once spilled, or
+    copied out to a binary file object a slice at a time with copy_to().
+    """
+
+    def __init__(self, limit: int = DEFAULT_LIMIT):
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+        # Anonymous file holding the content once spilled
+        self.file = None
+
+    def write(self, data) -> int:
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.chunks.append(bytes(data))
+            if self.size + len(data) > self.limit:
+                self._spill()
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    @property
+    def spilled(self) -> bool:
+        return self.file is not None
+
+    def view(self):
+        """
+        The content as a read-only buffer
+
+        Returns:
+            bytes, or an mmap of the file once spilled
+        """
+        if self.file is None:
+            if len(self.chunks) > 1:
+                self.chunks = [b"".join(self.chunks)]
+            return self.chunks[0] if self.chunks else b""
+
+        self.file.flush()
+        return mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+
+    def getvalue(self) -> bytes:
+        """The whole content in memory, only for output known to be small"""
+        view = self.view()
+        if isinstance(view, bytes):
+            return view
+        with view:
+            return view[:]
+
+    def copy_to(self, file):
+        """Write the content to a binary file object"""
+        if self.file is None:
+            for chunk in self.chunks:
+                file.write(chunk)
+            return
+
+        # Read rather than mapped, pages touched through a mapping would
+        # count towards the shell's memory until it is unmapped
+        self.file.flush()
+        fd = self.file.fileno()
+        for offset in range(0, self.size, COPY_SIZE):
+            file.write(os.pread(fd, COPY_SIZE, offset))
+
+    def close(self):
+        """Drop the content, removing the file it may have spilled to"""
+        self.chunks = []
+        self.size = 0
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        where = "file" if self.file is not None else "memory"
+        return f"CaptureBuffer({self.size} bytes in {where})"
+
+    def _spill(self):
+        """Move the chunks written so far to an anonymous file"""
+        self.file = anonymous_file()
+        for chunk in self.chunks:
+            self.file.write(chunk)
+        self.chunks = []
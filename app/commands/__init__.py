@@ -1,31 +1,9 @@
+import importlib
 import os
 import shutil
 from app.history import HistoryManager
-from app.lexical.token import TokenType
-from typing import List
-
-class CommandResult:
-    def __init__(self, exit_code=0, stdout="", stderr=""):
-        self.exit_code = exit_code
-        self.stdout = stdout
-        self.stderr = stderr
-
-    def __repr__(self):
-        return f"CommandResult(exit_code={self.exit_code}, stdout='{self.stdout}', stderr='{self.stderr}')"
-
-class BaseCommand:
-    def execute(self, args: List[TokenType]) -> CommandResult:
-        # Override in subclasses
-        pass
-        
-    def get_help(self) -> str:
-        # Return help text
-        pass
-        
-    def validate_args(self, args: List[TokenType]) -> bool:
-        # Check if arguments are valid
-        pass
-
+from app.commands.base import BaseCommand, CommandResult, StreamCommand, to_bytes
+from app.options import ShellOptions
 
 class PwdCommand(BaseCommand):
     def execute(self, args) -> CommandResult:
@@ -36,15 +14,18 @@ class PwdCommand(BaseCommand):
             return CommandResult(exit_code=1, stderr=str(e))
 
 class TypeCommand(BaseCommand):
+    def __init__(self, registry):
+        self.registry = registry
+
     def execute(self, args) -> CommandResult:
         if not args:
             return CommandResult(exit_code=1, stderr="type: missing argument")
         
         builtin = args[0].value
         try:
-            if CommandRegistry().is_builtin_command(builtin):
+            if self.registry.is_builtin_command(builtin):
                 return CommandResult(exit_code=0, stdout=f"{builtin} is a shell builtin\n")
-            elif path := shutil.which(builtin):
+            elif path := self.registry.find_executable(builtin):
                 return CommandResult(exit_code=0, stdout=f"{builtin} is {path}\n")
             else:
                 return CommandResult(exit_code=0, stdout=f"{builtin}: not found\n")
@@ -90,47 +71,258 @@ class EchoCommand(BaseCommand):
     def get_help(self) -> str:
         return "Echo the arguments to standard output."
     
-class HistoryCommand(BaseCommand):
+class HistoryCommand(StreamCommand):
+    # History can be long, so entries are written out as they are listed
+    reads_stdin = False
+
     def __init__(self, history_manager):
         """
         Initialize history command with reference to history manager
         
         Args:
-            history_manager: HistoryManager instance
+            history_manager: HistoryManager instance, None in batch mode
         """
         self.history_manager = history_manager
 
-    def execute(self, args) -> CommandResult:
-        # Return the command history
+    def run(self, args, stdin, stdout, stderr) -> int:
+        if self.history_manager is None:
+            # Batch mode keeps no history
+            stderr.write(b"history: not available in batch mode\n")
+            return 1
+
+        # Write the command history
         try:
             # Parse arguments
-            if not args:
+            if args and args[0].value == "-s":
+                if len(args) != 2:
+                    stderr.write(b"history: -s: expects one pattern\nUsage: history -s pattern\n")
+                    return 1
+                return self.search(args[1].value, stdout)
+            elif not args:
                 # Show all history
                 count = None
             elif len(args) == 1:
                 try:
                     count = int(args[0].value)
                     if count <= 0:
-                        return CommandResult(exit_code=1, stdout="", stderr="history: invalid count: must be positive integer\n")
+                        stderr.write(b"history: invalid count: must be positive integer\n")
+                        return 1
                 except ValueError:
-                    return CommandResult(exit_code=1, stdout="", stderr=f"history: invalid argument: '{args[0]}'\n")
+                    stderr.write(to_bytes(f"history: invalid argument: '{args[0].value}'\n"))
+                    return 1
             else:
-                return CommandResult(exit_code=1, stdout="", stderr="history: too many arguments\nUsage: history [n]\n")
-            
+                stderr.write(b"history: too many arguments\nUsage: history [n] | history -s pattern\n")
+                return 1
+
             # Get history and format output
             history_list = self.history_manager.get_history(count)
-            
+
             if not history_list:
-                output = "No commands in history\n"
+                stdout.write(b"No commands in history\n")
             else:
-                output = ""
                 for index, command in history_list:
-                    output += f"{index:4d}  {command}\n"
-            
-            return CommandResult(exit_code=0, stdout=output, stderr="")
-            
+                    stdout.write(to_bytes(f"{index:4d}  {command}\n"))
+
+            return 0
+
+        except BrokenPipeError:
+            raise
         except Exception as e:
-            return CommandResult(exit_code=1, stdout="", stderr=f"history: error: {e}\n")
+            stderr.write(to_bytes(f"history: error: {e}\n"))
+            return 1
+
+    def search(self, pattern: str, stdout) -> int:
+        """Write the commands containing pattern, 1 when there are none"""
+        found = False
+        for entry in self.history_manager.search(pattern):
+            stdout.write(to_bytes(f"{entry.number:4d}  {entry.command}\n"))
+            found = True
+        return 0 if found else 1
+
+class SetCommand(BaseCommand):
+    def __init__(self, options: ShellOptions):
+        self.options = options
+
+    def execute(self, args) -> CommandResult:
+        if not args or (len(args) == 1 and args[0].value == "-o"):
+            # List every option with its current value
+            output = "".join(
+                f"{name:<15}\t{'on' if value else 'off'}\n" for name, value in self.options.items()
+            )
+            return CommandResult(exit_code=0, stdout=output)
+
+        if len(args) != 2 or args[0].value not in ("-o", "+o"):
+            return CommandResult(exit_code=1, stderr="set: usage: set [-o|+o] [option]\n")
+
+        name = args[1].value
+        try:
+            self.options.set_option(name, args[0].value == "-o")
+        except KeyError:
+            return CommandResult(exit_code=1, stderr=f"set: {name}: invalid option name\n")
+
+        return CommandResult(exit_code=0)
+
+    def get_help(self) -> str:
+        return "Set or unset shell options."
+
+class HashCommand(BaseCommand):
+    def __init__(self, registry):
+        self.registry = registry
+
+    def execute(self, args) -> CommandResult:
+        if not args:
+            entries = self.registry.hashed_commands()
+            if not entries:
+                return CommandResult(exit_code=0, stdout="hash: hash table empty\n")
+
+            output = "hits\tcommand\n"
+            for name, entry in entries:
+                output += f"{entry.hits:4d}\t{entry.path}\n"
+            return CommandResult(exit_code=0, stdout=output)
+
+        option = args[0].value
+        if option == "-r":
+            self.registry.clear_hash()
+            return CommandResult(exit_code=0)
+
+        if option == "-p":
+            if len(args) != 3:
+                return CommandResult(exit_code=1, stderr="hash: usage: hash -p path name\n")
+            self.registry.hash_command(args[2].value, args[1].value)
+            return CommandResult(exit_code=0)
+
+        if option in ("-d", "-t"):
+            names = args[1:]
+            if not names:
+                return CommandResult(exit_code=1, stderr=f"hash: {option}: option requires an argument\n")
+        else:
+            names = args
+
+        exit_code, output, errors = 0, "", ""
+        for arg in names:
+            name = arg.value
+            if option == "-d":
+                found = self.registry.forget_command(name)
+            elif option == "-t":
+                found = self.registry.lookup_hash(name)
+                if found:
+                    output += f"{found}\n" if len(names) == 1 else f"{name}\t{found}\n"
+            else:
+                found = self.registry.is_builtin_command(name) or self.registry.find_executable(name)
+
+            if not found:
+                exit_code = 1
+                errors += f"hash: {name}: not found\n"
+
+        return CommandResult(exit_code=exit_code, stdout=output, stderr=errors)
+
+    def get_help(self) -> str:
+        return "Show, add to or clear the table of remembered command locations."
+
+class ParseCacheCommand(BaseCommand):
+    def __init__(self, cache):
+        """
+        Initialize parse cache command with reference to the plan cache
+
+        Args:
+            cache: PlanCache instance
+        """
+        self.cache = cache
+
+    def execute(self, args) -> CommandResult:
+        if not args:
+            output = (
+                f"size       {len(self.cache)}/{self.cache.max_size}\n"
+                f"hits       {self.cache.hits}\n"
+                f"misses     {self.cache.misses}\n"
+                f"evictions  {self.cache.evictions}\n"
+            )
+            return CommandResult(exit_code=0, stdout=output)
+
+        if args[0].value == "-c" and len(args) == 1:
+            self.cache.clear()
+            return CommandResult(exit_code=0)
+
+        if args[0].value == "-s" and len(args) == 2:
+            try:
+                size = int(args[1].value)
+                if size < 0:
+                    raise ValueError
+            except ValueError:
+                return CommandResult(exit_code=1, stderr=f"parsecache: {args[1].value}: invalid size\n")
+            self.cache.resize(size)
+            return CommandResult(exit_code=0)
+
+        return CommandResult(exit_code=1, stderr="parsecache: usage: parsecache [-c | -s size]\n")
+
+    def get_help(self) -> str:
+        return "Show, clear or resize the cache of parsed command lines."
+
+class StatsCommand(BaseCommand):
+    def __init__(self, tracer):
+        """
+        Initialize stats command with reference to the tracer
+
+        Args:
+            tracer: Tracer keeping the counters of the session
+        """
+        self.tracer = tracer
+
+    def execute(self, args) -> CommandResult:
+        if args and args[0].value == "-r" and len(args) == 1:
+            self.tracer.counters.clear()
+            return CommandResult(exit_code=0)
+        if args:
+            return CommandResult(exit_code=1, stderr="stats: usage: stats [-r]\n")
+
+        counters = self.tracer.counters
+        lines = counters["lines"]
+        misses = counters["cache_miss"]
+        if not self.tracer.enabled:
+            tracing = "off"
+        else:
+            tracing = f"on, writing to {self.tracer.path}" if self.tracer.path else "on"
+
+        output = (
+            f"tracing    {tracing}\n"
+            f"lines      {lines}, {counters['failures']} failed, "
+            f"{counters['line_us'] / max(lines, 1):.0f} us each\n"
+            f"cache      {counters['cache_hit']} hits, {misses} misses\n"
+            f"lex        {counters['lex_us'] / max(misses, 1):.1f} us per miss\n"
+            f"parse      {counters['parse_us'] / max(misses, 1):.1f} us per miss\n"
+            f"pipelines  {counters['pipelines']}\n"
+            f"stages     {counters['stages']}, {counters['builtins']} built-in, {counters['externals']} external\n"
+            f"spawn      {counters['spawn_us'] / max(counters['stages'], 1):.0f} us per stage\n"
+            f"run        {counters['run_us'] / 1e6:.3f} s in stages\n"
+            f"bytes      {counters['read_bytes']} read, {counters['written_bytes']} written\n"
+        )
+        return CommandResult(exit_code=0, stdout=output)
+
+    def get_help(self) -> str:
+        return "Show or reset the counters collected while tracing."
+
+class CommandCommand(BaseCommand):
+    def __init__(self, registry):
+        self.registry = registry
+
+    def execute(self, args) -> CommandResult:
+        # `command NAME ...` is resolved by the pipeline itself, only the
+        # forms that don't run anything end up here
+        if not args:
+            return CommandResult(exit_code=0)
+
+        if args[0].value == "-v" and len(args) == 2:
+            name = args[1].value
+            if self.registry.is_builtin_command(name) and not self.registry.get_command(name).native:
+                return CommandResult(exit_code=0, stdout=f"{name}\n")
+            if path := self.registry.find_executable(name):
+                return CommandResult(exit_code=0, stdout=f"{path}\n")
+            return CommandResult(exit_code=1)
+
+        return CommandResult(exit_code=2, stderr="command: usage: command [-v] name [arg ...]\n")
+
+    def get_help(self) -> str:
+        return "Run a command, bypassing native stand-ins for external utilities."
 
 class ValarMorghulisCommand(BaseCommand):
     def execute(self, args) -> CommandResult:
@@ -139,24 +331,69 @@ class ValarMorghulisCommand(BaseCommand):
     def get_help(self) -> str:
         return "A custom command for all the GOT fans."
     
+class HashEntry:
+    """Remembered location of an external command"""
+    def __init__(self, path: str, dir_mtime: int):
+        self.path = path
+        # mtime of the containing directory when the path was looked up
+        self.dir_mtime = dir_mtime
+        self.hits = 0
+
+class LazyBuiltin:
+    """A built-in registered by the dotted path of its class, not yet imported"""
+
+    def __init__(self, path: str, kwargs: dict):
+        self.path = path
+        self.kwargs = kwargs
+
+    def load(self) -> BaseCommand:
+        """Import the module of the class and instantiate it"""
+        module_name, _, class_name = self.path.rpartition(".")
+        module = importlib.import_module(module_name)
+        return getattr(module, class_name)(**self.kwargs)
+
 class CommandRegistry:
-    def __init__(self, history_manager: HistoryManager = None):
+    def __init__(self, history_manager: HistoryManager = None, options: ShellOptions = None):
         self.built_ins = {}
         self.history_manager = history_manager
+        if history_manager is not None:
+            history_manager.registry = self
+        self.options = options or ShellOptions()
+
+        # Command name -> HashEntry, valid for the PATH it was built with
+        self.hash_table = {}
+        self.hash_path = os.environ.get("PATH")
 
         # Register built-in commands
         self.register_builtin("pwd", PwdCommand)
-        self.register_builtin("type", TypeCommand)
+        self.register_builtin("type", TypeCommand, registry=self)
         self.register_builtin("cd", ChangeDirCommand)
         self.register_builtin("exit", ExitCommand)
         self.register_builtin("echo", EchoCommand)
         self.register_builtin("history", HistoryCommand, history_manager=history_manager)
+        self.register_builtin("set", SetCommand, options=self.options)
+        self.register_builtin("hash", HashCommand, registry=self)
+        self.register_builtin("command", CommandCommand, registry=self)
+        self.register_builtin("timeout", "app.commands.limits.TimeoutCommand", options=self.options)
+        self.register_builtin("ulimit", "app.commands.limits.UlimitCommand", options=self.options)
+
+        # Native stand-ins for the most common filters, imported on first use
+        self.register_builtin("cat", "app.commands.textutils.CatCommand")
+        self.register_builtin("head", "app.commands.textutils.HeadCommand")
+        self.register_builtin("tail", "app.commands.textutils.TailCommand")
+        self.register_builtin("wc", "app.commands.textutils.WcCommand")
+        self.register_builtin("grep", "app.commands.textutils.GrepCommand")
+        self.register_builtin("tee", "app.commands.textutils.TeeCommand")
         self.register_builtin("valar-morghulis", ValarMorghulisCommand)
     
     def register_builtin(self, name: str, command_class: BaseCommand, **kwargs):
         # Check if command_class is already an instance
         if isinstance(command_class, BaseCommand):
             self.built_ins[name] = command_class
+        elif isinstance(command_class, str):
+            # Dotted path of the class, its module is imported when the
+            # command is first looked up so startup doesn't pay for it
+            self.built_ins[name] = LazyBuiltin(command_class, kwargs)
         else:
             # Instantiate the class with optional kwargs
             self.built_ins[name] = command_class(**kwargs)
@@ -164,7 +401,10 @@ class CommandRegistry:
     def get_command(self, name: str):
         # Look up command (built-ins first, then external)
         if name in self.built_ins:
-            return self.built_ins[name]
+            command = self.built_ins[name]
+            if isinstance(command, LazyBuiltin):
+                command = self.built_ins[name] = command.load()
+            return command
         else:
             return None
         
@@ -176,4 +416,76 @@ class CommandRegistry:
         # Check if command exists in PATH
 
         if not name in self.built_ins:
-            return True
\ No newline at end of file
+            return True
+
+    def find_executable(self, name: str):
+        """
+        Get the absolute path of an external command, or None if not found
+
+        Locations are remembered in the hash table so PATH isn't searched on
+        every spawn. An entry is trusted while PATH is unchanged and its
+        directory mtime is the same as when it was looked up, which costs a
+        single stat instead of one per PATH entry. `hash -r` clears it.
+        """
+        if "/" in name:
+            # Paths are used as given and never hashed
+            return name if os.path.isfile(name) and os.access(name, os.X_OK) else None
+
+        self._check_hash_path()
+
+        entry = self.hash_table.get(name)
+        if entry is not None:
+            try:
+                if os.stat(os.path.dirname(entry.path)).st_mtime_ns == entry.dir_mtime:
+                    entry.hits += 1
+                    return entry.path
+            except OSError:
+                pass
+            # The directory changed, the command may have moved or gone
+            del self.hash_table[name]
+
+        path = shutil.which(name)
+        if path is None:
+            return None
+
+        entry = self.hash_command(name, path)
+        entry.hits += 1
+        return entry.path
+
+    def hash_command(self, name: str, path: str) -> HashEntry:
+        """Remember path as the location of name"""
+        self._check_hash_path()
+        try:
+            dir_mtime = os.stat(os.path.dirname(path) or ".").st_mtime_ns
+        except OSError:
+            dir_mtime = None
+
+        entry = HashEntry(path, dir_mtime)
+        self.hash_table[name] = entry
+        return entry
+
+    def lookup_hash(self, name: str):
+        """Get the remembered path of name without searching PATH"""
+        self._check_hash_path()
+        entry = self.hash_table.get(name)
+        return entry.path if entry else None
+
+    def forget_command(self, name: str) -> bool:
+        """Drop the remembered location of name"""
+        return self.hash_table.pop(name, None) is not None
+
+    def hashed_commands(self) -> list:
+        """Get (name, HashEntry) pairs for every remembered command"""
+        self._check_hash_path()
+        return list(self.hash_table.items())
+
+    def clear_hash(self):
+        """Forget every remembered command location"""
+        self.hash_table.clear()
+
+    def _check_hash_path(self):
+        """Invalidate the hash table when PATH has changed"""
+        path = os.environ.get("PATH")
+        if path != self.hash_path:
+            self.hash_table.clear()
+            self.hash_path = path
@@ -0,0 +1,150 @@
+import abc
+import os
+import threading
+from typing import List, Optional
+from app.capture import CaptureBuffer
+from app.lexical.token import Token, TokenType
+
+# Lets text output that isn't valid UTF-8 round-trip to bytes
+TEXT_ERRORS = "surrogateescape"
+
+# Cancel event of the pipeline whose built-in the current thread runs
+_running = threading.local()
+
+
+class Cancelled(Exception):
+    """Raised by check_cancelled() in a built-in whose pipeline is torn down"""
+
+
+def cancel_on(event: Optional[threading.Event]):
+    """Have check_cancelled() raise in this thread once event is set, never with None"""
+    _running.event = event
+
+
+def check_cancelled():
+    """
+    Stop the built-in running in this thread if its pipeline was cancelled
+
+    Built-ins that loop over their input or output call it on every chunk,
+    so a timeout, Ctrl-C or kill stops them even when no pipe ever closes.
+
+    Raises:
+        Cancelled: if the pipeline was cancelled
+    """
+    event = getattr(_running, "event", None)
+    if event is not None and event.is_set():
+        raise Cancelled()
+
+
+def to_bytes(data) -> bytes:
+    """Encode output of a text command, raw bytes are passed through"""
+    if isinstance(data, str):
+        return data.encode(errors=TEXT_ERRORS)
+    if isinstance(data, CaptureBuffer):
+        return data.getvalue()
+    return data
+
+
+def write_output(file, data):
+    """Write command output to a binary file object, whatever it is held in"""
+    if isinstance(data, CaptureBuffer):
+        data.copy_to(file)
+    else:
+        file.write(to_bytes(data))
+
+
+class CommandResult:
+    __slots__ = ("exit_code", "stdout", "stderr")
+
+    def __init__(self, exit_code=0, stdout="", stderr=""):
+        # stdout and stderr hold str for text commands, raw bytes, or a
+        # CaptureBuffer for output collected from a stream
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __repr__(self):
+        return f"CommandResult(exit_code={self.exit_code}, stdout='{self.stdout}', stderr='{self.stderr}')"
+
+class BaseCommand:
+    """
+    A built-in command
+
+    Pipelines run built-ins through run(), against binary file objects
+    wired to the other stages, in a thread of their own when there are
+    other stages. Simple commands only override execute() and return their
+    whole output at once; commands that produce or consume a lot of data
+    override run() and stream it instead.
+    """
+
+    # Whether the command consumes piped input. Commands that don't have
+    # their end of the pipe closed right away, so the producer gets SIGPIPE
+    reads_stdin = False
+
+    # Whether the command stands in for an external utility of the same
+    # name. `command NAME` skips such built-ins and runs the utility itself
+    native = False
+
+    def run(self, args: List[Token], stdin, stdout, stderr) -> int:
+        """
+        Run the command against binary file objects
+
+        stdin is None when the command doesn't read its input. A write to
+        stdout raises BrokenPipeError once the reader has gone away.
+
+        Returns:
+            int: exit status
+        """
+        result = self.execute(list(args))
+        try:
+            if result.stdout:
+                write_output(stdout, result.stdout)
+                stdout.flush()
+        finally:
+            if result.stderr:
+                write_output(stderr, result.stderr)
+        return result.exit_code
+
+    def execute(self, args: List[TokenType]) -> CommandResult:
+        # Override in subclasses
+        pass
+
+    def get_help(self) -> str:
+        # Return help text
+        pass
+
+    def validate_args(self, args: List[TokenType]) -> bool:
+        # Check if arguments are valid
+        pass
+
+
+class StreamCommand(BaseCommand, metaclass=abc.ABCMeta):
+    """
+    Built-in that streams its output, and possibly its input, through run()
+
+    execute() is still available and collects everything run() writes,
+    into buffers that move to disk when the output gets large. Subclasses
+    must implement run(), one that doesn't can't be instantiated.
+    """
+    reads_stdin = True
+
+    @abc.abstractmethod
+    def run(self, args: List[Token], stdin, stdout, stderr) -> int:
+        """
+        Stream the command between binary file objects
+
+        Args:
+            args: Arguments after the command name
+            stdin: Input to read, None when the command doesn't read it
+            stdout: Output to write, raising BrokenPipeError once the reader is gone
+            stderr: Output for error messages
+
+        Returns:
+            int: exit status
+        """
+
+    def execute(self, args: List[TokenType]) -> CommandResult:
+        stdout, stderr = CaptureBuffer(), CaptureBuffer()
+        with open(os.devnull, "rb") as stdin:
+            exit_code = self.run(args, stdin, stdout, stderr)
+        return CommandResult(exit_code=exit_code, stdout=stdout, stderr=stderr)
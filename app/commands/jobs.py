@@ -0,0 +1,226 @@
+"""
+Job control built-ins: jobs, fg, bg, wait and kill
+"""
+
+import os
+import signal
+from app.commands.base import BaseCommand, CommandResult, StreamCommand, to_bytes
+from app.limits import parse_signal
+
+# Signals that leave a stopped process stopped, any other one gets it
+# continued too so it can act on it, like bash's kill does
+STOP_SIGNALS = (signal.SIGSTOP, signal.SIGTSTP, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCONT)
+
+
+class JobsCommand(BaseCommand):
+    def __init__(self, jobs):
+        """
+        Args:
+            jobs: JobTable of the shell
+        """
+        self.jobs = jobs
+
+    def execute(self, args) -> CommandResult:
+        flags = {arg.value for arg in args if arg.value.startswith("-")}
+        specs = [arg.value for arg in args if not arg.value.startswith("-")]
+        if not flags <= {"-l", "-p"}:
+            return CommandResult(exit_code=2, stderr="jobs: usage: jobs [-lp] [jobspec ...]\n")
+
+        if specs:
+            selected = []
+            for spec in specs:
+                job = self.jobs.find(spec)
+                if job is None:
+                    return CommandResult(exit_code=1, stderr=f"jobs: {spec}: no such job\n")
+                selected.append(job)
+        else:
+            selected = self.jobs.all_jobs()
+
+        if "-p" in flags:
+            output = "".join(f"{job.pids[-1]}\n" for job in selected if job.pids)
+        else:
+            output = "".join(f"{self.jobs.describe(job, pids='-l' in flags)}\n" for job in selected)
+
+        # Jobs reported as over are forgotten, as they would be at the prompt
+        for job in selected:
+            if job.finished:
+                self.jobs.remove(job)
+        return CommandResult(exit_code=0, stdout=output)
+
+    def get_help(self) -> str:
+        return "List the jobs of the shell."
+
+
+class FgCommand(StreamCommand):
+    reads_stdin = False
+
+    def __init__(self, jobs, processor):
+        """
+        Args:
+            jobs: JobTable of the shell
+            processor: PipeProcessor that collects the status of finished jobs
+        """
+        self.jobs = jobs
+        self.processor = processor
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        if not self.jobs.job_control:
+            stderr.write(b"fg: no job control\n")
+            return 1
+
+        spec = args[0].value if args else "%+"
+        job = self.jobs.find(spec)
+        if job is None:
+            stderr.write(to_bytes(f"fg: {'current' if not args else spec}: no such job\n"))
+            return 1
+
+        stdout.write(to_bytes(f"{job.command}\n"))
+        stdout.flush()
+
+        self.jobs.foreground(job)
+        if job.stopped:
+            stderr.write(to_bytes(f"\n{self.jobs.describe(job)}\n"))
+            return 128 + signal.SIGTSTP
+
+        self.jobs.remove(job)
+        exit_code, job_stdout, job_stderr = self.processor.finish(job.pipeline)
+        # Output of a job that was captured before it got stopped
+        try:
+            job_stderr.copy_to(stderr)
+            job_stdout.copy_to(stdout)
+        finally:
+            job.pipeline.close()
+        return exit_code
+
+    def get_help(self) -> str:
+        return "Move a job to the foreground."
+
+
+class BgCommand(BaseCommand):
+    def __init__(self, jobs):
+        """
+        Args:
+            jobs: JobTable of the shell
+        """
+        self.jobs = jobs
+
+    def execute(self, args) -> CommandResult:
+        if not self.jobs.job_control:
+            return CommandResult(exit_code=1, stderr="bg: no job control\n")
+
+        specs = [arg.value for arg in args] or ["%+"]
+        output = ""
+        for spec in specs:
+            job = self.jobs.find(spec)
+            if job is None:
+                name = "current" if not args else spec
+                return CommandResult(exit_code=1, stdout=output, stderr=f"bg: {name}: no such job\n")
+            if not job.stopped:
+                return CommandResult(exit_code=0, stdout=output, stderr=f"bg: job {job.id} already in background\n")
+
+            self.jobs.background(job)
+            output += f"[{job.id}]+ {job.command} &\n"
+        return CommandResult(exit_code=0, stdout=output)
+
+    def get_help(self) -> str:
+        return "Resume stopped jobs in the background."
+
+
+class WaitCommand(BaseCommand):
+    def __init__(self, jobs, processor):
+        """
+        Args:
+            jobs: JobTable of the shell
+            processor: PipeProcessor that collects the status of finished jobs
+        """
+        self.jobs = jobs
+        self.processor = processor
+
+    def execute(self, args) -> CommandResult:
+        if not args:
+            # Every job that can still finish on its own
+            for job in self.jobs.all_jobs():
+                if not job.stopped:
+                    self.jobs.wait(job)
+                    self.jobs.remove(job)
+            return CommandResult(exit_code=0)
+
+        exit_code = 0
+        errors = ""
+        for arg in args:
+            job = self.jobs.find(arg.value)
+            if job is None:
+                if arg.value.isdigit():
+                    errors += f"wait: pid {arg.value} is not a child of this shell\n"
+                else:
+                    errors += f"wait: {arg.value}: no such job\n"
+                exit_code = 127
+                continue
+
+            self.jobs.wait(job)
+            self.jobs.remove(job)
+            exit_code, _, _ = self.processor.finish(job.pipeline)
+        return CommandResult(exit_code=exit_code, stderr=errors)
+
+    def get_help(self) -> str:
+        return "Wait for jobs to finish and return the status of the last one."
+
+
+class KillCommand(BaseCommand):
+    def __init__(self, jobs):
+        """
+        Args:
+            jobs: JobTable of the shell
+        """
+        self.jobs = jobs
+
+    def execute(self, args) -> CommandResult:
+        values = [arg.value for arg in args]
+        if values == ["-l"]:
+            names = " ".join(sig.name[3:] for sig in signal.Signals if not sig.name.startswith("SIG_"))
+            return CommandResult(exit_code=0, stdout=f"{names}\n")
+
+        signum = signal.SIGTERM
+        if values and values[0] == "-s" and len(values) > 1:
+            name, values = values[1], values[2:]
+        elif values and values[0].startswith("-") and len(values[0]) > 1:
+            name, values = values[0][1:], values[1:]
+        else:
+            name = None
+
+        if name is not None:
+            try:
+                signum = parse_signal(name)
+            except ValueError:
+                return CommandResult(exit_code=1, stderr=f"kill: {name}: invalid signal specification\n")
+
+        if not values:
+            return CommandResult(exit_code=2, stderr="kill: usage: kill [-s sigspec | -sigspec] pid | jobspec ...\n")
+
+        exit_code = 0
+        errors = ""
+        for target in values:
+            if target.startswith("%"):
+                job = self.jobs.find(target)
+                if job is None:
+                    errors += f"kill: {target}: no such job\n"
+                    exit_code = 1
+                    continue
+                stopped = job.stopped
+                self.jobs.signal(job, signum)
+                if stopped and signum not in STOP_SIGNALS:
+                    self.jobs.signal(job, signal.SIGCONT)
+                continue
+
+            try:
+                os.kill(int(target), signum)
+            except ValueError:
+                errors += f"kill: {target}: arguments must be process or job IDs\n"
+                exit_code = 1
+            except OSError as e:
+                errors += f"kill: ({target}) - {e.strerror}\n"
+                exit_code = 1
+        return CommandResult(exit_code=exit_code, stderr=errors)
+
+    def get_help(self) -> str:
+        return "Send a signal to jobs or processes."
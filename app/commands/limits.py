@@ -0,0 +1,138 @@
+"""
+Built-ins setting the session timeout and resource limits, see app.limits
+"""
+
+import resource
+import signal
+from typing import List
+from app.commands.base import BaseCommand, CommandResult
+from app.lexical.token import Token
+from app.limits import DEFAULT_GRACE, LIMITS, UNLIMITED, Timeout, format_limit, parse_duration, parse_signal
+from app.options import ShellOptions
+
+TIMEOUT_USAGE = "timeout: usage: timeout [-k grace] [-s signal] duration command [arg ...]\n" \
+                "       timeout [-k grace] [-s signal] -d duration\n"
+
+ULIMIT_USAGE = f"ulimit: usage: ulimit [-a] [-{''.join(LIMITS)} [limit]]\n"
+
+
+def format_seconds(seconds: float) -> str:
+    return f"{seconds:g}"
+
+
+class TimeoutCommand(BaseCommand):
+    """
+    Show or set the timeout of every pipeline
+
+    `timeout duration command` in front of a pipeline is a keyword handled
+    by the planner. What reaches the built-in is the session default,
+    `timeout -d 30` to set it and `timeout -d 0` to clear it; anything else
+    is left to the external timeout, so `a | timeout 5 b` still limits b.
+    """
+    native = True
+
+    def __init__(self, options: ShellOptions):
+        self.options = options
+
+    def supports(self, args: List[Token]) -> bool:
+        return not args or any(arg.value == "-d" for arg in args)
+
+    def execute(self, args) -> CommandResult:
+        values = [arg.value for arg in args]
+        if not values:
+            timeout = self.options.timeout
+            if timeout is None:
+                return CommandResult(exit_code=0)
+            kill = "" if timeout.grace is None else f"-k {format_seconds(timeout.grace)} "
+            return CommandResult(exit_code=0, stdout=(
+                f"timeout {kill}-s {signal.Signals(timeout.signal).name[3:]} "
+                f"-d {format_seconds(timeout.duration)}\n"
+            ))
+
+        duration, grace, signum = None, DEFAULT_GRACE, signal.SIGTERM
+        try:
+            if len(values) % 2:
+                raise ValueError("option requires an argument")
+            for option, value in zip(values[::2], values[1::2]):
+                if option == "-d":
+                    duration = parse_duration(value)
+                elif option == "-k":
+                    grace = parse_duration(value)
+                elif option == "-s":
+                    signum = parse_signal(value)
+                else:
+                    raise ValueError(f"{option}: invalid option")
+        except ValueError as e:
+            return CommandResult(exit_code=2, stderr=f"timeout: {e}\n{TIMEOUT_USAGE}")
+
+        self.options.timeout = Timeout(duration, grace, signum) if duration else None
+        return CommandResult(exit_code=0)
+
+    def get_help(self) -> str:
+        return "Show or set the timeout of every command."
+
+
+class UlimitCommand(BaseCommand):
+    """
+    Show or set the resource limits of the commands the shell starts
+
+    Limits are applied to each external command before it runs, the shell
+    itself keeps its own, so a limit can be raised again later. Like for
+    any unprivileged process, none can go beyond the shell's hard limit.
+    """
+
+    def __init__(self, options: ShellOptions):
+        self.options = options
+
+    def current(self, limit: int) -> int:
+        """Limit commands get, set here or inherited from the shell"""
+        return self.options.limits.get(limit, resource.getrlimit(limit)[0])
+
+    def execute(self, args) -> CommandResult:
+        values = [arg.value for arg in args]
+        if not values or values == ["-a"]:
+            return CommandResult(exit_code=0, stdout="".join(
+                f"{description:<28}(-{flag}) {format_limit(self.current(limit), unit)}\n"
+                for flag, (limit, description, unit) in LIMITS.items()
+            ))
+
+        output = []
+        changes = {}
+        i = 0
+        while i < len(values):
+            flag = values[i][1:]
+            if not values[i].startswith("-") or flag not in LIMITS:
+                return CommandResult(exit_code=2, stderr=f"ulimit: {values[i]}: invalid option\n{ULIMIT_USAGE}")
+            limit, description, unit = LIMITS[flag]
+            i += 1
+
+            if i == len(values) or values[i].startswith("-"):
+                output.append(f"{format_limit(self.current(limit), unit)}\n")
+                continue
+
+            text = values[i]
+            i += 1
+            if text == UNLIMITED:
+                value = resource.RLIM_INFINITY
+            elif text.isdigit():
+                value = int(text) * unit
+            else:
+                return CommandResult(exit_code=1, stderr=f"ulimit: {text}: invalid number\n")
+
+            hard = resource.getrlimit(limit)[1]
+            if hard != resource.RLIM_INFINITY and (value == resource.RLIM_INFINITY or value > hard):
+                return CommandResult(
+                    exit_code=1, stderr=f"ulimit: {description}: cannot modify limit: Operation not permitted\n"
+                )
+            changes[limit] = value
+
+        for limit, value in changes.items():
+            if resource.getrlimit(limit) == (value, value):
+                # Commands get that much from the shell anyway
+                self.options.limits.pop(limit, None)
+            else:
+                self.options.limits[limit] = value
+        return CommandResult(exit_code=0, stdout="".join(output))
+
+    def get_help(self) -> str:
+        return "Show or set resource limits of commands."
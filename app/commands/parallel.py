@@ -0,0 +1,179 @@
+"""
+The parallel built-in: runs a command for many inputs at once
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, List
+from app.commands.base import StreamCommand, TEXT_ERRORS, to_bytes
+from app.commands.textutils import STDIN, read_lines
+from app.lexical import MyLex
+from app.lexical.token import Token, TokenType
+
+# Replaced by the input in the command template
+PLACEHOLDER = "{}"
+
+# Separates the command template from inputs given as arguments
+ITEMS_MARKER = ":::"
+
+# Jobs queued per worker, bounds how far input is read ahead of the jobs
+QUEUE_DEPTH = 2
+
+# Exit status is the number of failed jobs, capped like GNU parallel does
+MAX_FAILURES = 101
+
+USAGE = "parallel: usage: parallel [-j N] [-k] [--summary] command [arg ...] [::: input ...]\n"
+
+WORD = TokenType.WORD
+COMMAND = TokenType.COMMAND
+
+
+class ParallelCommand(StreamCommand):
+    """
+    Run a command template once per input, several of them at a time
+
+    Inputs are the arguments after ::: or else the lines of stdin, read as
+    jobs need them. {} in the template stands for the input, which is
+    appended as a last argument when there is no {}. A template given as a
+    single word is tokenized like a command line, so it can hold pipes and
+    redirects. Each job's output is captured and written out in one piece
+    once it is over, in the order jobs finish or with -k in input order.
+    """
+
+    def __init__(self, planner, processor):
+        """
+        Args:
+            planner: Planner of the shell, plans the pipeline of every job
+            processor: PipeProcessor running the jobs
+        """
+        self.planner = planner
+        self.processor = processor
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        values = [arg.value for arg in args]
+        jobs = os.cpu_count() or 1
+        keep_order = False
+        summary = False
+
+        i = 0
+        while i < len(values) and values[i].startswith("-"):
+            option = values[i]
+            i += 1
+            if option == "--":
+                break
+            if option in ("-k", "--keep-order"):
+                keep_order = True
+            elif option == "--summary":
+                summary = True
+            elif option in ("-j", "--jobs") or option.startswith("-j"):
+                if option in ("-j", "--jobs"):
+                    if i == len(values):
+                        stderr.write(to_bytes(USAGE))
+                        return 2
+                    option, i = values[i], i + 1
+                else:
+                    option = option[2:]
+                if not option.isdigit() or int(option) < 1:
+                    stderr.write(to_bytes(f"parallel: {option}: invalid number of jobs\n"))
+                    return 2
+                jobs = int(option)
+            else:
+                stderr.write(to_bytes(f"parallel: {option}: invalid option\n{USAGE}"))
+                return 2
+
+        template = list(args[i:])
+        items = None
+        if ITEMS_MARKER in values[i:]:
+            marker = values.index(ITEMS_MARKER, i)
+            template, items = list(args[i:marker]), iter(values[marker + 1:])
+        if not template:
+            stderr.write(to_bytes(USAGE))
+            return 2
+
+        if len(template) == 1:
+            template = MyLex(template[0].value).parse()
+        try:
+            # Check the template once rather than failing every job
+            self.planner.plan_pipeline(template)
+        except ValueError as e:
+            stderr.write(to_bytes(f"parallel: {e}\n"))
+            return 2
+
+        if items is None:
+            items = self._read_items(stdin)
+
+        results = []
+        started = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=jobs)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(self._run_job, template, item))
+                if len(pending) >= jobs * QUEUE_DEPTH:
+                    self._write_done(pending, keep_order, results, stdout, stderr)
+            while pending:
+                self._write_done(pending, keep_order, results, stdout, stderr)
+        finally:
+            # Don't start what is still queued when output can't be written
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        failed = sum(1 for _, exit_code, _ in results if exit_code != 0)
+        if summary:
+            lines = [f"{'exit':>4}  {'time':>8}  input\n"]
+            lines.extend(f"{exit_code:>4}  {seconds:7.2f}s  {item}\n" for item, exit_code, seconds in results)
+            lines.append(f"parallel: {len(results)} jobs, {failed} failed in "
+                         f"{time.perf_counter() - started:.2f}s\n")
+            stderr.write(to_bytes("".join(lines)))
+        return min(failed, MAX_FAILURES)
+
+    def _read_items(self, stdin) -> Iterator[str]:
+        """Yield the non-empty lines of stdin as they arrive"""
+        for chunk in read_lines(STDIN, stdin):
+            for line in chunk.split(b"\n"):
+                if line:
+                    yield line.decode(errors=TEXT_ERRORS)
+
+    def _run_job(self, template: List[Token], item: str):
+        """Run the template for one input, returns (item, exit_code, seconds, stdout, stderr)"""
+        tokens = []
+        substituted = False
+        for token in template:
+            if token.type in (WORD, COMMAND) and PLACEHOLDER in token.value:
+                token = Token(token.type, token.value.replace(PLACEHOLDER, item), token.position)
+                substituted = True
+            tokens.append(token)
+        if not substituted:
+            tokens.append(Token(WORD, item, len(tokens)))
+
+        started = time.perf_counter()
+        pipeline = self.processor.start_plan(self.planner.expand(self.planner.plan_pipeline(tokens)))
+        pipeline.wait()
+        # The status isn't recorded as the shell's pipe status, jobs run at once
+        exit_code = self.processor.status(pipeline)
+        return item, exit_code, time.perf_counter() - started, pipeline.stdout, pipeline.stderr
+
+    def _write_done(self, pending: deque, keep_order: bool, results: list, stdout, stderr):
+        """Wait for the next job, or for any with keep_order off, and write out its output"""
+        if keep_order:
+            done = [pending.popleft()]
+        else:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+
+        for future in done:
+            item, exit_code, seconds, job_stdout, job_stderr = future.result()
+            results.append((item, exit_code, seconds))
+            try:
+                job_stderr.copy_to(stderr)
+                if job_stdout:
+                    job_stdout.copy_to(stdout)
+                    stdout.flush()
+            finally:
+                job_stdout.close()
+                job_stderr.close()
+
+    def get_help(self) -> str:
+        return "Run a command for every input, several at a time."
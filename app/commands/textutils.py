@@ -0,0 +1,682 @@
+"""
+Native stand-ins for the text utilities pipelines use the most
+
+They run in-process, so a short pipeline like `cat f | grep x | wc -l`
+doesn't pay for a fork and exec per stage. Each one handles the common
+flags the way GNU coreutils and grep do; for any other flag supports()
+returns False and the real utility runs instead, as with `command NAME`.
+"""
+
+import errno
+import locale
+import mmap
+import os
+import re
+import stat
+from typing import Iterator, List
+from app.commands.base import TEXT_ERRORS, StreamCommand, check_cancelled
+from app.lexical.token import Token
+
+# Size of the reads from pipes and of the slices taken out of mapped files
+CHUNK_SIZE = 64 * 1024
+MAP_CHUNK_SIZE = 1024 * 1024
+
+# Most bytes moved by one sendfile or splice call
+SEND_SIZE = 4 * 1024 * 1024
+
+# splice moves data out of pipes in the kernel, on Linux only
+HAS_SPLICE = hasattr(os, "splice")
+
+# Errors of a first sendfile or splice meaning the kernel can't do it for
+# these descriptors, the data is then copied the usual way
+UNSUPPORTED_SEND = (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF)
+
+# Operand that stands for standard input
+STDIN = "-"
+
+# Parts of a grep pattern that POSIX and Python regular expressions read
+# differently: backslashes other than escaped punctuation, and character
+# classes like [:alpha:]. Such patterns are left to grep itself.
+UNPORTABLE_PATTERN = re.compile(r"\\[^.\[\]*^$\\/]|\\$|\[[:.=]")
+
+
+def map_file(file):
+    """Map a regular file into memory, or get None when it can't be mapped"""
+    info = os.fstat(file.fileno())
+    if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+        # Pipes, devices and files like those in /proc have to be read
+        return None
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_chunks(name: str, stdin) -> Iterator[bytes]:
+    """
+    Yield the content of an input operand in chunks
+
+    Regular files are mapped instead of read. Errors opening the file are
+    raised by the first next() as OSError.
+    """
+    if name == STDIN:
+        yield from file_reads(stdin)
+        return
+
+    with open(name, "rb") as file:
+        yield from file_chunks(file)
+
+
+def file_chunks(file) -> Iterator[bytes]:
+    """Yield the content of an open file in chunks, mapping it if it is regular"""
+    mapped = map_file(file)
+    if mapped is None:
+        yield from file_reads(file)
+        return
+
+    with mapped:
+        for start in range(0, len(mapped), MAP_CHUNK_SIZE):
+            check_cancelled()
+            yield mapped[start:start + MAP_CHUNK_SIZE]
+
+
+def file_reads(file) -> Iterator[bytes]:
+    """Yield reads of a file until its end, or until the pipeline is cancelled"""
+    while True:
+        check_cancelled()
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def send_file(file, stdout) -> bool:
+    """
+    Move the rest of an open file to stdout without it going through Python
+
+    Regular files are sent with sendfile, pipes spliced, both straight into
+    the descriptor under stdout. Anything else, and output that isn't a
+    file with a descriptor, is left to the caller to copy.
+
+    Returns:
+        bool: whether the file was sent; False means nothing was moved
+    """
+    try:
+        in_fd, out_fd = file.fileno(), stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        return False
+
+    mode = os.fstat(in_fd).st_mode
+    if stat.S_ISREG(mode):
+        move = lambda: os.sendfile(out_fd, in_fd, None, SEND_SIZE)
+    elif stat.S_ISFIFO(mode) and HAS_SPLICE:
+        move = lambda: os.splice(in_fd, out_fd, SEND_SIZE)
+    else:
+        return False
+
+    stdout.flush()
+    # Traced streams count the bytes that go through them
+    counters = [getattr(stream, "raw", stream) for stream in (file, stdout)]
+    counters = [counter for counter in counters if hasattr(counter, "transferred")]
+    first = True
+    while True:
+        check_cancelled()
+        try:
+            moved = move()
+        except OSError as e:
+            if first and e.errno in UNSUPPORTED_SEND:
+                return False
+            raise
+        first = False
+        if not moved:
+            return True
+        for counter in counters:
+            counter.transferred += moved
+
+
+def read_lines(name: str, stdin) -> Iterator[bytes]:
+    """Like read_chunks, but every chunk ends with a newline except maybe the last"""
+    rest = b""
+    for chunk in read_chunks(name, stdin):
+        end = chunk.rfind(b"\n") + 1
+        if not end:
+            rest += chunk
+            continue
+        yield rest + chunk[:end]
+        rest = chunk[end:]
+    if rest:
+        yield rest
+
+
+def display_name(name: str) -> str:
+    """Name of an operand in headers of head and tail"""
+    return "standard input" if name == STDIN else name
+
+
+def parse_count(args: List[Token]):
+    """
+    Parse the arguments of head and tail
+
+    Returns:
+        tuple: (mode, count, names) with mode "n" for lines or "c" for
+        bytes, or None if a flag isn't supported
+    """
+    mode, count, names = "n", 10, []
+    values = iter(arg.value for arg in args)
+    for index, value in enumerate(values):
+        if value == "--":
+            names.extend(values)
+            break
+        if value == STDIN or not value.startswith("-"):
+            names.append(value)
+            continue
+
+        if value in ("-n", "-c"):
+            number = next(values, None)
+        elif value[1] in "nc":
+            number = value[2:]
+        elif index == 0:
+            # -5 is the same as -n 5, but only as the first argument
+            number = value[1:]
+            value = "-n"
+        else:
+            return None
+
+        # Negative counts, +N and size suffixes are left to the utility
+        if number is None or not number.isdigit():
+            return None
+        mode, count = value[1], int(number)
+
+    return mode, count, names or [STDIN]
+
+
+class TextUtility(StreamCommand):
+    """Stream command standing in for an external utility"""
+    native = True
+
+    # Name the utility reports its errors with
+    name = ""
+
+    def supports(self, args: List[Token]) -> bool:
+        """Whether run() handles these arguments; if not the external utility runs instead"""
+        return True
+
+    def error(self, stderr, message: str):
+        stderr.write(f"{self.name}: {message}\n".encode(errors=TEXT_ERRORS))
+
+    def header(self, stdout, name: str, first: bool):
+        """Write the ==> name <== header put before each file when several are given"""
+        separator = "" if first else "\n"
+        stdout.write(f"{separator}==> {display_name(name)} <==\n".encode(errors=TEXT_ERRORS))
+
+    def open_error(self, stderr, name: str, error: OSError):
+        """Report a file head or tail couldn't read, the way they word it"""
+        if isinstance(error, IsADirectoryError):
+            self.error(stderr, f"error reading '{name}': {error.strerror}")
+        else:
+            self.error(stderr, f"cannot open '{name}' for reading: {error.strerror}")
+
+
+class CatCommand(TextUtility):
+    name = "cat"
+
+    def supports(self, args) -> bool:
+        return all(arg.value == STDIN or not arg.value.startswith("-") for arg in args)
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        status = 0
+        for name in [arg.value for arg in args] or [STDIN]:
+            try:
+                if name == STDIN:
+                    self.copy(stdin, stdout, mapped=False)
+                else:
+                    with open(name, "rb") as file:
+                        self.copy(file, stdout)
+            except BrokenPipeError:
+                raise
+            except OSError as e:
+                self.error(stderr, f"{name}: {e.strerror}")
+                status = 1
+        return status
+
+    def copy(self, file, stdout, mapped: bool = True):
+        """Copy a file to stdout, in the kernel when it can be"""
+        if send_file(file, stdout):
+            return
+        chunks = file_chunks(file) if mapped else file_reads(file)
+        for chunk in chunks:
+            stdout.write(chunk)
+            # Pass data on as it comes, like cat's unbuffered writes
+            stdout.flush()
+
+    def get_help(self) -> str:
+        return "Concatenate files to standard output."
+
+
+class HeadCommand(TextUtility):
+    name = "head"
+
+    def supports(self, args) -> bool:
+        return parse_count(args) is not None
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        mode, count, names = parse_count(args)
+        status = 0
+        first = True
+        for name in names:
+            chunks = read_chunks(name, stdin)
+            try:
+                # Open the file before writing its header
+                chunk = next(chunks, b"")
+            except BrokenPipeError:
+                raise
+            except OSError as e:
+                self.open_error(stderr, name, e)
+                status = 1
+                continue
+
+            if len(names) > 1:
+                self.header(stdout, name, first)
+                first = False
+
+            try:
+                self._head(chunk, chunks, mode, count, stdout)
+            except BrokenPipeError:
+                raise
+            except OSError as e:
+                self.open_error(stderr, name, e)
+                status = 1
+            finally:
+                chunks.close()
+        return status
+
+    def _head(self, chunk: bytes, chunks: Iterator[bytes], mode: str, count: int, stdout):
+        """Write the first count lines or bytes, reading no further than needed"""
+        remaining = count
+        while chunk and remaining > 0:
+            if mode == "c":
+                stdout.write(chunk[:remaining])
+                remaining -= len(chunk)
+            else:
+                newlines = chunk.count(b"\n")
+                if newlines < remaining:
+                    stdout.write(chunk)
+                    remaining -= newlines
+                else:
+                    end = -1
+                    for _ in range(remaining):
+                        end = chunk.find(b"\n", end + 1)
+                    stdout.write(chunk[:end + 1])
+                    return
+            chunk = next(chunks, b"")
+
+    def get_help(self) -> str:
+        return "Output the first part of files."
+
+
+class TailCommand(TextUtility):
+    name = "tail"
+
+    def supports(self, args) -> bool:
+        parsed = parse_count(args)
+        if parsed is None:
+            return False
+        # tail only takes -5 when it reads a single input
+        return not (args[0].value[1:].isdigit() and len(parsed[2]) > 1)
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        mode, count, names = parse_count(args)
+        if count == 0:
+            # Like tail, don't even open the files
+            return 0
+
+        status = 0
+        first = True
+        for name in names:
+            try:
+                file = stdin if name == STDIN else open(name, "rb")
+            except OSError as e:
+                self.open_error(stderr, name, e)
+                status = 1
+                continue
+
+            if len(names) > 1:
+                self.header(stdout, name, first)
+                first = False
+
+            try:
+                self._tail(file, mode, count, stdout)
+            except BrokenPipeError:
+                raise
+            except OSError as e:
+                self.open_error(stderr, name, e)
+                status = 1
+            finally:
+                if file is not stdin:
+                    file.close()
+        return status
+
+    def _tail(self, file, mode: str, count: int, stdout):
+        """Write the last count lines or bytes of a file"""
+        mapped = map_file(file)
+        if mapped is not None:
+            # Only the end of a mapped file is ever touched
+            with mapped:
+                for start in range(self._start(mapped, mode, count), len(mapped), MAP_CHUNK_SIZE):
+                    stdout.write(mapped[start:start + MAP_CHUNK_SIZE])
+            return
+
+        # Keep a window that is trimmed to the tail whenever it grows too big
+        window = bytearray()
+        limit = MAP_CHUNK_SIZE
+        for chunk in file_reads(file):
+            window += chunk
+            if len(window) > limit:
+                del window[:self._start(window, mode, count)]
+                limit = max(MAP_CHUNK_SIZE, 2 * len(window))
+        stdout.write(window[self._start(window, mode, count):])
+
+    def _start(self, data, mode: str, count: int) -> int:
+        """Offset of the last count lines or bytes of data"""
+        if mode == "c":
+            return max(len(data) - count, 0)
+        if count == 0:
+            return len(data)
+
+        end = len(data)
+        if end and data[end - 1] == ord("\n"):
+            # The newline ending the last line doesn't start a new one
+            end -= 1
+        for _ in range(count):
+            end = data.rfind(b"\n", 0, end)
+            if end < 0:
+                return 0
+        return end + 1
+
+    def get_help(self) -> str:
+        return "Output the last part of files."
+
+
+class WcCommand(TextUtility):
+    name = "wc"
+
+    # Counters in the order wc prints them
+    FLAGS = "lwc"
+
+    def supports(self, args) -> bool:
+        # A lone - is stdin, an empty set of flags
+        return all(not arg.value.startswith("-") or set(arg.value[1:]) <= set(self.FLAGS) for arg in args)
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        flags = set()
+        names = []
+        for arg in args:
+            if arg.value != STDIN and arg.value.startswith("-"):
+                flags.update(arg.value[1:])
+            else:
+                names.append(arg.value)
+        selected = [flag for flag in self.FLAGS if flag in flags] or list(self.FLAGS)
+
+        status = 0
+        width = self._width(names, len(selected), stdin)
+        totals = dict.fromkeys(self.FLAGS, 0)
+
+        for name in names or [STDIN]:
+            try:
+                counts = self._count(read_chunks(name, stdin))
+            except BrokenPipeError:
+                raise
+            except IsADirectoryError as e:
+                # wc still reports a line of zeros for a directory
+                self.error(stderr, f"{name}: {e.strerror}")
+                counts = dict.fromkeys(self.FLAGS, 0)
+                status = 1
+            except OSError as e:
+                self.error(stderr, f"{name}: {e.strerror}")
+                status = 1
+                continue
+
+            for flag in self.FLAGS:
+                totals[flag] += counts[flag]
+            self._print(stdout, counts, selected, width, name if names else None)
+
+        if len(names) > 1:
+            self._print(stdout, totals, selected, width, "total")
+        return status
+
+    def _count(self, chunks: Iterator[bytes]) -> dict:
+        lines = words = size = 0
+        # Whether the previous chunk ended in the middle of a word
+        in_word = False
+        for chunk in chunks:
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+            words += len(chunk.split())
+            if in_word and not chunk[:1].isspace():
+                words -= 1
+            in_word = not chunk[-1:].isspace()
+        return {"l": lines, "w": words, "c": size}
+
+    def _width(self, names: List[str], counters: int, stdin) -> int:
+        """Column width, sized from the total size of the inputs like GNU wc"""
+        if len(names) <= 1 and counters == 1:
+            return 1
+
+        infos = []
+        for name in names or [STDIN]:
+            try:
+                infos.append(os.fstat(stdin.fileno()) if name == STDIN else os.stat(name))
+            except (OSError, ValueError):
+                infos.append(None)
+
+        # Inputs that can't be stat'ed are left out, like wc leaves them out of its output
+        minimum = 1
+        total = 0
+        for info in infos:
+            if info is None:
+                continue
+            if stat.S_ISREG(info.st_mode):
+                total += info.st_size
+            else:
+                minimum = 7
+        return max(len(str(total)), minimum)
+
+    def _print(self, stdout, counts: dict, selected: List[str], width: int, name):
+        line = " ".join(f"{counts[flag]:>{width}}" for flag in selected)
+        if name is not None:
+            line += f" {name}"
+        stdout.write(f"{line}\n".encode(errors=TEXT_ERRORS))
+
+    def get_help(self) -> str:
+        return "Print newline, word, and byte counts."
+
+
+class GrepCommand(TextUtility):
+    name = "grep"
+
+    FLAGS = set("ivcnlqFEwxhHs")
+
+    def supports(self, args) -> bool:
+        return self._parse(args) is not None
+
+    def _parse(self, args):
+        """
+        Get (flags, regex, names) out of the arguments
+
+        Returns None for flags that aren't handled, and for patterns whose
+        meaning differs between POSIX and Python regular expressions.
+        """
+        flags = set()
+        operands = []
+        values = iter(arg.value for arg in args)
+        for value in values:
+            if value == "--":
+                operands.extend(values)
+                break
+            if value == STDIN or not value.startswith("-"):
+                operands.append(value)
+            elif set(value[1:]) <= self.FLAGS:
+                flags.update(value[1:])
+            else:
+                return None
+
+        if not operands:
+            return None
+        regex = self._compile(operands[0], flags)
+        if regex is None:
+            return None
+        return flags, regex, operands[1:]
+
+    def _compile(self, pattern: str, flags: set):
+        if "F" in flags:
+            source = re.escape(pattern)
+        elif UNPORTABLE_PATTERN.search(pattern) or ("[" in pattern and "\\" in pattern):
+            # Backslash sequences and bracket classes mean different things
+            return None
+        elif "E" in flags:
+            source = pattern
+        else:
+            # In basic regular expressions these are ordinary characters
+            source = re.sub(r"[+?(){}|]", r"\\\g<0>", pattern)
+
+        if "w" in flags:
+            source = rf"(?<!\w)(?:{source})(?!\w)"
+
+        # Match characters the way grep does in the current locale
+        if "utf" not in locale.setlocale(locale.LC_CTYPE).lower():
+            source = source.encode(errors=TEXT_ERRORS)
+
+        try:
+            return re.compile(source, re.IGNORECASE if "i" in flags else 0)
+        except re.error:
+            # Left to grep to report, or to accept
+            return None
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        flags, regex, names = self._parse(args)
+        show_names = (len(names) > 1 or "H" in flags) and "h" not in flags
+
+        selected = False
+        error = False
+        for name in names or [STDIN]:
+            try:
+                count = self._grep(regex, flags, name, show_names, stdin, stdout, stderr)
+            except BrokenPipeError:
+                raise
+            except OSError as e:
+                if "s" not in flags:
+                    self.error(stderr, f"{name}: {e.strerror}")
+                error = True
+                continue
+
+            if count:
+                selected = True
+                if "q" in flags:
+                    # Any selected line settles it, even with errors
+                    return 0
+
+        if error:
+            return 2
+        return 0 if selected else 1
+
+    def _grep(self, regex, flags: set, name: str, show_names: bool, stdin, stdout, stderr) -> int:
+        """
+        Search one input
+
+        Returns:
+            int: number of selected lines, counting stops early when only
+            whether a line was selected matters
+        """
+        label = "(standard input)" if name == STDIN else name
+        text = isinstance(regex.pattern, str)
+        invert = "v" in flags
+        numbers = "n" in flags
+        quiet = "q" in flags or "l" in flags
+        counting = "c" in flags
+        match = regex.fullmatch if "x" in flags else regex.search
+
+        label_prefix = f"{label}:" if show_names else ""
+        prefix = label_prefix if text else label_prefix.encode(errors=TEXT_ERRORS)
+        newline = "\n" if text else b"\n"
+
+        # A line may match anywhere in a chunk only if the chunk matches
+        prefilter = None if invert else re.compile(regex.pattern, regex.flags | re.MULTILINE)
+
+        count = 0
+        line_number = 0
+        binary = False
+        for chunk in read_lines(name, stdin):
+            binary = binary or b"\0" in chunk
+            data = chunk.decode(errors=TEXT_ERRORS) if text else chunk
+            lines = data.split(newline)
+            if not lines[-1]:
+                # The chunk ended with a newline
+                lines.pop()
+
+            if prefilter is not None and not prefilter.search(data):
+                line_number += len(lines)
+                continue
+
+            output = []
+            for line in lines:
+                line_number += 1
+                if (match(line) is not None) != invert:
+                    count += 1
+                    if quiet:
+                        break
+                    if counting:
+                        continue
+                    if binary:
+                        self.error(stderr, f"{label}: binary file matches")
+                        return count
+                    line_prefix = prefix
+                    if numbers:
+                        line_prefix += f"{line_number}:" if text else f"{line_number}:".encode()
+                    output.append(line_prefix + line)
+
+            if output:
+                output.append("" if text else b"")
+                output = newline.join(output)
+                stdout.write(output.encode(errors=TEXT_ERRORS) if text else output)
+            if quiet and count:
+                break
+
+        if "l" in flags and count:
+            stdout.write(f"{label}\n".encode(errors=TEXT_ERRORS))
+        elif counting and "q" not in flags:
+            stdout.write(f"{label_prefix}{count}\n".encode(errors=TEXT_ERRORS))
+        return count
+
+    def get_help(self) -> str:
+        return "Print lines that match a pattern."
+
+
+class TeeCommand(TextUtility):
+    name = "tee"
+
+    def supports(self, args) -> bool:
+        return all(arg.value == "-a" or not arg.value.startswith("-") for arg in args)
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        mode = "ab" if any(arg.value == "-a" for arg in args) else "wb"
+        status = 0
+        files = []
+        for arg in args:
+            if arg.value == "-a":
+                continue
+            try:
+                files.append(open(arg.value, mode, buffering=0))
+            except OSError as e:
+                self.error(stderr, f"{arg.value}: {e.strerror}")
+                status = 1
+
+        try:
+            for chunk in read_chunks(STDIN, stdin):
+                stdout.write(chunk)
+                stdout.flush()
+                for file in files:
+                    file.write(chunk)
+        finally:
+            for file in files:
+                file.close()
+        return status
+
+    def get_help(self) -> str:
+        return "Copy standard input to each file, and also to standard output."
@@ -0,0 +1,161 @@
+"""
+Timing of pipelines: reports for the time keyword and the bench built-in
+"""
+
+import math
+import os
+from typing import List
+from app.commands.base import StreamCommand, to_bytes
+from app.lexical import MyLex
+
+BENCH_RUNS = 10
+BENCH_WARMUP = 1
+
+BENCH_USAGE = "bench: usage: bench [-n runs] [-w warmup] [-i] command [arg ...]\n"
+
+
+def format_clock(seconds: float) -> str:
+    """Seconds the way bash's time prints them, like 0m1.250s"""
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes)}m{seconds:.3f}s"
+
+
+def format_duration(seconds: float) -> str:
+    """Seconds in the unit that suits them best"""
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds:.3f} s"
+
+
+def time_report(pipeline) -> str:
+    """
+    What the time keyword prints once a pipeline is over
+
+    The real, user and sys lines of bash, then the peak memory of the
+    largest stage. Pipelines of several stages get a line per stage too.
+    The peak of an external command counts the shell memory it was forked
+    from, the kernel carries it over exec.
+    """
+    usage = pipeline.usage
+    lines = [
+        "",
+        f"real\t{format_clock(usage.real)}",
+        f"user\t{format_clock(usage.user)}",
+        f"sys\t{format_clock(usage.sys)}",
+        f"maxrss\t{usage.max_rss} KB",
+    ]
+    if len(pipeline.stages) > 1:
+        lines.append(f"{'real':>10} {'user':>10} {'sys':>10} {'maxrss':>10}  stage")
+        for stage in pipeline.stages:
+            stage_usage = stage.usage
+            command = " ".join([stage.command_name] + [arg.value for arg in stage.args])
+            lines.append(
+                f"{stage_usage.real:>9.3f}s {stage_usage.user:>9.3f}s {stage_usage.sys:>9.3f}s "
+                f"{stage_usage.max_rss:>7} KB  {command}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of samples"""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class BenchCommand(StreamCommand):
+    """
+    Run a pipeline many times and report statistics on how long it took
+
+    A few warmup runs go first and are left out. Output of the runs is
+    discarded. Like for parallel, a command given as a single word is
+    tokenized like a command line, so it can hold pipes and redirects.
+    """
+    reads_stdin = False
+
+    def __init__(self, planner, processor):
+        """
+        Args:
+            planner: Planner of the shell, plans the benchmarked pipeline
+            processor: PipeProcessor running it
+        """
+        self.planner = planner
+        self.processor = processor
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        values = [arg.value for arg in args]
+        runs, warmup = BENCH_RUNS, BENCH_WARMUP
+        ignore_failures = False
+
+        i = 0
+        while i < len(values) and values[i].startswith("-"):
+            option = values[i]
+            i += 1
+            if option == "--":
+                break
+            if option == "-i":
+                ignore_failures = True
+            elif option in ("-n", "-w"):
+                if i == len(values) or not values[i].isdigit():
+                    stderr.write(to_bytes(BENCH_USAGE))
+                    return 2
+                count, i = int(values[i]), i + 1
+                if option == "-n":
+                    runs = count
+                else:
+                    warmup = count
+            else:
+                stderr.write(to_bytes(f"bench: {option}: invalid option\n{BENCH_USAGE}"))
+                return 2
+
+        tokens = list(args[i:])
+        if not tokens or runs < 1:
+            stderr.write(to_bytes(BENCH_USAGE))
+            return 2
+        if len(tokens) == 1:
+            tokens = MyLex(tokens[0].value).parse()
+        try:
+            plan = self.planner.expand(self.planner.plan_pipeline(tokens))
+        except ValueError as e:
+            stderr.write(to_bytes(f"bench: {e}\n"))
+            return 2
+
+        # Imported here, the time keyword shares this module and needs none of it
+        import statistics
+
+        usages = []
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        try:
+            for run in range(warmup + runs):
+                pipeline = self.processor.start_plan(plan, devnull, devnull)
+                pipeline.wait()
+                exit_code = self.processor.status(pipeline)
+                if exit_code != 0 and not ignore_failures:
+                    stderr.write(to_bytes(f"bench: command failed with exit code {exit_code}, "
+                                          f"use -i to ignore failures\n"))
+                    return 1
+                if run >= warmup:
+                    usages.append(pipeline.usage)
+        finally:
+            os.close(devnull)
+
+        times = [usage.real for usage in usages]
+        mean = statistics.fmean(times)
+        stddev = statistics.stdev(times) if len(times) > 1 else 0.0
+        user = statistics.fmean(usage.user for usage in usages)
+        sys = statistics.fmean(usage.sys for usage in usages)
+
+        stdout.write(to_bytes(
+            f"bench: {' '.join(token.value for token in tokens)}\n"
+            f"  mean    {format_duration(mean):>10} ± {format_duration(stddev):<10}"
+            f"  user {format_duration(user)}, sys {format_duration(sys)}\n"
+            f"  median  {format_duration(statistics.median(times)):>10}\n"
+            f"  p95     {format_duration(percentile(times, 0.95)):>10}\n"
+            f"  range   {format_duration(min(times)):>10} … {format_duration(max(times)):<10}"
+            f"  {len(times)} runs\n"
+        ))
+        return 0
+
+    def get_help(self) -> str:
+        return "Run a command many times and report how long it takes."
@@ -0,0 +1,297 @@
+"""
+Tab completion of command names and paths
+
+The first word of a command completes from the built-ins and the
+executables of PATH, later words from the filesystem. Both come from
+listings kept in memory and read again only once the mtime of their
+directory changes, so Tab in a directory of 100k entries costs a stat and
+a bisect rather than a listing. The executables of PATH are indexed by a
+background thread, first when completion is set up and then whenever a
+PATH directory changes, so Tab completes from the last index meanwhile
+and only waits on it when there is none yet.
+"""
+
+import bisect
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Characters readline splits words on, "/" isn't one so paths stay whole
+COMPLETER_DELIMS = " \t\n;|&<>"
+
+# Characters escaped with a backslash in what is inserted, for the lexer
+SPECIAL = re.compile(r"""([ \t'"\\|<>&;])""")
+ESCAPED = re.compile(r"\\(.)")
+
+# Text before the word being completed when it is the first of a command
+COMMAND_POSITION = re.compile(r"(?:^|&&|\|\||[|;&])\s*$")
+
+# Directory listings kept at most
+DIRECTORY_CACHE_SIZE = 64
+
+# A directory changed less than this many seconds before it was listed may
+# change again without its mtime moving, its listing is read again next time
+RACY_SECONDS = 1.0
+
+# Seconds the first Tab waits for the PATH index, if there is none yet
+FIRST_INDEX_WAIT = 0.5
+
+# Greater than any character, for the end of a prefix range of sorted names
+MAX_CHAR = "\U0010ffff"
+
+
+class Listing(NamedTuple):
+    """Names in a directory, sorted, and which of them are directories"""
+    mtime_ns: int
+    names: List[str]
+    directories: frozenset
+    # Whether the listing can be trusted while the mtime doesn't change
+    stable: bool
+
+
+def with_prefix(names: List[str], prefix: str) -> List[str]:
+    """Names of a sorted list starting with prefix"""
+    start = bisect.bisect_left(names, prefix)
+    return names[start:bisect.bisect_left(names, prefix + MAX_CHAR, start)]
+
+
+def escape(text: str) -> str:
+    return SPECIAL.sub(r"\\\1", text)
+
+
+def unescape(text: str) -> str:
+    return ESCAPED.sub(r"\1", text)
+
+
+def word_start(line: str, end: int) -> int:
+    """Where the word ending at end starts, a delimiter escaped with a backslash being part of it"""
+    start = 0
+    i = 0
+    while i < end:
+        if line[i] == "\\":
+            i += 1
+        elif line[i] in COMPLETER_DELIMS:
+            start = i + 1
+        i += 1
+    return start
+
+
+def mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class DirectoryCache:
+    """Listings of the directories completed in, least recently used dropped first"""
+
+    def __init__(self, size: int = DIRECTORY_CACHE_SIZE):
+        self.size = size
+        self.listings: "OrderedDict[str, Listing]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def listing(self, directory: str) -> Optional[Listing]:
+        """Listing of a directory, None if it can't be read"""
+        directory = os.path.abspath(directory)
+        mtime = mtime_ns(directory)
+        if mtime is None:
+            self.listings.pop(directory, None)
+            return None
+        listing = self.listings.get(directory)
+        if listing is not None and listing.mtime_ns == mtime and listing.stable:
+            self.hits += 1
+            self.listings.move_to_end(directory)
+            return listing
+
+        self.misses += 1
+        listing = self._read(directory, mtime)
+        if listing is not None:
+            self.listings[directory] = listing
+            self.listings.move_to_end(directory)
+            if len(self.listings) > self.size:
+                self.listings.popitem(last=False)
+        return listing
+
+    def _read(self, directory: str, mtime: int) -> Optional[Listing]:
+        names, directories = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    names.append(entry.name)
+                    try:
+                        if entry.is_dir():
+                            directories.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        names.sort()
+        stable = mtime_ns(directory) == mtime and time.time_ns() - mtime > RACY_SECONDS * 1e9
+        return Listing(mtime, names, frozenset(directories), stable)
+
+
+class ExecutableIndex:
+    """
+    Names of the executables in the directories of PATH, sorted
+
+    refresh() stats every PATH directory and, when PATH or one of their
+    mtimes changed since the last index, indexes again in a background
+    thread, listing only the directories that changed.
+    """
+
+    def __init__(self):
+        # Directory -> (mtime, names of its executables)
+        self.directories: Dict[str, Tuple[int, List[str]]] = {}
+        self.names: List[str] = []
+        self.path = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Index PATH in the background"""
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Start indexing again if PATH changed
+
+        Returns:
+            bool: whether the index is up to date, and not being built
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            path = os.environ.get("PATH", "")
+            if path == self.path and all(
+                mtime_ns(directory) == mtime for directory, (mtime, _) in self.directories.items()
+            ):
+                return True
+            self.thread = threading.Thread(target=self.build, args=(path,), name="path-index", daemon=True)
+            self.thread.start()
+            return False
+
+    def wait(self, timeout: float = None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def build(self, path: str):
+        """Index the executables of a PATH, listing the directories that changed"""
+        directories = {}
+        for directory in filter(None, path.split(os.pathsep)):
+            if directory in directories:
+                continue
+            mtime = mtime_ns(directory)
+            if mtime is None:
+                continue
+            known = self.directories.get(directory)
+            if known is not None and known[0] == mtime:
+                directories[directory] = known
+            else:
+                directories[directory] = (mtime, self._executables(directory))
+
+        names = sorted({name for _, executables in directories.values() for name in executables})
+        # Swapped in once built, completion uses the previous index until then
+        self.directories, self.names, self.path = directories, names, path
+
+    @staticmethod
+    def _executables(directory: str) -> List[str]:
+        names = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and os.access(entry.path, os.X_OK):
+                            names.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return names
+
+    def complete(self, prefix: str) -> List[str]:
+        """Executables starting with prefix, from the index as it is"""
+        if not self.refresh() and self.path is None:
+            # No index at all yet, it is usually a moment away
+            self.wait(FIRST_INDEX_WAIT)
+        return with_prefix(self.names, prefix)
+
+
+class Completer:
+    """
+    readline completer for the shell
+
+    Candidates are computed once per Tab, when readline asks for the first
+    one, and handed out one by one from then on.
+    """
+
+    def __init__(self, builtins: Callable[[], Iterable[str]], executables: ExecutableIndex = None,
+                 directories: DirectoryCache = None):
+        """
+        Args:
+            builtins: names of the built-in commands
+            executables: index of PATH, a new one by default
+            directories: cache of the listings, a new one by default
+        """
+        self.builtins = builtins
+        self.executables = executables or ExecutableIndex()
+        self.directories = directories or DirectoryCache()
+        self.candidates = []
+
+    def complete(self, text: str, state: int) -> Optional[str]:
+        """The completer readline calls, with state 0, 1, ... until it gets None"""
+        if state == 0:
+            import readline
+            line, end = readline.get_line_buffer(), readline.get_endidx()
+            # readline splits words on escaped spaces too, complete the whole
+            # word and hand back only the part after where readline split it
+            start = word_start(line, end)
+            cut = readline.get_begidx() - start
+            try:
+                self.candidates = [match[cut:] for match in self.matches(line[:start], line[start:end])]
+            except Exception:
+                # An exception would be swallowed by readline anyway
+                self.candidates = []
+        return self.candidates[state] if state < len(self.candidates) else None
+
+    def matches(self, before: str, text: str) -> List[str]:
+        """
+        Completions of the word text, given the line before it
+
+        A command name or a file completed for good ends with a space,
+        a directory with a slash, so completion carries on into it.
+        """
+        if COMMAND_POSITION.search(before) and "/" not in text:
+            names = sorted(set(with_prefix(sorted(self.builtins()), text)).union(self.executables.complete(text)))
+            return [name + " " for name in names] if len(names) == 1 else names
+        return self.paths(text, commands=bool(COMMAND_POSITION.search(before)))
+
+    def paths(self, text: str, commands: bool = False) -> List[str]:
+        """Paths starting with text, only directories and executables for commands"""
+        head, _, prefix = text.rpartition("/")
+        if "/" in text:
+            head += "/"
+        directory = os.path.expanduser(unescape(head))
+        listing = self.directories.listing(directory or ".")
+        if listing is None:
+            return []
+        prefix = unescape(prefix)
+
+        names = with_prefix(listing.names, prefix)
+        if not prefix.startswith("."):
+            names = [name for name in names if not name.startswith(".")]
+        if commands:
+            names = [name for name in names if name in listing.directories or os.access(os.path.join(directory, name), os.X_OK)]
+        # Only the few names with special characters go through escape()
+        directories, special = listing.directories, SPECIAL.search
+        results = [
+            head + (escape(name) if special(name) else name) + ("/" if name in directories else "") for name in names
+        ]
+        if len(results) == 1 and not results[0].endswith("/"):
+            results[0] += " "
+        return results
@@ -0,0 +1,341 @@
+"""
+Pathname expansion of the words of a command
+
+A word with an unquoted *, ? or [...] is a pattern, which the lexer keeps
+next to the word's value with the quoted and escaped characters escaped,
+so "*.log" and \\*.log stay literal. Every time its pipeline runs, the
+word is replaced by the paths it matches, sorted, or kept as it is when
+nothing matches, like bash without nullglob. Bracket expressions take
+POSIX classes like [:alpha:], as in the C locale. Names starting with a
+dot are only matched by a pattern starting with one. ** as a whole path
+component matches any number of directories, without following symbolic
+links, and as the last component every path under them.
+
+Path components are compiled once, and kept across lines. Directories are
+listed with os.scandir and their listings kept until the next line, used
+again as long as the directory mtime holds, so the same directory is
+listed once however many patterns of the line go through it.
+"""
+
+import bisect
+import functools
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.lexical.token import Token, TokenType
+
+GLOB_CHARS = re.compile(r"[*?[]")
+
+# Compiled path components kept
+COMPILED_SEGMENTS = 512
+
+# Greater than any character, for the end of a prefix range of sorted names
+MAX_CHAR = "\U0010ffff"
+
+# Members of the POSIX character classes, in the C locale, as regex set members
+POSIX_CLASSES = {
+    "alnum": "0-9A-Za-z",
+    "alpha": "A-Za-z",
+    "blank": " \\t",
+    "cntrl": "\\x00-\\x1f\\x7f",
+    "digit": "0-9",
+    "graph": "!-~",
+    "lower": "a-z",
+    "print": " -~",
+    "punct": "!-/:-@\\[-`{-~",
+    "space": " \\t\\n\\r\\f\\v",
+    "upper": "A-Z",
+    "xdigit": "0-9A-Fa-f",
+}
+POSIX_CLASS = re.compile(r"\[:(\w*):\]")
+
+WORD = TokenType.WORD
+
+# Redirects whose target is the next word, which is never expanded
+REDIRECT_TARGETS = frozenset((
+    TokenType.REDIRECT_OUT, TokenType.REDIRECT_APPEND, TokenType.REDIRECT_STDOUT,
+    TokenType.REDIRECT_STDOUT_APPEND, TokenType.REDIRECT_STDERR, TokenType.REDIRECT_STDERR_APPEND,
+    TokenType.REDIRECT_IN,
+))
+
+
+def escape(text: str) -> str:
+    """Text as a pattern matching it literally"""
+    return GLOB_CHARS.sub(r"[\g<0>]", text)
+
+
+class Segment(NamedTuple):
+    """A compiled path component of a pattern"""
+    # The name itself, when the component has no wildcard
+    literal: Optional[str] = None
+    # Literal start of the names matched, found by bisecting a listing
+    prefix: str = ""
+    # Literal end of the names matched, when the rest is a single *
+    suffix: Optional[str] = None
+    # Full match of a name, when neither of the above is enough
+    regex: Optional["re.Pattern"] = None
+    # Whether names starting with a dot can match
+    hidden: bool = False
+
+
+def _parts(segment: str) -> List[Tuple[str, str]]:
+    """(kind, text) pieces of a path component: literal, *, ? or a bracket class"""
+    parts = []
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        if char in "*?":
+            parts.append((char, char))
+            i += 1
+            continue
+        if char == "[":
+            end = _bracket_end(segment, i)
+            if end != -1:
+                content = segment[i + 1:end]
+                if content in ("*", "?", "["):
+                    # An escaped character, see escape()
+                    parts.append(("literal", content))
+                else:
+                    parts.append(("[", content))
+                i = end + 1
+                continue
+        parts.append(("literal", char))
+        i += 1
+
+    # Runs of literal characters as one piece
+    merged = []
+    for kind, text in parts:
+        if kind == "literal" and merged and merged[-1][0] == "literal":
+            merged[-1] = ("literal", merged[-1][1] + text)
+        else:
+            merged.append((kind, text))
+    return merged
+
+
+def _bracket_end(segment: str, start: int) -> int:
+    """Index of the ] closing the bracket expression opened at start, -1 if none does"""
+    # A ] right after [ or [! is a member
+    i = start + 1
+    if i < len(segment) and segment[i] in "!^":
+        i += 1
+    if i < len(segment) and segment[i] == "]":
+        i += 1
+    while i < len(segment):
+        if segment[i] == "]":
+            return i
+        if segment.startswith("[:", i):
+            # The ] of a class like [:alpha:] doesn't close the expression
+            end = segment.find(":]", i + 2)
+            if end != -1:
+                i = end + 2
+                continue
+        i += 1
+    return -1
+
+
+def _members(text: str) -> str:
+    # A leading ] is a member, so is a [ anywhere
+    return text.replace("\\", "\\\\").replace("[", "\\[")
+
+
+def _bracket(content: str) -> str:
+    negated = content[:1] in ("!", "^")
+    if negated:
+        content = content[1:]
+    pieces = []
+    end = 0
+    for match in POSIX_CLASS.finditer(content):
+        members = POSIX_CLASSES.get(match.group(1))
+        if members is None:
+            # No such class, like in bash the pattern matches nothing
+            return "(?!)"
+        pieces.append(_members(content[end:match.start()]))
+        pieces.append(members)
+        end = match.end()
+    pieces.append(_members(content[end:]))
+    return "[" + ("^" if negated else "") + "".join(pieces) + "]"
+
+
+@functools.lru_cache(maxsize=COMPILED_SEGMENTS)
+def compile_segment(segment: str) -> Segment:
+    """Compile a path component of a pattern"""
+    parts = _parts(segment)
+    if all(kind == "literal" for kind, _ in parts):
+        return Segment(literal="".join(text for _, text in parts))
+
+    prefix = parts[0][1] if parts[0][0] == "literal" else ""
+    rest = parts[1:] if prefix else parts
+    hidden = prefix.startswith(".")
+    if len(rest) <= 2 and rest[0][0] == "*" and all(kind == "literal" for kind, _ in rest[1:]):
+        return Segment(prefix=prefix, suffix=rest[1][1] if len(rest) == 2 else "", hidden=hidden)
+
+    translated = {"*": lambda text: ".*", "?": lambda text: ".", "[": _bracket, "literal": re.escape}
+    regex = re.compile("".join(translated[kind](text) for kind, text in parts) + r"\Z", re.DOTALL)
+    return Segment(prefix=prefix, regex=regex, hidden=hidden)
+
+
+class Listing:
+    """
+    Names of a directory and which of them are directories
+
+    The names are in directory order, a sorted copy is only made once a
+    component with a literal prefix needs to bisect it: paths are sorted
+    once they all matched anyway.
+    """
+
+    __slots__ = ("mtime_ns", "names", "directories", "subdirectories", "_sorted")
+
+    def __init__(self, mtime_ns: int, names: List[str], directories: frozenset, subdirectories: frozenset):
+        self.mtime_ns = mtime_ns
+        self.names = names
+        # Directories, symbolic links to directories included
+        self.directories = directories
+        # Directories ** goes down into, symbolic links excluded
+        self.subdirectories = subdirectories
+        self._sorted = None
+
+    @property
+    def sorted_names(self) -> List[str]:
+        if self._sorted is None:
+            self._sorted = sorted(self.names)
+        return self._sorted
+
+    def match(self, segment: Segment) -> List[str]:
+        """Names matching a compiled component, in no particular order"""
+        names = self.names
+        prefix = segment.prefix
+        if prefix:
+            names = self.sorted_names
+            start = bisect.bisect_left(names, prefix)
+            names = names[start:bisect.bisect_left(names, prefix + MAX_CHAR, start)]
+        hidden = segment.hidden
+        if segment.suffix is not None:
+            suffix, shortest = segment.suffix, len(prefix) + len(segment.suffix)
+            return [
+                name for name in names
+                if name.endswith(suffix) and len(name) >= shortest and (hidden or name[0] != ".")
+            ]
+        match = segment.regex.match
+        return [name for name in names if (hidden or name[0] != ".") and match(name)]
+
+
+def join(base: str, name: str) -> str:
+    if not base:
+        return name
+    return base + name if base.endswith("/") else base + "/" + name
+
+
+class Globber:
+    """Expands the patterns of the words of a pipeline"""
+
+    def __init__(self):
+        # Directory as spelled in patterns -> listing, for the current line
+        self.listings: Dict[str, Listing] = {}
+        self.scans = 0
+
+    def clear(self):
+        """Forget the listings, done as every line starts"""
+        self.listings.clear()
+
+    def expand(self, tokens: List[Token]) -> List[Token]:
+        """Tokens with every pattern word replaced by the paths it matches"""
+        expanded = []
+        after_redirect = False
+        for token in tokens:
+            if token.glob is not None and token.type is WORD and not after_redirect:
+                paths = self.glob(token.glob)
+                if paths:
+                    expanded.extend(Token(WORD, path, token.position) for path in paths)
+                    continue
+            expanded.append(token)
+            after_redirect = token.type in REDIRECT_TARGETS
+        return expanded
+
+    def glob(self, pattern: str) -> List[str]:
+        """Paths matching a pattern, sorted"""
+        components = pattern.split("/")
+        paths = [""]
+        if not components[0]:
+            # Absolute, the first component is the empty name before /
+            paths = ["/"]
+            components = components[1:]
+        # A trailing / only matches directories, and is kept
+        directories_only = len(components) > 1 and not components[-1]
+        if directories_only:
+            components = components[:-1]
+
+        for i, component in enumerate(components):
+            last = i == len(components) - 1
+            if not component:
+                # Like the // in a//b
+                continue
+            if component == "**":
+                paths = [path for base in paths for path in self._tree(base)]
+                if last:
+                    # Everything under the directories, files too
+                    paths = [
+                        join(path, name) for path in paths
+                        for name in getattr(self.listing(path or "."), "names", ()) if name[0] != "."
+                    ]
+                continue
+
+            segment = compile_segment(component)
+            if segment.literal is not None:
+                paths = [join(base, segment.literal) for base in paths]
+                if last:
+                    paths = [path for path in paths if os.path.lexists(path)]
+                continue
+
+            matched = []
+            for base in paths:
+                listing = self.listing(base or ".")
+                if listing is None:
+                    continue
+                for name in listing.match(segment):
+                    if (last and not directories_only) or name in listing.directories:
+                        matched.append(join(base, name))
+            paths = matched
+
+        if directories_only:
+            paths = [path + "/" for path in paths if os.path.isdir(path)]
+        return sorted(paths)
+
+    def _tree(self, base: str) -> List[str]:
+        """base, then every directory under it, hidden ones excepted"""
+        tree = [base]
+        i = 0
+        while i < len(tree):
+            listing = self.listing(tree[i] or ".")
+            if listing is not None:
+                tree.extend(join(tree[i], name) for name in listing.names
+                            if name in listing.subdirectories and name[0] != ".")
+            i += 1
+        return tree
+
+    def listing(self, directory: str) -> Optional[Listing]:
+        """Listing of a directory, from this line's cache while its mtime holds"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        listing = self.listings.get(directory)
+        if listing is not None and listing.mtime_ns == mtime:
+            return listing
+
+        names, directories, subdirectories = [], [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    names.append(entry.name)
+                    try:
+                        if entry.is_dir():
+                            directories.append(entry.name)
+                            if not entry.is_symlink():
+                                subdirectories.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        self.scans += 1
+        listing = self.listings[directory] = Listing(mtime, names, frozenset(directories), frozenset(subdirectories))
+        return listing
@@ -1,51 +1,110 @@
 import os
-import readline
 import atexit
+import shutil
+import sys
+import time
+from typing import Iterator, List, Optional
+from app.history.store import HistoryEntry, HistoryStore
+
+HISTORY_ENV = "ECHOCRAFT_HISTORY"
+DEFAULT_HISTORY_FILE = "~/.echocraft_history"
+
+# Commands of the history file that up arrow recalls
+READLINE_LENGTH = 1000
+
+# Ctrl-R puts this in front of the line and submits it, for the shell to
+# open the fuzzy picker rather than run the line
+PICKER_MARKER = "#echocraft-pick-history# "
 
 class HistoryManager:
-    """Simple history manager for shell commands using readline"""
+    """
+    Simple history manager for shell commands using readline
+
+    Every command is kept in a HistoryStore shared by all sessions, with the
+    directory it ran in and its exit status, so it is written once it has
+    finished. readline only holds the last commands, for recalling them.
+
+    readline is imported and the history file loaded the first time the
+    history is used, which is the first prompt for an interactive shell, so
+    starting a shell costs neither until it needs them. So is the fuzzy
+    index of the picker, the first time it opens; from then on every
+    command added is counted in it as it comes.
+    """
     
-    def __init__(self):
+    def __init__(self, path: str = None):
         """
         Initialize history manager
+
+        Args:
+            path: history file, $ECHOCRAFT_HISTORY or ~/.echocraft_history by default
         """
-        self._setup_readline()
-        self.load_history()
-        
-        # Register automatic save on exit
-        atexit.register(self.save_history)
+        self._readline = None
+        self.store = HistoryStore(os.path.expanduser(path or os.environ.get(HISTORY_ENV) or DEFAULT_HISTORY_FILE))
+        # (command, cwd, time) of the command running, written when it finishes
+        self.pending = None
+        # CommandRegistry whose built-ins complete as command names, set by it
+        self.registry = None
+        self.completer = None
+        self._fuzzy = None
+        # Entries of the history file counted in the fuzzy index
+        self.fuzzy_seen = 0
+        # (command, time) of the commands added to the fuzzy index as they
+        # came, not to count them again once they are in the history file
+        self.fuzzy_added = set()
+
+    @property
+    def readline(self):
+        """The readline module, set up and with the history file loaded"""
+        if self._readline is None:
+            import readline
+            self._readline = readline
+            self._setup_readline()
+            self.load_history()
+
+            # Register automatic save on exit, now that there is a history
+            atexit.register(self.save_history)
+        return self._readline
     
     def _setup_readline(self):
         """Configure readline for history support"""
         # Disable Python's automatic history to avoid conflicts
         try:
-            readline.set_auto_history(False)
+            self.readline.set_auto_history(False)
         except AttributeError:
             # set_auto_history not available in older Python versions
             pass
         
         # Enable history
-        readline.set_history_length(50)  # Keep last 50 commands
+        self.readline.set_history_length(READLINE_LENGTH)
         
         # Set up basic key bindings for arrow keys
-        readline.parse_and_bind("\\e[A: previous-history")  # Up arrow
-        readline.parse_and_bind("\\e[B: next-history")      # Down arrow
+        self.readline.parse_and_bind("\\e[A: previous-history")  # Up arrow
+        self.readline.parse_and_bind("\\e[B: next-history")      # Down arrow
+
+        # Ctrl-R opens the fuzzy picker, with the line typed so far as its query
+        self.readline.parse_and_bind(f'"\\C-r": "\\C-a{PICKER_MARKER}\\C-j"')
+
+        # Tab completes command names and paths, PATH is indexed in the background
+        from app.completion import COMPLETER_DELIMS, Completer
+        self.completer = Completer(lambda: self.registry.built_ins if self.registry is not None else ())
+        self.completer.executables.start()
+        self.readline.set_completer_delims(COMPLETER_DELIMS)
+        self.readline.set_completer(self.completer.complete)
+        self.readline.parse_and_bind("tab: complete")
     
     def load_history(self):
-        """Load command history from file if it exists"""
+        """Load the last commands of the history file into readline"""
         try:
-            readline.clear_history()
-            readline.read_history_file()
+            self.readline.clear_history()
+            for command in self.store.last(READLINE_LENGTH):
+                self.readline.add_history(command)
 
-        except (FileNotFoundError, PermissionError) as e:
+        except (PermissionError, OSError) as e:
             print(f"Note: Could not load history file: {e}")
     
     def save_history(self):
-        """Save command history to file"""
-        try:
-            readline.write_history_file()
-        except (PermissionError, OSError) as e:
-            print(f"Warning: Could not save history: {e}")
+        """Write the command still running, if any, to the history file"""
+        self.finish_command(None)
     
     def add_command(self, command: str):
         """Add a command to history"""
@@ -54,25 +113,114 @@ class HistoryManager:
             cmd = command.strip()
             
             # Avoid duplicate consecutive commands
-            history_len = readline.get_current_history_length()
-            if history_len == 0 or readline.get_history_item(history_len) != cmd:
-                readline.add_history(cmd)
+            history_len = self.readline.get_current_history_length()
+            if history_len == 0 or self.readline.get_history_item(history_len) != cmd:
+                self.readline.add_history(cmd)
+
+            # The previous command is written even if it never finished
+            self.finish_command(None)
+            try:
+                cwd = os.getcwd()
+            except OSError:
+                cwd = ""
+            self.pending = (cmd, cwd, time.time())
+            if self._fuzzy is not None:
+                self._fuzzy.add(cmd, cwd, self.pending[2])
+                self.fuzzy_added.add((cmd, f"{self.pending[2]:.3f}"))
+
+    def finish_command(self, status: Optional[int]):
+        """Write the last command added to the history file, with its exit status"""
+        if self.pending is None:
+            return
+        command, cwd, started = self.pending
+        self.pending = None
+        try:
+            self.store.append(command, status, cwd, started)
+        except OSError as e:
+            print(f"Warning: Could not save history: {e}")
     
-    def get_input(self, prompt="$ "):
-        """Get user input with history support"""
-        return input(prompt)
+    def get_input(self, prompt="$ ", prefill: str = None):
+        """Get user input with history support, starting from prefill if given"""
+        # input() only edits lines and recalls history once readline is loaded
+        readline = self.readline
+        if not prefill:
+            return input(prompt)
+
+        def insert_prefill():
+            readline.insert_text(prefill)
+            readline.redisplay()
+
+        readline.set_pre_input_hook(insert_prefill)
+        try:
+            return input(prompt)
+        finally:
+            readline.set_pre_input_hook()
+
+    @property
+    def fuzzy(self):
+        """Fuzzy index of the whole history, built the first time it is needed"""
+        if self._fuzzy is None:
+            from app.history.fuzzy import FuzzyIndex, weights_from_environment
+            self._fuzzy = FuzzyIndex(weights_from_environment())
+            self._fuzzy.extend(self._unseen_runs())
+        else:
+            # Count what other sessions ran since
+            for run in self._unseen_runs():
+                self._fuzzy.add(*run)
+        return self._fuzzy
+
+    def _unseen_runs(self) -> Iterator[tuple]:
+        """(command, cwd, time) of the history file entries not in the fuzzy index yet"""
+        for entry in self.store.entries(self.fuzzy_seen + 1):
+            self.fuzzy_seen = entry.number
+            key = (entry.command, f"{entry.time:.3f}")
+            if key in self.fuzzy_added:
+                self.fuzzy_added.discard(key)
+            else:
+                yield entry.command, entry.cwd, entry.time
+
+    def fuzzy_search(self, query: str, limit: int = 10) -> List[str]:
+        """Best ranked commands matching query for the current directory, best first"""
+        try:
+            cwd = os.getcwd()
+        except OSError:
+            cwd = ""
+        return self.fuzzy.search(query, cwd, limit)
+
+    def is_pick_request(self, line: str) -> bool:
+        """Whether a line was submitted by Ctrl-R to open the picker"""
+        return line.startswith(PICKER_MARKER)
+
+    def pick(self, line: str, prompt: str = "$ ") -> str:
+        """
+        Run the fuzzy picker for a line submitted by Ctrl-R
+
+        Returns:
+            str: the command picked, or the line as it was typed
+        """
+        from app.history.picker import HistoryPicker
+        query = line[len(PICKER_MARKER):]
+
+        # Take the submitted line off the screen, the picker goes in its place
+        columns = shutil.get_terminal_size().columns
+        rows = (len(prompt) + len(line)) // columns + 1
+        sys.stdout.write(f"\x1b[{rows}A\r\x1b[J")
+
+        picker = HistoryPicker(lambda text, limit: self.fuzzy_search(text, limit), query)
+        choice = picker.pick(sys.stdin.fileno(), sys.stdout)
+        return choice if choice is not None else picker.query
     
     def get_history_length(self):
         """Get current number of commands in history"""
-        return readline.get_current_history_length()
+        return len(self.store) + (self.pending is not None)
     
     def clear_history(self):
-        """Clear all command history"""
-        readline.clear_history()
+        """Clear the commands up arrow recalls, the history file is kept"""
+        self.readline.clear_history()
 
     def get_history(self, count=None) -> list:
         """Get command history"""
-        history_length = readline.get_current_history_length()
+        history_length = self.get_history_length()
         
         if history_length == 0:
             return []
@@ -83,13 +231,18 @@ class HistoryManager:
         else:
             start_idx = max(1, history_length - count + 1)
         
-        history_list = []
-        for i in range(start_idx, history_length + 1):
-            command = readline.get_history_item(i)
-            if command:
-                history_list.append((i, command))
+        history_list = [(entry.number, entry.command) for entry in self.store.entries(start_idx)]
+        if self.pending is not None:
+            history_list.append((history_length, self.pending[0]))
         
         return history_list
+
+    def search(self, pattern: str) -> Iterator[HistoryEntry]:
+        """Entries whose command contains pattern, oldest first"""
+        yield from self.store.search(pattern)
+        if self.pending is not None and pattern in self.pending[0]:
+            command, cwd, started = self.pending
+            yield HistoryEntry(len(self.store) + 1, started, None, cwd, command)
     
     def print_history(self, count=None):
         """Print command history to stdout"""
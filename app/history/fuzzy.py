@@ -0,0 +1,245 @@
+"""
+Fuzzy matching and ranking of history commands for the picker
+
+A query matches a command holding its characters in order, not
+necessarily next to each other, ignoring case unless the query has
+capitals. Matches are ranked by how often a command ran, how recently, and
+how often in the current directory:
+
+    frequency * ln(1 + runs) + recency * ln 2 * last run / half life
+        + cwd * ln(1 + runs in the directory)
+
+The recency term uses the time of the last run rather than its age, so a
+command gains on another exactly as if their scores halved every half
+life, yet the ranking of commands that didn't run again never changes.
+The commands are thus kept in ranking order as they run, overall and per
+directory, and a query only has to look at the best ones of both until
+enough match. When matches are rare, the commands, lowercased and joined
+in one string, are searched with a single regular expression instead,
+which a longer query typed next only has to narrow down.
+"""
+
+import array
+import bisect
+import itertools
+import math
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+WEIGHTS_ENV = "ECHOCRAFT_HISTORY_WEIGHTS"
+
+# Best ranked commands checked one by one before searching them all at once
+WALK_LIMIT = 2000
+
+
+class RankWeights(NamedTuple):
+    """How much each part of the ranking counts"""
+    frequency: float = 1.0
+    recency: float = 1.0
+    cwd: float = 1.0
+    # Seconds for a command's recency to halve
+    half_life: float = 7 * 86400.0
+
+
+def parse_weights(text: str) -> RankWeights:
+    """
+    Weights from name=value pairs separated by commas, like "recency=2,cwd=0"
+
+    Raises:
+        ValueError: if a name isn't a weight or a value isn't a number
+    """
+    values = {}
+    for item in filter(None, (item.strip() for item in text.split(","))):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in RankWeights._fields:
+            raise ValueError(f"{name}: unknown weight, expected one of {', '.join(RankWeights._fields)}")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            raise ValueError(f"{name}: invalid weight '{value}'")
+    if values.get("half_life", 1.0) <= 0:
+        raise ValueError("half_life: must be positive")
+    return RankWeights(**values)
+
+
+def weights_from_environment() -> RankWeights:
+    """Weights set in ECHOCRAFT_HISTORY_WEIGHTS, the defaults for those it doesn't set"""
+    text = os.environ.get(WEIGHTS_ENV, "")
+    try:
+        return parse_weights(text)
+    except ValueError as e:
+        print(f"Warning: {WEIGHTS_ENV}: {e}", file=sys.stderr)
+        return RankWeights()
+
+
+def compile_query(query: str, flags: int = None):
+    """Regular expression matching a line holding the characters of query in order"""
+    if flags is None:
+        flags = 0 if any(char.isupper() for char in query) else re.IGNORECASE
+    # Skipping to the next character possessively: the first one is always
+    # the right one, so there is nothing to backtrack into
+    parts = [re.escape(query[0])] if query else []
+    for char in query[1:]:
+        parts.append(f"[^\n{re.escape(char)}]*+{re.escape(char)}")
+    return re.compile("".join(parts), flags)
+
+
+class FuzzyIndex:
+    """
+    Every distinct command of the history with what ranks it
+
+    Commands are numbered in the order they first ran. `order` holds
+    (-score without the directory, number) of them all, sorted, the
+    `cwd_order` of a directory (-score, number) of those that ran there,
+    and `text` their lowercased lines in number order.
+    """
+
+    def __init__(self, weights: RankWeights = None):
+        self.weights = weights or RankWeights()
+        self.numbers: Dict[str, int] = {}
+        self.commands: List[str] = []
+        self.runs: List[int] = []
+        self.last: List[float] = []
+        # Directory -> {command number: runs there}
+        self.cwd_runs: Dict[str, Dict[int, int]] = {}
+        # Command number -> directories it ran in
+        self.cwds: List[List[str]] = []
+        self.order = []
+        self.cwd_order: Dict[str, list] = {}
+        self.text = ""
+        self.offsets = array.array("Q")
+        # Lines of the commands added since text was joined
+        self.unjoined = []
+        # (query, commands) of the last search of text, while no command is added
+        self.scanned = None
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, command: str, cwd: str = "", timestamp: float = 0.0):
+        """Count a run of a command"""
+        number = self.numbers.get(command)
+        if number is not None:
+            # Take the command out of the orders, it goes back with its new scores
+            del self.order[bisect.bisect_left(self.order, (-self.base_score(number), number))]
+            for directory in self.cwds[number]:
+                order = self.cwd_order[directory]
+                del order[bisect.bisect_left(order, (-self.score(number, directory), number))]
+        number = self._count(command, cwd, timestamp)
+        bisect.insort(self.order, (-self.base_score(number), number))
+        for directory in self.cwds[number]:
+            bisect.insort(self.cwd_order.setdefault(directory, []), (-self.score(number, directory), number))
+
+    def extend(self, runs: Iterable[Tuple[str, str, float]]):
+        """Count many runs of (command, cwd, timestamp), sorting once at the end"""
+        for command, cwd, timestamp in runs:
+            self._count(command, cwd, timestamp)
+        scores = [self.base_score(number) for number in range(len(self.commands))]
+        self.order = sorted((-score, number) for number, score in enumerate(scores))
+        cwd_weight, log1p = self.weights.cwd, math.log1p
+        self.cwd_order = {
+            directory: sorted((-(scores[number] + cwd_weight * log1p(count)), number) for number, count in runs.items())
+            for directory, runs in self.cwd_runs.items()
+        }
+        # Joined now rather than by the first search that needs it
+        self._join()
+
+    def _count(self, command: str, cwd: str, timestamp: float) -> int:
+        number = self.numbers.get(command)
+        if number is None:
+            number = self.numbers[command] = len(self.commands)
+            self.commands.append(command)
+            self.runs.append(1)
+            self.last.append(timestamp)
+            self.cwds.append([])
+            self.unjoined.append(command.replace("\n", " ").lower())
+            self.scanned = None
+        else:
+            self.runs[number] += 1
+            self.last[number] = max(self.last[number], timestamp)
+
+        if cwd:
+            runs = self.cwd_runs.setdefault(cwd, {})
+            if number not in runs:
+                runs[number] = 0
+                self.cwds[number].append(cwd)
+            runs[number] += 1
+        return number
+
+    def base_score(self, number: int) -> float:
+        """Score of a command before the directory is counted"""
+        weights = self.weights
+        return (
+            weights.frequency * math.log1p(self.runs[number])
+            + weights.recency * math.log(2) * self.last[number] / weights.half_life
+        )
+
+    def score(self, number: int, cwd: str) -> float:
+        """Score of a command run from a directory"""
+        return self.base_score(number) + self.weights.cwd * math.log1p(self.cwd_runs.get(cwd, {}).get(number, 0))
+
+    def search(self, query: str, cwd: str = "", limit: int = 10) -> List[str]:
+        """The best ranked commands matching query, best first"""
+        if limit <= 0:
+            return []
+        pattern = compile_query(query)
+
+        # The best matches overall and the best run here hold the best of all
+        matches = self._walk(self.order, pattern, limit)
+        cwd_matches = self._walk(self.cwd_order.get(cwd, []), pattern, limit)
+        if matches is None or cwd_matches is None:
+            # Matches are rare, searching everything at once is faster
+            candidates = self._scan(query, pattern)
+        else:
+            candidates = set(matches).union(cwd_matches)
+        scored = sorted(candidates, key=lambda number: (-self.score(number, cwd), number))
+        return [self.commands[number] for number in scored[:limit]]
+
+    def _walk(self, order: list, pattern, limit: int) -> Optional[List[int]]:
+        """The first matches in an order, None if they are too far down to walk to"""
+        matches = []
+        for _, number in order[:WALK_LIMIT]:
+            if pattern.search(self.commands[number]):
+                matches.append(number)
+                if len(matches) == limit:
+                    return matches
+        return matches if len(order) <= WALK_LIMIT else None
+
+    def _scan(self, query: str, pattern) -> List[int]:
+        """Numbers of every command matching pattern"""
+        lowered = query.lower()
+        if self.scanned is not None and lowered.startswith(self.scanned[0]) and len(self.scanned[1]) <= WALK_LIMIT:
+            # Whatever matches the longer query matched the last one
+            matches = [number for number in self.scanned[1] if pattern.search(self.commands[number])]
+        else:
+            matches = self._search_text(compile_query(lowered, 0))
+        if lowered == query:
+            self.scanned = (lowered, matches)
+        else:
+            # Case matters, the commands found in lowercase are only candidates
+            matches = [number for number in matches if pattern.search(self.commands[number])]
+        return matches
+
+    def _search_text(self, pattern) -> List[int]:
+        """Numbers of every command matching a lowercase pattern, from one search of the joined text"""
+        self._join()
+        text, offsets = self.text, self.offsets
+        matches = []
+        position = 0
+        while (match := pattern.search(text, position)) is not None:
+            number = bisect.bisect_right(offsets, match.start()) - 1
+            matches.append(number)
+            # Carry on with the next line, one match per command is enough
+            position = offsets[number + 1] if number + 1 < len(offsets) else len(text)
+        return matches
+
+    def _join(self):
+        if not self.unjoined:
+            return
+        starts = itertools.accumulate((len(line) + 1 for line in self.unjoined[:-1]), initial=len(self.text))
+        self.offsets.extend(starts)
+        self.text += "\n".join(self.unjoined) + "\n"
+        self.unjoined = []
@@ -0,0 +1,145 @@
+"""
+Interactive fuzzy history picker, drawn right under the prompt
+
+Ctrl-R opens it with what was typed so far as the query. The best matches
+are listed above a query line, the best one nearest to it, and updated on
+every key: Up and Down (or Ctrl-P and Ctrl-N, Ctrl-R) move the selection,
+Enter puts the selected command on the prompt to be edited or run, Escape,
+Ctrl-G or Ctrl-C leave it with the query instead.
+"""
+
+import os
+import shutil
+import termios
+import tty
+from typing import Callable, List, Optional
+
+PROMPT = "history> "
+
+# Matches listed at most
+PICKER_ROWS = 10
+
+UP_KEYS = ("\x1b[A", "\x1bOA", "\x10", "\x12")
+DOWN_KEYS = ("\x1b[B", "\x1bOB", "\x0e")
+ACCEPT_KEYS = ("\r", "\n")
+CANCEL_KEYS = ("\x1b", "\x07", "\x03", "\x04")
+ERASE_KEYS = ("\x7f", "\x08")
+CLEAR_KEY = "\x15"
+
+
+def split_keys(data: str) -> List[str]:
+    """Keys in what a read from the terminal returned, escape sequences whole"""
+    keys = []
+    i = 0
+    while i < len(data):
+        if data[i] == "\x1b" and i + 2 < len(data) and data[i + 1] in "[O":
+            # CSI or SS3: parameters, then the final character
+            end = i + 2
+            while end < len(data) and not data[end].isalpha() and data[end] != "~":
+                end += 1
+            keys.append(data[i:end + 1])
+            i = end + 1
+        else:
+            keys.append(data[i])
+            i += 1
+    return keys
+
+
+class HistoryPicker:
+    """
+    State of one run of the picker
+
+    Keys go through press(), which the terminal loop of pick() feeds, so the
+    picker can be driven without a terminal.
+    """
+
+    def __init__(self, search: Callable[[str, int], List[str]], query: str = "", rows: int = PICKER_ROWS):
+        """
+        Args:
+            search: best commands matching a query, best first, at most a number
+            query: text the picker starts with
+            rows: matches listed at most
+        """
+        self.search = search
+        self.rows = rows
+        self.query = query
+        self.selected = 0
+        self.matches = search(query, rows)
+
+    def press(self, key: str) -> Optional[bool]:
+        """
+        Handle a key
+
+        Returns:
+            True when a command was picked, False when the picker was left,
+            None while it goes on
+        """
+        if key in ACCEPT_KEYS:
+            return bool(self.matches)
+        if key in CANCEL_KEYS:
+            return False
+        if key in UP_KEYS:
+            self.selected = min(self.selected + 1, max(len(self.matches) - 1, 0))
+        elif key in DOWN_KEYS:
+            self.selected = max(self.selected - 1, 0)
+        elif key in ERASE_KEYS or key == CLEAR_KEY or (len(key) == 1 and key.isprintable()):
+            if key in ERASE_KEYS:
+                query = self.query[:-1]
+            elif key == CLEAR_KEY:
+                query = ""
+            else:
+                query = self.query + key
+            if query != self.query:
+                self.query = query
+                self.selected = 0
+                self.matches = self.search(query, self.rows)
+        return None
+
+    @property
+    def choice(self) -> Optional[str]:
+        return self.matches[self.selected] if self.matches else None
+
+    def render(self, columns: int) -> str:
+        """The matches, best at the bottom, then the query line"""
+        lines = []
+        for row in reversed(range(self.rows)):
+            if row >= len(self.matches):
+                lines.append("")
+                continue
+            text = self.matches[row].replace("\n", " ")[:max(columns - 3, 1)]
+            lines.append(f"\x1b[7m> {text}\x1b[0m" if row == self.selected else f"  {text}")
+        lines.append(f"{PROMPT}{self.query}")
+        return "\r\n".join(lines)
+
+    def pick(self, fd: int, out) -> Optional[str]:
+        """
+        Run the picker on a terminal until a command is picked or it is left
+
+        Returns:
+            str: the command picked, None if the picker was left
+        """
+        attributes = termios.tcgetattr(fd)
+        drawn = False
+        try:
+            tty.setcbreak(fd)
+            while True:
+                columns = shutil.get_terminal_size().columns
+                # Back to the top of what was drawn before drawing over it
+                out.write((f"\x1b[{self.rows}A" if drawn else "") + "\r\x1b[J" + self.render(columns))
+                out.flush()
+                drawn = True
+
+                data = os.read(fd, 1024)
+                if not data:
+                    return None
+                for key in split_keys(data.decode(errors="replace")):
+                    done = self.press(key)
+                    if done is not None:
+                        return self.choice if done else None
+        except KeyboardInterrupt:
+            return None
+        finally:
+            if drawn:
+                out.write(f"\x1b[{self.rows}A\r\x1b[J")
+                out.flush()
+            termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
@@ -0,0 +1,456 @@
+"""
+Append-only history file with a trigram index for searching it
+
+Every command is one line of the history file: the time it was entered,
+its exit status, the directory it ran in and the command itself, separated
+by tabs. Lines are appended with a single write on a descriptor opened with
+O_APPEND, so any number of sessions can share the file without one
+overwriting another. The file is mapped rather than read, so opening a
+history of millions of commands costs nothing until entries are needed.
+
+Searches go through a trigram index kept next to the file: for every
+3-byte sequence, the blocks of BLOCK_SIZE consecutive entries where some
+command contains it. Pointing at blocks rather than entries keeps the
+index small, trigrams like "git" being in most entries of a history.
+The index is a mapped file too, covering the history up to some offset.
+Entries appended since, by this session or any other, are indexed in
+memory, and merged into a new index file once there are enough of them.
+"""
+
+import array
+import bisect
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+# Index file: magic, version, bytes of history covered, entries, trigrams,
+# postings; then the entry offsets and posting starts as 8-byte integers,
+# the trigrams and postings as 4-byte ones
+INDEX_HEADER = struct.Struct("=4sIQQQQ")
+INDEX_MAGIC = b"ECHI"
+INDEX_VERSION = 1
+
+# Entries indexed in memory before they are merged into the index file
+MERGE_THRESHOLD = 4096
+
+# Entries per block of the index postings
+BLOCK_SIZE = 16
+
+FIELD_SEPARATOR = b"\t"
+
+ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n"}
+UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n"}
+
+# Array type codes of 8 and 4 byte unsigned integers
+U64 = "Q"
+U32 = "I" if array.array("I").itemsize == 4 else "L"
+
+
+class HistoryEntry(NamedTuple):
+    """A command of the history"""
+    # Position in the history, from 1
+    number: int
+    time: float
+    # Exit status, None when the command didn't finish
+    status: Optional[int]
+    cwd: str
+    command: str
+
+
+def escape(text: str) -> str:
+    """Text without tabs or newlines, so it fits in a field of a line"""
+    if "\\" not in text and "\t" not in text and "\n" not in text:
+        return text
+    return "".join(ESCAPES.get(char, char) for char in text)
+
+
+def unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+    chars = []
+    i = 0
+    while i < len(text):
+        if text[i] == "\\" and i + 1 < len(text):
+            chars.append(UNESCAPES.get(text[i + 1], text[i + 1]))
+            i += 2
+        else:
+            chars.append(text[i])
+            i += 1
+    return "".join(chars)
+
+
+def encode_entry(command: str, status: Optional[int], cwd: str, timestamp: float) -> bytes:
+    fields = [f"{timestamp:.3f}", "" if status is None else str(status), escape(cwd), escape(command)]
+    return ("\t".join(fields) + "\n").encode(errors="surrogateescape")
+
+
+def decode_entry(number: int, line: bytes) -> HistoryEntry:
+    fields = line.rstrip(b"\n").split(FIELD_SEPARATOR, 3)
+    if len(fields) < 4:
+        # Not written by this store, take the whole line as the command
+        return HistoryEntry(number, 0.0, None, "", line.rstrip(b"\n").decode(errors="surrogateescape"))
+    timestamp, status, cwd, command = (field.decode(errors="surrogateescape") for field in fields)
+    try:
+        timestamp = float(timestamp)
+    except ValueError:
+        timestamp = 0.0
+    return HistoryEntry(
+        number, timestamp, int(status) if status.lstrip("-").isdigit() else None, unescape(cwd), unescape(command)
+    )
+
+
+def command_field(line: bytes) -> bytes:
+    """The command of an entry line, still escaped"""
+    fields = line.rstrip(b"\n").split(FIELD_SEPARATOR, 3)
+    return fields[3] if len(fields) == 4 else line.rstrip(b"\n")
+
+
+def trigrams(data: bytes) -> set:
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def trigram_key(trigram: bytes) -> int:
+    return int.from_bytes(trigram, "big")
+
+
+class TrigramIndex:
+    """
+    Index file mapped into memory
+
+    Offsets of every entry it covers, then for each trigram in ascending
+    order, the ascending numbers of the blocks of entries containing it.
+    """
+
+    def __init__(self, path: str):
+        """
+        Raises:
+            OSError, ValueError: if the file is missing or isn't an index
+        """
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.covered, entries, keys, postings = INDEX_HEADER.unpack_from(self.map)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                raise ValueError("not a history index")
+            view = memoryview(self.map)
+            position = INDEX_HEADER.size
+            self.views = []
+            self.offsets = self._section(view, position, entries, U64)
+            position += 8 * entries
+            self.starts = self._section(view, position, keys + 1, U64)
+            position += 8 * (keys + 1)
+            self.keys = self._section(view, position, keys, U32)
+            position += 4 * keys
+            self.postings = self._section(view, position, postings, U32)
+            view.release()
+        except (struct.error, TypeError, ValueError):
+            self.close()
+            raise ValueError("not a history index")
+
+    def _section(self, view: memoryview, position: int, count: int, code: str) -> memoryview:
+        size = array.array(code).itemsize
+        section = view[position:position + count * size].cast(code)
+        if len(section) != count:
+            raise ValueError("truncated history index")
+        self.views.append(section)
+        return section
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def lookup(self, key: int) -> memoryview:
+        """Numbers of the blocks containing a trigram"""
+        position = bisect.bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            return self.postings[0:0]
+        return self.postings[self.starts[position]:self.starts[position + 1]]
+
+    def close(self):
+        for view in getattr(self, "views", []):
+            view.release()
+        self.views = []
+        self.map.close()
+
+    @staticmethod
+    def write(path: str, covered: int, offsets, old: Optional["TrigramIndex"], postings: Dict[bytes, List[int]]):
+        """
+        Write an index made of an old one plus the postings of newer entries
+
+        The file is written next to its final path and renamed over it, so
+        readers, and sessions writing their own, only ever see a whole index.
+        """
+        new_keys = {trigram_key(trigram): blocks for trigram, blocks in postings.items()}
+        old_keys = old.keys if old is not None else []
+        keys = sorted(set(old_keys).union(new_keys))
+
+        starts = array.array(U64, [0])
+        old_positions = {key: position for position, key in enumerate(old_keys)}
+        for key in keys:
+            count = len(new_keys.get(key, ()))
+            if key in old_positions:
+                position = old_positions[key]
+                count += old.starts[position + 1] - old.starts[position]
+            starts.append(starts[-1] + count)
+
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, covered, len(offsets), len(keys), starts[-1]))
+            file.write(array.array(U64, offsets).tobytes())
+            file.write(starts.tobytes())
+            file.write(array.array(U32, keys).tobytes())
+            for key in keys:
+                if key in old_positions:
+                    position = old_positions[key]
+                    file.write(old.postings[old.starts[position]:old.starts[position + 1]])
+                if key in new_keys:
+                    file.write(array.array(U32, new_keys[key]).tobytes())
+        os.replace(temporary, path)
+
+
+class HistoryStore:
+    """
+    The history file of every session, read through a mapping
+
+    Entries are numbered from 1 in the order they were appended, whichever
+    session appended them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.map = None
+        # Bytes of the file up to its last complete line
+        self.size = 0
+        # Whether the index file was looked for
+        self.loaded = False
+        self.index = None
+        # Entries after the index file: where they start, and their trigrams
+        self.tail_start = 0
+        self.tail_offsets = []
+        self.tail_postings = {}
+
+    def append(self, command: str, status: Optional[int] = None, cwd: str = "", timestamp: float = None):
+        """Add an entry at the end of the file, in a single write"""
+        data = encode_entry(command, status, cwd, time.time() if timestamp is None else timestamp)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def refresh(self):
+        """Catch up with what was appended since, here or by other sessions"""
+        self._map_file()
+        self._index_tail()
+
+    def __len__(self):
+        self.refresh()
+        return self._count()
+
+    def _count(self) -> int:
+        return (len(self.index) if self.index is not None else 0) + len(self.tail_offsets)
+
+    def entry(self, number: int) -> HistoryEntry:
+        """Entry by its number, from 1"""
+        return decode_entry(number, self._line(number - 1))
+
+    def entries(self, first: int = 1) -> Iterator[HistoryEntry]:
+        """Every entry from a number on, oldest first"""
+        self.refresh()
+        for number in range(max(first, 1), self._count() + 1):
+            yield self.entry(number)
+
+    def last(self, count: int) -> List[str]:
+        """
+        The commands of the last entries, oldest first
+
+        Only the end of the file is looked at, nothing is indexed.
+        """
+        self._map_file()
+        if not self.size or count <= 0:
+            return []
+        end = self.size
+        lines = []
+        while end > 0 and len(lines) < count:
+            start = self.map.rfind(b"\n", 0, end - 1) + 1
+            lines.append(self.map[start:end])
+            end = start
+        return [decode_entry(0, line).command for line in reversed(lines)]
+
+    def search(self, pattern: str) -> Iterator[HistoryEntry]:
+        """
+        Entries whose command contains pattern, oldest first
+
+        Only the blocks holding the rarest trigram of the pattern are
+        looked at, with find(), which runs at memchr speed. Patterns too
+        short to have a trigram are found scanning the whole file.
+        """
+        self.refresh()
+        needle = escape(pattern).encode(errors="surrogateescape")
+        keys = trigrams(needle)
+        if not keys:
+            candidates = self._scan(needle, 0, self.size)
+        else:
+            candidates = self._scan_blocks(needle, self._postings(min(keys, key=self._posting_count)))
+
+        for position in candidates:
+            line = self._line(position)
+            if needle in command_field(line):
+                entry = decode_entry(position + 1, line)
+                # The escaped pattern can match across an escape, check the text
+                if pattern in entry.command:
+                    yield entry
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def _scan_blocks(self, needle: bytes, blocks: List[int]) -> Iterator[int]:
+        """Positions of the entries of blocks whose line contains needle"""
+        count = self._count()
+        i = 0
+        while i < len(blocks):
+            # Runs of consecutive blocks are scanned in one go, a block split
+            # between the index file and memory is listed twice
+            first = last = blocks[i]
+            i += 1
+            while i < len(blocks) and blocks[i] <= last + 1:
+                last = blocks[i]
+                i += 1
+            end = min((last + 1) * BLOCK_SIZE, count)
+            yield from self._scan(needle, self._offset(first * BLOCK_SIZE), self._offset(end))
+
+    def _scan(self, needle: bytes, start: int, end: int) -> Iterator[int]:
+        """Positions of the entries between two offsets whose line contains needle"""
+        while (found := self.map.find(needle, start, end)) >= 0:
+            line = self.map.rfind(b"\n", 0, found) + 1
+            yield self._position_at(line)
+            start = self.map.find(b"\n", found, end) + 1
+            if start == 0:
+                return
+
+    def _offset(self, position: int) -> int:
+        """Offset where the entry at a position starts, the end for the count"""
+        indexed = len(self.index) if self.index is not None else 0
+        if position < indexed:
+            return self.index.offsets[position]
+        position -= indexed
+        if position < len(self.tail_offsets):
+            return self.tail_offsets[position]
+        return self.size
+
+    def _position_at(self, offset: int) -> int:
+        """Position of the entry starting at an offset of the file"""
+        if self.index is not None and offset < self.index.covered:
+            return bisect.bisect_left(self.index.offsets, offset)
+        indexed = len(self.index) if self.index is not None else 0
+        return indexed + bisect.bisect_left(self.tail_offsets, offset)
+
+    def _posting_count(self, trigram: bytes) -> int:
+        count = len(self.index.lookup(trigram_key(trigram))) if self.index is not None else 0
+        return count + len(self.tail_postings.get(trigram, ()))
+
+    def _postings(self, trigram: bytes) -> List[int]:
+        """Blocks holding a trigram, in the index file and in memory"""
+        blocks = list(self.index.lookup(trigram_key(trigram))) if self.index is not None else []
+        blocks.extend(self.tail_postings.get(trigram, ()))
+        return blocks
+
+    def _line(self, position: int) -> bytes:
+        """Line of the entry at a position, from 0"""
+        indexed = len(self.index) if self.index is not None else 0
+        if position < indexed:
+            offsets = self.index.offsets
+            start = offsets[position]
+            end = offsets[position + 1] if position + 1 < indexed else self.index.covered
+        else:
+            position -= indexed
+            start = self.tail_offsets[position]
+            end = self.tail_offsets[position + 1] if position + 1 < len(self.tail_offsets) else self.size
+        return self.map[start:end]
+
+    def _map_file(self):
+        """Map the file again if it changed size"""
+        try:
+            size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            size = 0
+        if self.loaded and size == (len(self.map) if self.map is not None else 0):
+            return
+        previous = self.size
+        self._remap(size)
+        if not self.loaded or self.size < previous:
+            # First look, or the file was truncated or replaced since
+            self._load_index()
+
+    def _remap(self, size: int):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.size = 0
+        if size == 0:
+            return
+        with open(self.path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        # A line still being written by another session isn't an entry yet
+        self.size = self.map.rfind(b"\n") + 1
+
+    def _load_index(self):
+        """Open the index file, if it matches the history file"""
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        try:
+            index = TrigramIndex(self.index_path)
+        except (OSError, ValueError):
+            index = None
+        if index is not None and (index.covered > self.size or (index.covered and self.map[index.covered - 1] != 10)):
+            # The history was truncated or replaced since
+            index.close()
+            index = None
+        self.loaded = True
+        self.index = index
+        self.tail_start = index.covered if index is not None else 0
+        self.tail_offsets = []
+        self.tail_postings = {}
+
+    def _index_tail(self):
+        """Index the entries after the last one indexed, in memory"""
+        position = self.tail_offsets[-1] if self.tail_offsets else self.tail_start
+        if self.tail_offsets:
+            # The last entry is complete already, carry on after it
+            position = self.map.find(b"\n", position, self.size) + 1
+        number = self._count()
+        postings = self.tail_postings
+        while position < self.size:
+            end = self.map.find(b"\n", position, self.size) + 1
+            self.tail_offsets.append(position)
+            block = number // BLOCK_SIZE
+            for trigram in trigrams(command_field(self.map[position:end])):
+                blocks = postings.get(trigram)
+                if blocks is None:
+                    postings[trigram] = [block]
+                elif blocks[-1] != block:
+                    blocks.append(block)
+            number += 1
+            position = end
+
+        if len(self.tail_offsets) >= MERGE_THRESHOLD:
+            self._merge()
+
+    def _merge(self):
+        """Write the in-memory postings into a new index file and map it"""
+        offsets = array.array(U64, self.index.offsets if self.index is not None else [])
+        offsets.extend(self.tail_offsets)
+        try:
+            TrigramIndex.write(self.index_path, self.size, offsets, self.index, self.tail_postings)
+        except OSError:
+            # Searching still works from memory, the next merge tries again
+            return
+        self._load_index()
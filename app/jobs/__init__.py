@@ -0,0 +1,316 @@
+import os
+import selectors
+import signal
+import threading
+from typing import List, Optional, Tuple
+from app.limits import JOB_CONTROL_SIGNALS
+from app.pipe import HAS_PIDFD, RunningPipeline
+
+# How often jobs that can't be watched through a descriptor are polled
+POLL_INTERVAL = 0.05
+
+# Stops that only mean a job reached the terminal before it was handed over
+TTY_STOPS = (signal.SIGTTIN, signal.SIGTTOU)
+
+
+class Job:
+    """A pipeline tracked by the job table"""
+
+    def __init__(self, job_id: int, command: str, pipeline: RunningPipeline):
+        self.id = job_id
+        # Command line without the trailing &
+        self.command = command
+        self.pipeline = pipeline
+        # Pids of the processes currently stopped by a signal
+        self.stopped_pids = set()
+        # Whether the shell is waiting on the job with the terminal handed over
+        self.foreground = False
+
+    @property
+    def finished(self) -> bool:
+        return self.pipeline.finished()
+
+    @property
+    def stopped(self) -> bool:
+        return any(
+            process.pid in self.stopped_pids and process.returncode is None
+            for process in self.pipeline.processes
+        )
+
+    @property
+    def pids(self) -> List[int]:
+        return [process.pid for process in self.pipeline.processes]
+
+    @property
+    def state(self) -> str:
+        """State of the job the way jobs reports it"""
+        if self.stopped:
+            return "Stopped"
+        if not self.finished:
+            return "Running"
+        if self.pipeline.signal:
+            return signal.strsignal(self.pipeline.signal)
+        status = self.pipeline.pipe_status[-1] if self.pipeline.stages else 0
+        return "Done" if status == 0 else f"Exit {status}"
+
+
+class JobTable:
+    """
+    Jobs of the session: background pipelines and stopped ones
+
+    A supervisor thread reaps their processes as they exit, watching a
+    pidfd per process where there are pidfds and polling otherwise. With
+    job control on, SIGCHLD also wakes it up to notice processes being
+    stopped and continued. Anyone waiting on a job waits on the changed
+    condition, which is notified whenever the supervisor woke up.
+    """
+
+    def __init__(self, job_control: bool = False, terminal: int = None):
+        """
+        Args:
+            job_control: Put jobs in process groups of their own, hand the
+                terminal over to foreground jobs and track stopped jobs
+            terminal: Descriptor of the controlling terminal
+        """
+        self.jobs = {}
+        # Ids from the least to the most recently started or resumed job,
+        # the last two are the current (+) and previous (-) jobs
+        self.recent = []
+        self.job_control = job_control
+        self.terminal = terminal
+        self.shell_pgid = os.getpgrp()
+        self.changed = threading.Condition()
+
+        self.selector = selectors.DefaultSelector()
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ)
+        self.supervisor = None
+
+        if job_control:
+            # Ctrl-Z and reads or writes of the terminal from the background
+            # stop jobs, never the shell, even while it runs built-ins itself
+            for signum in JOB_CONTROL_SIGNALS:
+                signal.signal(signum, signal.SIG_IGN)
+            # The handler has nothing to do, the wakeup fd is what matters
+            signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+            signal.set_wakeup_fd(self.wake_write, warn_on_full_buffer=False)
+
+    def add(self, pipeline: RunningPipeline, command: str, foreground: bool = False) -> Job:
+        """Start tracking a pipeline as a job"""
+        with self.changed:
+            job = Job(max(self.jobs, default=0) + 1, command, pipeline)
+            job.foreground = foreground
+            self.jobs[job.id] = job
+            self._touch(job)
+            for process in pipeline.processes:
+                self._watch(process)
+
+        if self.supervisor is None:
+            self.supervisor = threading.Thread(target=self._supervise, daemon=True)
+            self.supervisor.start()
+        self._wake()
+        return job
+
+    def remove(self, job: Job):
+        """Stop tracking a job"""
+        with self.changed:
+            self.jobs.pop(job.id, None)
+            if job.id in self.recent:
+                self.recent.remove(job.id)
+
+    def find(self, spec: str) -> Optional[Job]:
+        """
+        Get the job a spec refers to
+
+        Specs are %N, %% or %+ for the current job, %- for the previous one,
+        %prefix for the only job whose command starts with prefix, or the
+        pid of one of the job's processes.
+        """
+        with self.changed:
+            if spec in ("%", "%%", "%+"):
+                return self.jobs.get(self.recent[-1]) if self.recent else None
+            if spec == "%-":
+                return self.jobs.get(self.recent[-2]) if len(self.recent) > 1 else None
+            if spec.startswith("%"):
+                if spec[1:].isdigit():
+                    return self.jobs.get(int(spec[1:]))
+                matches = [job for job in self.jobs.values() if job.command.startswith(spec[1:])]
+                return matches[0] if len(matches) == 1 else None
+            if spec.isdigit():
+                return next((job for job in self.jobs.values() if int(spec) in job.pids), None)
+        return None
+
+    def all_jobs(self) -> List[Job]:
+        with self.changed:
+            return list(self.jobs.values())
+
+    def collect_finished(self) -> List[Tuple[Job, str]]:
+        """
+        Remove the jobs that are over from the table
+
+        Returns:
+            list: (job, description) pairs, described before removal
+        """
+        with self.changed:
+            done = [
+                (job, self.describe(job))
+                for job in self.jobs.values() if job.finished and not job.foreground
+            ]
+            for job, _ in done:
+                self.remove(job)
+        return done
+
+    def describe(self, job: Job, pids: bool = False) -> str:
+        """Line describing a job, as printed by jobs"""
+        mark = " "
+        if self.recent and self.recent[-1] == job.id:
+            mark = "+"
+        elif len(self.recent) > 1 and self.recent[-2] == job.id:
+            mark = "-"
+
+        state = job.state
+        command = f"{job.command} &" if state == "Running" else job.command
+        pid = f" {job.pids[-1]:>5}" if pids and job.pids else ""
+        return f"[{job.id}]{mark}{pid}  {state:<24}{command}"
+
+    def foreground(self, job: Job):
+        """
+        Hand the terminal over to a job and wait for it, resuming it if stopped
+
+        Returns once the job is over or has been stopped again. Built-in
+        stages are waited for as well unless the job stopped.
+        """
+        with self.changed:
+            job.foreground = True
+            self._touch(job)
+            resume = job.stopped
+            job.stopped_pids.clear()
+
+        self._give_terminal(job.pipeline.pgid)
+        try:
+            if resume:
+                self.signal(job, signal.SIGCONT)
+            with self.changed:
+                self.changed.wait_for(lambda: job.pipeline.exited() or job.stopped)
+        finally:
+            self._give_terminal(self.shell_pgid)
+            with self.changed:
+                job.foreground = False
+
+        if not job.stopped:
+            if any(process.returncode == -signal.SIGINT for process in job.pipeline.processes):
+                # Ctrl-C went to the job's processes, its built-ins stop with them
+                job.pipeline.cancel(signal.SIGINT)
+            job.pipeline.wait()
+
+    def background(self, job: Job):
+        """Resume a stopped job in the background"""
+        with self.changed:
+            self._touch(job)
+            job.stopped_pids.clear()
+        self.signal(job, signal.SIGCONT)
+
+    def wait(self, job: Job):
+        """Wait until every stage of a job is over"""
+        with self.changed:
+            self.changed.wait_for(lambda: job.finished)
+
+    def signal(self, job: Job, signum: int):
+        """Send a signal to every process of a job, cancelling its built-ins if it ends processes"""
+        try:
+            job.pipeline.send_signal(signum)
+        except ProcessLookupError:
+            pass
+
+    def _touch(self, job: Job):
+        """Make a job the current one"""
+        if job.id in self.recent:
+            self.recent.remove(job.id)
+        self.recent.append(job.id)
+
+    def _watch(self, process):
+        """Have the supervisor reap a process once it exits"""
+        if not HAS_PIDFD:
+            return
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except ProcessLookupError:
+            # Already gone, reap it now
+            process.poll()
+            return
+        self.selector.register(pidfd, selectors.EVENT_READ, process)
+
+    def _wake(self):
+        try:
+            os.write(self.wake_write, b"\0")
+        except BlockingIOError:
+            # A wakeup is already pending
+            pass
+
+    def _give_terminal(self, pgid: int):
+        """Make pgid the foreground process group of the terminal"""
+        if not self.job_control or pgid is None or self.terminal is None:
+            return
+        # Taking the terminal back from the background is allowed since
+        # the shell ignores SIGTTOU
+        try:
+            os.tcsetpgrp(self.terminal, pgid)
+        except OSError:
+            # The group is already gone
+            pass
+
+    def _supervise(self):
+        """Reap processes and track job states until the shell exits"""
+        while True:
+            with self.changed:
+                # Jobs whose built-in stages outlive their processes can only be polled
+                polling = not HAS_PIDFD or any(
+                    job.pipeline.exited() and not job.finished for job in self.jobs.values()
+                )
+            events = self.selector.select(POLL_INTERVAL if polling else None)
+
+            with self.changed:
+                for key, _ in events:
+                    if key.fd == self.wake_read:
+                        while True:
+                            try:
+                                if not os.read(self.wake_read, 512):
+                                    break
+                            except BlockingIOError:
+                                break
+                        continue
+                    self.selector.unregister(key.fd)
+                    os.close(key.fd)
+                    key.data.wait()
+
+                for job in self.jobs.values():
+                    if not HAS_PIDFD:
+                        for process in job.pipeline.processes:
+                            process.poll()
+                    if self.job_control:
+                        self._check_stops(job)
+
+                self.changed.notify_all()
+
+    def _check_stops(self, job: Job):
+        """Pick up processes of a job being stopped or continued"""
+        for process in job.pipeline.processes:
+            if process.returncode is not None:
+                continue
+            while True:
+                try:
+                    info = os.waitid(os.P_PID, process.pid, os.WSTOPPED | os.WCONTINUED | os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if info is None:
+                    break
+
+                if info.si_code == os.CLD_CONTINUED:
+                    job.stopped_pids.discard(process.pid)
+                elif job.foreground and info.si_status in TTY_STOPS:
+                    # It reached the terminal before it was handed over
+                    self.signal(job, signal.SIGCONT)
+                else:
+                    job.stopped_pids.add(process.pid)
@@ -2,267 +2,239 @@
 My custom lexical analyzer for my shell
 """
 
-from enum import Enum
+import re
+from operator import itemgetter
 from app.lexical.token import Token, TokenType
 
-class State(Enum):
-    NORMAL = "normal"
-    SINGLE_QUOTE = "single_quote"
-    DOUBLE_QUOTE = "double_quote"
-    PIPE = "pipe"
+# Quoted, escaped or plain pieces that a word is made of. A quote or a
+# backslash left open runs to the end of the input, like the old scanner did.
+_PIECE = r"""(?:
+    [^ '"\\|<>&;]+(?!(?<=[12])>)
+  | '[^']*' | "[^"\\]*(?:\\[\s\S][^"\\]*)*" | \\[\s\S]
+)"""
+_OPEN_PIECE = r"""(?:
+    '[^']*\Z | "[^"\\]*(?:\\[\s\S][^"\\]*)*\\?\Z | \\\Z
+)"""
+
+# One alternative per kind of lexeme, spaces in between are skipped. The
+# scanner walks the input a whole word at a time instead of one character
+# at a time, and words are built from slices of the input.
+SCANNER = re.compile(rf"""
+    \ *
+    (?:
+        (?P<word>{_PIECE}+{_OPEN_PIECE}?|{_OPEN_PIECE})
+      | (?P<operator>&&|\|\||;)
+      | (?P<pipe>\|)
+      | (?P<redirect>[12]?>>|[12]?>&\d|[12]?>|<)
+      | (?P<background>&)
+    )
+""", re.VERBOSE)
+
+# Lines without any of these are just words separated by spaces
+SPECIAL = re.compile(r"""['"\\|<>&;]""")
+
+# Quoting inside a word, resolved in a single pass over the word
+QUOTING = re.compile(r"""'([^']*)'?|"([^"\\]*(?:\\[\s\S][^"\\]*)*\\?)"?|\\([\s\S]?)""")
+
+# A word that is one double quoted piece
+DOUBLE_QUOTED = re.compile(r'"([^"\\]*(?:\\[\s\S][^"\\]*)*)"')
+
+# Outside quotes a backslash makes the next character literal
+ESCAPE = re.compile(r"\\([\s\S]?)")
+
+# Inside double quotes a backslash only escapes these characters
+DOUBLE_QUOTE_ESCAPE = re.compile(r'\\([\\"$`\n])')
+
+# Characters that make a word a pattern, unless they are quoted
+GLOB_CHARS = re.compile(r"[*?[]")
+
+# Replacement keeping only the escaped character, cheaper than r"\1"
+ESCAPED_CHAR = itemgetter(1)
+
+# Enum member lookups are comparatively slow, so the hot loop uses these
+WORD = TokenType.WORD
+COMMAND = TokenType.COMMAND
+PIPE = TokenType.PIPE
+BACKGROUND = TokenType.BACKGROUND
+REDIRECT_DUP = TokenType.REDIRECT_DUP
+
+LIST_OPERATORS = {
+    "&&": TokenType.AND,
+    "||": TokenType.OR,
+    ";": TokenType.SEMICOLON,
+}
+
+REDIRECT_TYPES = {
+    ">": TokenType.REDIRECT_OUT,
+    "1>": TokenType.REDIRECT_STDOUT,
+    ">>": TokenType.REDIRECT_APPEND,
+    "1>>": TokenType.REDIRECT_APPEND,
+    "2>": TokenType.REDIRECT_STDERR,
+    "2>>": TokenType.REDIRECT_STDERR_APPEND,
+    "<": TokenType.REDIRECT_IN,
+}
+
+def _word_value(raw: str) -> str:
+    """Get the value of a word by resolving its quotes and escapes"""
+    quote = raw[0]
+    if quote == raw[-1] and len(raw) > 1 and raw.count(quote) == 2:
+        # A single fully quoted piece, the most common case by far
+        if quote == "'":
+            return raw[1:-1]
+        if quote == '"' and "\\" not in raw:
+            return raw[1:-1]
+    if quote == '"' and (match := DOUBLE_QUOTED.fullmatch(raw)):
+        return DOUBLE_QUOTE_ESCAPE.sub(ESCAPED_CHAR, match[1])
+    if "'" not in raw and '"' not in raw:
+        return ESCAPE.sub(ESCAPED_CHAR, raw)
+    return QUOTING.sub(_unquote, raw)
+
+def _glob_pattern(raw: str):
+    """
+    The word as a pattern, with what was quoted or escaped escaped as in
+    app.globbing.escape, or None when none of its glob characters are unquoted
+    """
+    pieces = []
+    unquoted = False
+    end = 0
+    for match in QUOTING.finditer(raw):
+        plain = raw[end:match.start()]
+        unquoted = unquoted or GLOB_CHARS.search(plain) is not None
+        pieces.append(plain)
+        pieces.append(GLOB_CHARS.sub(r"[\g<0>]", _unquote(match)))
+        end = match.end()
+    plain = raw[end:]
+    if not unquoted and GLOB_CHARS.search(plain) is None:
+        return None
+    pieces.append(plain)
+    return "".join(pieces)
+
+def _unquote(match) -> str:
+    """Resolve one quoted or escaped piece of a word"""
+    single, double, escaped = match.groups()
+    if single is not None:
+        return single
+    if double is not None:
+        return DOUBLE_QUOTE_ESCAPE.sub(ESCAPED_CHAR, double) if "\\" in double else double
+    return escaped
 
 class MyLex:
     def __init__(self, input_text: str):
         self.input_text = input_text
-        self.state = State.NORMAL
-        self.escape = False
-        self.current_token = Token()
         self.tokens = []
-        self.position = -1
-        self.cmd_quote = input_text[0] if input_text[0] in ('"',"'") else ''
-
-        self.escape_chars = {
-            "\\",
-            '"',
-            "$",
-            "`",
-            "\n"
-        }
-
-        self.pipe = "|"
-
-    def _finish_token(self, preserve_quote: bool = False, is_command: bool = False):
-        """Finish the current token and add it to tokens list"""
-        if self.current_token.value:
-            self.position += 1
-            self.current_token.position = self.position
-            
-            # If it's a command, set the type accordingly
-            if is_command:
-                self.current_token.type = TokenType.COMMAND
-
-            # Handle preserve of quotes in the command
-            if preserve_quote:
-                self.current_token.value = self.cmd_quote + self.current_token.value + self.cmd_quote
-            self.tokens.append(self.current_token)
-            self.current_token = Token()
-
-    
-    def _add_char(self, char: str):
-        """Add a character to the current token"""
-        self.current_token.value += char    
-    
-    def _process_escaped_char(self, char: str):
-        """Handle an escaped character"""
-        self._add_char(char)
-        self.escape = False
-    
-    def _handle_escape(self, i: int):
-        """Handle escape character (\\)"""
-        if self.state == State.SINGLE_QUOTE:
-            # Inside single quotes, backslash is literal
-            self._add_char("\\")
-        elif self.state == State.DOUBLE_QUOTE:
-            # Inside double quotes, backslash escapes only some next character
-            if i + 1 < len(self.input_text):
-                next_char = self.input_text[i+1]
-                if next_char in self.escape_chars:
-                    self.escape = True
-                else:
-                    self._add_char("\\")
-                
-            else:
-                # If at end of input, treat backslash as literal
-                self._add_char("\\")
-        else:
-            # Set escape flag for next character
-            self.escape = True
-    
-    def _handle_single_quote(self):
-        """Handle single quote character"""
-        if self.state == State.NORMAL:
-            self.state = State.SINGLE_QUOTE
-        elif self.state == State.SINGLE_QUOTE:
-            self.state = State.NORMAL
-        # Inside double quotes, single quote is literal
-        elif self.state == State.DOUBLE_QUOTE:
-            self._add_char("'")
-    
-    def _handle_double_quote(self):
-        """Handle double quote character"""
-        if self.state == State.NORMAL:
-            self.state = State.DOUBLE_QUOTE
-        elif self.state == State.DOUBLE_QUOTE:
-            self.state = State.NORMAL
-        # Inside single quotes, double quote is literal
-        elif self.state == State.SINGLE_QUOTE:
-            self._add_char('"')
-    
-    def _handle_whitespace(self):
-        """Handle whitespace character"""
-        if self.state == State.NORMAL:
-            # Only finish token on whitespace in normal state
-            if not self.tokens: # This means the first token so its a command
-                self._finish_token(preserve_quote=True, is_command=True)
-            else:
-                self._finish_token()
-        elif self.current_token.value and self.state == State.PIPE:
-            self._finish_token(is_command=True)
-            self.state = State.NORMAL
-        elif self.state in (State.SINGLE_QUOTE, State.DOUBLE_QUOTE):
-            # Inside quotes, whitespace is literal
-            self._add_char(" ")
-
-    def _handle_redirect(self,val,append: bool = False, stdout: bool = True, stderr: bool = False):
-        """Handle redirect character """
-        if self.state == State.NORMAL:
-            if stdout and not append:
-                # Finish current token before adding redirect
-                self._finish_token()
-                self.current_token = (
-                    Token(type=TokenType.REDIRECT_OUT, value=val) if val == ">" 
-                    else Token(type=TokenType.REDIRECT_STDOUT, value=val))
-                self._finish_token()
-            
-            elif stdout and append:
-                self._finish_token()
-                self.current_token = Token(type=TokenType.REDIRECT_APPEND, value=val)
-                self._finish_token()
-
-            elif stderr and not append:
-                # Finish current token before adding redirect
-                self._finish_token()
-                self.current_token = Token(type=TokenType.REDIRECT_STDERR, value=val)
-                self._finish_token()
-
-            elif stderr and append:
-                self._finish_token()
-                self.current_token = Token(type=TokenType.REDIRECT_STDERR_APPEND, value=val)
-                self._finish_token()
-            
-        else:
-            # Inside quotes, val is literal
-            self._add_char(val)
-        
-
-    def _handle_pipe(self):
-        """Handle pipe character"""
-        if self.state == State.NORMAL:
-            # Finish current token before adding pipe
-            self._finish_token()
-            self.current_token = Token(type=TokenType.PIPE, value=self.pipe)
-            self._finish_token()
-            self.state = State.PIPE
-        elif self.state == State.SINGLE_QUOTE:
-            # Inside quotes, pipe is literal
-            self._add_char(self.pipe)
-
-    
+        # Token position -> (start, end) in the input, for &, &&, || and ;
+        self.operator_spans = {}
+        self.cmd_quote = input_text[0] if input_text[:1] in ('"', "'") else ''
+
     def _process(self):
-        """Main processing method"""
-        i = 0
-        while i < len(self.input_text):
-            char = self.input_text[i]
-            
-            # Handle escaped characters first
-            if self.escape:
-                self._process_escaped_char(char)
-                i += 1
-                continue
-            
-            # Handle escape character
-            if char == "\\":
-                self._handle_escape(i)
-                i += 1
-                continue
+        """
+        Main processing method
 
-            # Handle pipe character
-            if char == self.pipe:
-                self._handle_pipe()
-                i += 1
-                continue
-            
-            # Handle redirect out and redirect append
-            if char == "1" and i + 1 < len(self.input_text) and self.input_text[i + 1] == ">":
-                if i + 2 < len(self.input_text) and self.input_text[i + 2] == ">":
-                    self._handle_redirect(val="1>>", append=True)
-                    i += 3
-                else:
-                    self._handle_redirect(val="1>")
-                    i += 2
-                continue
-            if char == ">":
-                if i + 1 < len(self.input_text) and self.input_text[i + 1] == ">":
-                    self._handle_redirect(val=">>", append=True)
-                    i += 2
-                else:
-                    self._handle_redirect(val=">")
-                    i += 1
-                continue
+        Token semantics:
+            - A space ends a word, except inside quotes
+            - Single quotes keep everything literally
+            - Double quotes keep everything literally except backslash
+              escapes of \\ " $ ` and newline
+            - Outside quotes a backslash makes the next character literal
+            - |, &, &&, ||, ;, <, >, >>, 1>, 1>>, 2>, 2>>, and >&N / 1>&N /
+              2>&N end the current word and become tokens of their own
+            - The first word of the line is a COMMAND when a space follows
+              it, and keeps the quote it started with; the first word after
+              a pipe or a list operator is always a COMMAND
+            - Words that end up empty, like '', are dropped
+            - Arguments with an unquoted *, ? or [ get their pattern in
+              Token.glob, for the shell to expand them when they run
+        """
+        text = self.input_text
+        tokens = self.tokens
+
+        if not SPECIAL.search(text):
+            # Fast path: nothing but words, split them all at once
+            words = [word for word in text.split(" ") if word]
+            if words:
+                types = [WORD] * len(words)
+                if text.lstrip(" ")[len(words[0]):len(words[0]) + 1] == " ":
+                    # This means the first token so its a command
+                    types[0] = COMMAND
+                tokens.extend(map(Token, types, words, range(len(words))))
+                if GLOB_CHARS.search(text):
+                    # A lone word is still the command, whatever its type
+                    for token in tokens[1:]:
+                        if token.type is WORD and GLOB_CHARS.search(token.value):
+                            token.glob = token.value
+            return
+
+        append = tokens.append
+        spans = self.operator_spans
+        after_pipe = False     # the next word is the command of a pipeline stage
+
+        for match in SCANNER.finditer(text):
+            value = match.group("word")
+
+            if value is not None:
+                glob = None
+                if "'" in value or '"' in value or "\\" in value:
+                    if GLOB_CHARS.search(value):
+                        glob = _glob_pattern(value)
+                    value = _word_value(value)
+                    if not value:
+                        continue
+                elif GLOB_CHARS.search(value):
+                    glob = value
 
-            # Handle stderr
-            if char == "2" and i + 1 < len(self.input_text) and self.input_text[i + 1] == ">":
-                if i + 2 < len(self.input_text) and self.input_text[i + 2] == ">":
-                    self._handle_redirect(val="2>>", append=True, stdout=False, stderr=True)
-                    i += 3
+                if after_pipe:
+                    append(Token(COMMAND, value, len(tokens)))
+                    after_pipe = False
+                elif not tokens and text[match.end():match.end() + 1] == " ":
+                    # This means the first token so its a command
+                    append(Token(COMMAND, self.cmd_quote + value + self.cmd_quote, 0))
                 else:
-                    self._handle_redirect(val="2>", stdout=False ,stderr=True)
-                    i += 2
+                    append(Token(WORD, value, len(tokens), glob))
                 continue
-            
-            # Handle quote characters
-            if char == "'":
-                self._handle_single_quote()
-                i += 1
+
+            value = match.group("operator")
+            if value is not None:
+                spans[len(tokens)] = match.span("operator")
+                append(Token(LIST_OPERATORS[value], value, len(tokens)))
+                after_pipe = True
                 continue
-            
-            if char == '"':
-                self._handle_double_quote()
-                i += 1
+
+            value = match.group("pipe")
+            if value is not None:
+                append(Token(PIPE, value, len(tokens)))
+                after_pipe = True
                 continue
-            
-            # Handle whitespace
-            if char == " ":
-                self._handle_whitespace()
-                i += 1
+
+            value = match.group("background")
+            if value is not None:
+                spans[len(tokens)] = match.span("background")
+                append(Token(BACKGROUND, value, len(tokens)))
+                after_pipe = True
                 continue
-            
-            # Regular character - add to current token
-            self._add_char(char)
-            i += 1
-        
-        # Finish the final token if it exists
-        # Check if the last token is a command
-        if self.state == State.PIPE and self.current_token.value:
-            self._finish_token(is_command=True)
-        else:
-            self._finish_token()
-    
-    def parse(self) -> list[str]:
+
+            value = match.group("redirect")
+            token_type = REDIRECT_DUP if "&" in value else REDIRECT_TYPES[value]
+            append(Token(token_type, value, len(tokens)))
+
+    def parse(self) -> list[Token]:
         """
         Parse the input and return list of tokens [command, arg1, arg2, ...]
         """
         # Reset state for fresh parsing
-        self.state = State.NORMAL
-        self.escape = False
-        self.current_token = Token()
         self.tokens = []
-        
+        self.operator_spans = {}
+
         # Process the input
         self._process()
-        
-        # Return empty list if no tokens
-        if not self.tokens:
-            return []
-        
+
         return self.tokens
-    
+
     def get_command(self) -> str:
         """Get the command (first token)"""
         tokens = self.parse()
         return tokens[0] if tokens else ""
-    
+
     def get_args(self) -> list[str]:
         """Get the arguments (all tokens except first)"""
         tokens = self.parse()
-        return tokens[1:] if len(tokens) > 1 else []
\ No newline at end of file
+        return tokens[1:] if len(tokens) > 1 else []
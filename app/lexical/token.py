@@ -8,15 +8,30 @@ class TokenType(Enum):
     REDIRECT_STDOUT_APPEND = "redirect_stdout_append"
     REDIRECT_STDERR = "redirect_error"
     REDIRECT_STDERR_APPEND = "redirect_error_append"
+    REDIRECT_IN = "redirect_in"
+    REDIRECT_DUP = "redirect_dup"
     PIPE = "pipe"
+    BACKGROUND = "background"
+    AND = "and"
+    OR = "or"
+    SEMICOLON = "semicolon"
     COMMAND = "command"
     NUMBER = "number"
 
+    # Members are singletons compared by identity, so hash them the same
+    # way; Enum's own __hash__ is a Python call on every set or dict lookup
+    __hash__ = object.__hash__
+
 class Token:
-    def __init__(self, type: TokenType = TokenType.WORD, value: str = "", position: int = 0):
+    # Scripts can produce millions of tokens, keep them free of a __dict__
+    __slots__ = ("type", "value", "position", "glob")
+
+    def __init__(self, type: TokenType = TokenType.WORD, value: str = "", position: int = 0, glob: str = None):
         self.type = type
         self.value = value
         self.position = position
+        # The word as a pattern, when it has unquoted *, ? or [, see app.globbing
+        self.glob = glob
 
     def __repr__(self):
         return f"Token(type={self.type}, value='{self.value}', position={self.position})"
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+Timeouts and resource limits of the commands the shell runs
+
+A pipeline under a timeout runs in a process group of its own, like
+coreutils timeout puts its command in one, so the signal reaches every
+process it started, down to grandchildren. The pipeline then gets a grace
+period to exit before the whole group is killed. Resource limits are set
+with setrlimit in each child between fork and exec, so the shell itself
+is never limited. The same goes for the stop signals a shell with job
+control ignores, which its children get back at their defaults.
+
+That takes a preexec_fn, which Python documents as unsafe in a process
+with threads, like the shell's built-in stages and job supervisor: the
+child is forked with whatever locks those threads held, and could
+deadlock on one. The risk is kept small rather than avoided. The function
+only calls setrlimit and signal over lists built beforehand, and is only
+passed while a ulimit is set or under job control. prlimit on the spawned
+child would be safe for limits, but Popen returns after the exec, so the
+command could run unlimited first.
+"""
+
+import resource
+import signal
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Exit status of a pipeline that ran out of time, the one of coreutils timeout
+TIMEOUT_STATUS = 124
+
+# Exit status of a timed out pipeline that had to be killed, which coreutils
+# timeout reports as its own death by SIGKILL rather than as a timeout
+KILLED_STATUS = 128 + signal.SIGKILL
+
+# Stop signals a shell with job control ignores itself, so Ctrl-Z and
+# terminal access only ever stop its jobs
+JOB_CONTROL_SIGNALS = (signal.SIGTSTP, signal.SIGTTIN, signal.SIGTTOU)
+
+# Seconds a timed out pipeline has to exit before it is killed
+DEFAULT_GRACE = 5.0
+
+# Multipliers of the suffixes a duration can have
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# ulimit flag -> (resource, description, unit size in bytes or 1)
+LIMITS = {
+    "t": (resource.RLIMIT_CPU, "cpu time (seconds)", 1),
+    "v": (resource.RLIMIT_AS, "virtual memory (kbytes)", 1024),
+    "n": (resource.RLIMIT_NOFILE, "open files", 1),
+}
+
+UNLIMITED = "unlimited"
+
+
+class Timeout(NamedTuple):
+    """How long a pipeline may run, and how it is stopped once it can't"""
+    duration: float
+    # Seconds between the signal and SIGKILL, None to never kill
+    grace: Optional[float] = DEFAULT_GRACE
+    signal: int = signal.SIGTERM
+
+
+def parse_duration(text: str) -> float:
+    """
+    Seconds in a duration like coreutils timeout takes them: 1.5, 30s, 2m
+
+    Raises:
+        ValueError: if text isn't a non-negative number with an optional suffix
+    """
+    number, unit = (text[:-1], text[-1]) if text[-1:] in DURATION_UNITS else (text, "s")
+    try:
+        seconds = float(number) * DURATION_UNITS[unit]
+    except ValueError:
+        seconds = -1.0
+    if not seconds >= 0 or seconds == float("inf"):
+        raise ValueError(f"invalid time interval '{text}'")
+    return seconds
+
+
+def parse_signal(text: str) -> signal.Signals:
+    """
+    Signal from a number or a name, with or without SIG, like 15, TERM or SIGTERM
+
+    Raises:
+        ValueError: if there is no such signal
+    """
+    name = text.upper()
+    try:
+        if text.isdigit():
+            return signal.Signals(int(text))
+        return signal.Signals[name if name.startswith("SIG") else "SIG" + name]
+    except (KeyError, ValueError):
+        raise ValueError(f"{text}: invalid signal")
+
+
+def parse_timeout(words: List[str]) -> Optional[Tuple[Timeout, int]]:
+    """
+    Parse the arguments of a timeout prefix: [-k grace] [-s signal] duration
+
+    Returns:
+        tuple: (Timeout, how many words it took), or None when the words
+            aren't a prefix followed by a command
+
+    Raises:
+        ValueError: if a duration or signal is invalid
+    """
+    grace, signum = DEFAULT_GRACE, signal.SIGTERM
+    i = 0
+    while i < len(words) and words[i] in ("-k", "-s"):
+        if i + 1 == len(words):
+            return None
+        if words[i] == "-k":
+            grace = parse_duration(words[i + 1])
+        else:
+            signum = parse_signal(words[i + 1])
+        i += 2
+    if i < len(words) and words[i] == "--":
+        i += 1
+    if i + 1 >= len(words) or words[i].startswith("-"):
+        return None
+    return Timeout(parse_duration(words[i]), grace, signum), i + 1
+
+
+def format_limit(value: int, unit: int) -> str:
+    return UNLIMITED if value == resource.RLIM_INFINITY else str(value // unit)
+
+
+def child_setup(limits: Dict[int, int], default_signals: Tuple[int, ...] = ()):
+    """
+    preexec_fn restoring signals to their default action and applying
+    resource limits in a child before it execs
+
+    Both the soft and the hard limit are set, like bash's ulimit does. It
+    runs in a child forked from a threaded process, see the module
+    docstring, so it must stay bare loops of signal and setrlimit calls.
+    """
+    signals = list(default_signals)
+    items = list(limits.items())
+
+    def apply():
+        for signum in signals:
+            signal.signal(signum, signal.SIG_DFL)
+        for limit, value in items:
+            resource.setrlimit(limit, (value, value))
+
+    return apply
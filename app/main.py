@@ -1,24 +1,99 @@
 import sys
-from app.commands import CommandRegistry
-from app.lexical import MyLex
-from app.parser.pipe import PipeParser
-from app.pipe import PipeProcessor
-from app.history import HistoryManager
+from app.startup import StartupProfile
 
-from app.utils import display_welcome_message
+USAGE = "usage: echo-craft.sh [--startup-profile] [-c command | script]\n"
 
 def main():
-    history_manager = HistoryManager()
-    registry = CommandRegistry(history_manager)
-    pipe_parser = PipeParser()
-    pipe_processor = PipeProcessor(registry)
+    args = sys.argv[1:]
+    profile = StartupProfile.from_args(args)
 
-    display_welcome_message()
+    if args or not sys.stdin.isatty():
+        # Batch mode: skip readline, history and the banner entirely
+        sys.exit(run_batch(args, profile))
 
-    while True:
+    interactive(profile)
+
+def import_shell():
+    """
+    Import the shell, which is most of what starting up costs
+
+    Done here rather than at the top so --startup-profile can time it.
+    """
+    from app.shell import Shell
+    return Shell
+
+def run_batch(args, profile: StartupProfile = None) -> int:
+    """
+    Run commands without prompting
+
+    Args:
+        args: ["-c", command], [script] or [] to read commands from stdin
+        profile: Startup profile, reported before the first line runs
+
+    Returns:
+        int: exit status of the last command
+    """
+    profile = profile or StartupProfile()
+    with profile.phase("imports"):
+        Shell = import_shell()
+    with profile.phase("shell"):
+        shell = Shell()
+    # Output goes straight to our stdout, nothing is held back
+    shell.registry.options.stream = True
+    profile.report()
+
+    if not args:
+        return shell.run_lines(sys.stdin)
+
+    if args[0] == "-c":
+        if len(args) < 2:
+            sys.stderr.write(f"-c: option requires an argument\n{USAGE}")
+            return 2
+        return shell.run_lines(args[1].splitlines())
+
+    try:
+        with open(args[0]) as script:
+            return shell.run_lines(script)
+    except OSError as e:
+        sys.stderr.write(f"{args[0]}: {e.strerror}\n")
+        return 127
+
+def interactive(profile: StartupProfile = None):
+    profile = profile or StartupProfile()
+    with profile.phase("imports"):
+        Shell = import_shell()
+        from app.history import HistoryManager
+        from app.utils import display_welcome_message
+    with profile.phase("shell"):
+        history_manager = HistoryManager()
+        shell = Shell(history_manager, job_control=sys.stdin.isatty())
+
+    # Stream output to the terminal by default, capture it otherwise
+    shell.registry.options.stream = sys.stdout.isatty()
+
+    with profile.phase("banner"):
+        display_welcome_message()
+    if profile.enabled:
+        # Otherwise done by the first prompt, timed apart when profiling
+        with profile.phase("readline and history"):
+            history_manager.readline
+    profile.report()
+
+    # Command picked from the history, put on the next prompt
+    prefill = None
+    while not shell.exiting:
         try:
+            # Report jobs that finished in the background
+            shell.report_jobs()
+
             # Get user input with history support
-            raw_input = history_manager.get_input("$ ")
+            raw_input = history_manager.get_input("$ ", prefill)
+            prefill = None
+
+            # Ctrl-R: pick a command from the history rather than run the line
+            if history_manager.is_pick_request(raw_input):
+                prefill = history_manager.pick(raw_input, "$ ")
+                continue
 
             # Handle empty input
             if not raw_input.strip():
@@ -27,40 +102,13 @@ def main():
             # Add command to history before processing
             history_manager.add_command(raw_input)
 
-            # Tokenize
-            tokens = MyLex(raw_input).parse()
-
-            if not tokens:
-                continue
+            status = shell.run_line(raw_input)
+            history_manager.finish_command(status)
 
-            # Parse Pipes
-            pipe_commands = pipe_parser.parse(tokens)
-
-            # Execute pipeline (automatically handles all commands with timeout)
-            exit_code, stdout_output, stderr_output = pipe_processor.execute_pipeline(pipe_commands)
-            
-            # Handle output and errors
-            if exit_code == -1:
-                # Exit signal from built-in command
-                break
-            elif exit_code != 0:
-                # Command failed
-                if stderr_output:
-                    print(stderr_output, end="", file=sys.stderr)
-                    sys.stderr.flush()
-            
-                if stdout_output and not stderr_output:
-                    print(stdout_output, end="")
-                    sys.stdout.flush()
-            else:
-                # Command succeeded
-                if stdout_output:
-                    print(stdout_output, end="")
-                    sys.stdout.flush()
-                    
         except KeyboardInterrupt:
             # Handle Ctrl+C gracefully
             print("\n^C")
+            history_manager.finish_command(130)
             continue
         except EOFError:
             # Handle Ctrl+D (EOF)
@@ -69,11 +117,8 @@ def main():
         except Exception as e:
             # Handle unexpected errors
             print(f"Shell error: {e}", file=sys.stderr)
+            history_manager.finish_command(1)
             continue
 
-        finally:
-            # Save history on exit
-            pass
-
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,29 @@
+class ShellOptions:
+    """Session-wide shell options, toggled with the `set` builtin"""
+
+    NAMES = ("pipefail", "stream", "trace")
+
+    def __init__(self):
+        # A pipeline returns the status of its last failing stage instead
+        # of the status of its last stage
+        self.pipefail = False
+        # Command output goes straight to the terminal as it is produced
+        # instead of being collected and printed once the command exits
+        self.stream = False
+        # Every line run is recorded by the tracer, see app.trace
+        self.trace = False
+        # Timeout every pipeline runs under unless it has its own, set
+        # with `timeout -d`
+        self.timeout = None
+        # Resource limits set in every external command, set with ulimit
+        self.limits = {}
+
+    def set_option(self, name: str, value: bool):
+        """Turn an option on or off"""
+        if name not in self.NAMES:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def items(self) -> list:
+        """Get (name, value) pairs for every option"""
+        return [(name, getattr(self, name)) for name in self.NAMES]
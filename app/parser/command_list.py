@@ -0,0 +1,76 @@
+from typing import List
+from app.lexical.token import Token, TokenType
+
+AND = TokenType.AND
+OR = TokenType.OR
+SEMICOLON = TokenType.SEMICOLON
+BACKGROUND = TokenType.BACKGROUND
+
+# Token types that end a pipeline, the ones that also end an and-or list
+# decide how it runs
+LIST_SEPARATORS = frozenset({AND, OR, SEMICOLON, BACKGROUND})
+LIST_TERMINATORS = frozenset({SEMICOLON, BACKGROUND})
+
+class AndOrList:
+    """Pipelines chained by && and ||, ended by ; or &"""
+    __slots__ = ("pipelines", "operators", "background")
+
+    def __init__(self, pipelines: List[List[Token]], operators: List[TokenType], background: bool = False):
+        # operators[i] decides whether pipelines[i + 1] runs after pipelines[i]
+        self.pipelines = pipelines
+        self.operators = operators
+        self.background = background
+
+    def __repr__(self):
+        pipelines = [" ".join(token.value for token in pipeline) for pipeline in self.pipelines]
+        return f"AndOrList({pipelines!r}, {[op.value for op in self.operators]!r}, background={self.background})"
+
+class ListParser:
+    """Splits tokens into and-or lists of pipeline tokens"""
+
+    def parse(self, tokens: List[Token]) -> List[AndOrList]:
+        """
+        Split a line into its and-or lists
+
+        The tokens are walked once and sliced between separators, nothing
+        nests, so long chains cost time linear in their length.
+
+        Raises:
+            ValueError: on a separator with no pipeline before it, or a line
+                ending in && or ||
+        """
+        if not tokens:
+            return []
+
+        separators = [i for i, token in enumerate(tokens) if token.type in LIST_SEPARATORS]
+        if not separators:
+            # A single pipeline, the most common line by far
+            return [AndOrList([tokens], [])]
+
+        lists = []
+        pipelines, operators = [], []
+        start = 0
+
+        for end in separators:
+            separator = tokens[end]
+            if end == start:
+                raise ValueError(f"syntax error near unexpected token `{separator.value}'")
+
+            pipelines.append(tokens[start:end])
+            start = end + 1
+
+            if separator.type in LIST_TERMINATORS:
+                lists.append(AndOrList(pipelines, operators, separator.type is BACKGROUND))
+                pipelines, operators = [], []
+            else:
+                operators.append(separator.type)
+
+        if start < len(tokens):
+            pipelines.append(tokens[start:])
+        elif operators:
+            # Nothing follows the last && or ||
+            raise ValueError("syntax error: unexpected end of line")
+
+        if pipelines:
+            lists.append(AndOrList(pipelines, operators))
+        return lists
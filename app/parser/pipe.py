@@ -1,52 +1,49 @@
 from app.lexical.token import TokenType, Token
 from typing import List
+from app.parser.command_list import LIST_SEPARATORS
+
+PIPE = TokenType.PIPE
 
 class PipeCommand:
     """Represents a single command in a pipeline"""
+    __slots__ = ("command", "args")
+
     def __init__(self, command : Token, args : list[Token]):
         self.command = command
         self.args = args
-    
+
     def __repr__(self):
-        return f"PipeCommand({self.command_name}, {self.args})"
+        return f"PipeCommand({self.command.value!r}, {[arg.value for arg in self.args]!r})"
 
 class PipeParser:
     """Parses tokens into pipeline commands"""
-    
+
     def parse(self, tokens: List[Token]) -> List[PipeCommand]:
         """Split tokens into individual commands separated by pipes"""
         if not tokens:
             return []
-        
+
+        for token in tokens:
+            if token.type in LIST_SEPARATORS:
+                # Lists are split up by ListParser before getting here
+                raise ValueError(f"syntax error near unexpected token `{token.value}'")
+
         if not self.is_pipeline(tokens):
             # Single command, no pipes
-            command = tokens[0]
-            args = tokens[1:] if len(tokens) > 1 else []
-            return [PipeCommand(command, args)]
-        
-        # Parse pipeline
+            return [PipeCommand(tokens[0], tokens[1:])]
+
+        # Parse pipeline, slicing the commands out between the pipes
         commands = []
-        current_command_tokens = []
-        
-        for token in tokens:
-            if token.type == TokenType.PIPE:
-                # End of current command, start of next
-                if current_command_tokens:
-                    cmd = current_command_tokens[0]
-                    cmd_args = current_command_tokens[1:] if len(current_command_tokens) > 1 else []
-                    commands.append(PipeCommand(cmd, cmd_args))
-                    current_command_tokens = []
-            else:
-                current_command_tokens.append(token)
-        
-        # Add the last command
-        if current_command_tokens:
-            cmd = current_command_tokens[0]
-            cmd_args = current_command_tokens[1:] if len(current_command_tokens) > 1 else []
-            commands.append(PipeCommand(cmd, cmd_args))
-        
+        start = 0
+
+        for end in [i for i, token in enumerate(tokens) if token.type is PIPE] + [len(tokens)]:
+            # Empty commands, like in `a | | b`, are skipped
+            if end > start:
+                commands.append(PipeCommand(tokens[start], tokens[start + 1:end]))
+            start = end + 1
+
         return commands
-    
-    def is_pipeline(self, tokens: List[TokenType]) -> bool:
+
+    def is_pipeline(self, tokens: List[Token]) -> bool:
         """Check if tokens represent a pipeline"""
-        return any(token.type == TokenType.PIPE for token in tokens)
\ No newline at end of file
+        return any(token.type is PIPE for token in tokens)
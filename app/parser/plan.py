@@ -0,0 +1,203 @@
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+from app.globbing import Globber
+from app.lexical import MyLex
+from app.limits import Timeout, parse_timeout
+from app.lexical.token import Token, TokenType
+from app.parser.command_list import ListParser
+from app.parser.pipe import PipeParser
+from app.parser.redirect import RedirectParser
+
+COMMAND = TokenType.COMMAND
+
+class StagePlan(NamedTuple):
+    """A fully parsed command of a pipeline, ready to execute"""
+    command: Token
+    args: Tuple[Token, ...]
+    redirects: Tuple
+
+class PipelinePlan(NamedTuple):
+    """A fully parsed pipeline"""
+    stages: Tuple[StagePlan, ...]
+    # The pipeline as it was typed, for job listings
+    text: str = ""
+    # Whether the pipeline was prefixed with the time keyword
+    timed: bool = False
+    # Timeout of a pipeline prefixed with the timeout keyword
+    timeout: Optional[Timeout] = None
+    # Tokens of a pipeline with patterns to expand, parsed again into its
+    # stages every time it runs, see Planner.expand
+    globs: Optional[Tuple[Token, ...]] = None
+
+class AndOrPlan(NamedTuple):
+    """Pipelines chained by && and ||"""
+    pipelines: Tuple[PipelinePlan, ...]
+    # TokenType.AND or TokenType.OR between each pipeline and the next
+    operators: Tuple[TokenType, ...] = ()
+    # Whether the list ended with &
+    background: bool = False
+
+class ListPlan(NamedTuple):
+    """A fully parsed command line, shared between runs of the same line"""
+    lists: Tuple[AndOrPlan, ...]
+
+class PlanCache:
+    """Bounded LRU cache of pipeline plans keyed by the raw command line"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, raw_input: str):
+        """Get the cached plan for a line, or None"""
+        plan = self.plans.get(raw_input)
+        if plan is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.plans.move_to_end(raw_input)
+        return plan
+
+    def put(self, raw_input: str, plan: ListPlan):
+        """Cache the plan of a line, evicting the least recently used ones"""
+        if self.max_size <= 0:
+            return
+
+        self.plans[raw_input] = plan
+        self.plans.move_to_end(raw_input)
+        self._trim()
+
+    def resize(self, max_size: int):
+        """Change how many plans are kept"""
+        self.max_size = max_size
+        self._trim()
+
+    def clear(self):
+        """Drop every cached plan and reset the counters"""
+        self.plans.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.plans)
+
+    def _trim(self):
+        while len(self.plans) > max(self.max_size, 0):
+            self.plans.popitem(last=False)
+            self.evictions += 1
+
+class Planner:
+    """Turns raw command lines into list plans, reusing cached ones"""
+
+    def __init__(self, cache: PlanCache = None, tracer=None):
+        """
+        Args:
+            cache: Cache of plans by command line
+            tracer: Tracer told how long lines that missed the cache took
+                to tokenize and parse
+        """
+        self.cache = cache if cache is not None else PlanCache()
+        self.tracer = tracer
+        self.list_parser = ListParser()
+        self.pipe_parser = PipeParser()
+        self.redirect_parser = RedirectParser()
+        self.globber = Globber()
+
+    def plan(self, raw_input: str) -> ListPlan:
+        """
+        Tokenize and parse a command line, or fetch its plan from the cache
+
+        Plans are made of tuples and are never modified once built, so the
+        same plan can safely be executed any number of times.
+
+        Returns:
+            ListPlan: the parsed line, with no lists if it was empty
+        """
+        plan = self.cache.get(raw_input)
+        if plan is not None:
+            return plan
+
+        tracing = self.tracer is not None and self.tracer.enabled
+        if tracing:
+            started = time.perf_counter()
+
+        # Tokenize
+        lexer = MyLex(raw_input)
+        tokens = lexer.parse()
+        spans = lexer.operator_spans
+
+        if tracing:
+            lexed = time.perf_counter()
+
+        # Split the line into and-or lists, then plan each of their pipelines
+        lists = []
+        for and_or in self.list_parser.parse(tokens):
+            pipelines = []
+            for pipeline_tokens in and_or.pipelines:
+                # The text between the list operators around the pipeline
+                start = spans.get(pipeline_tokens[0].position - 1, (0, 0))[1]
+                end = spans.get(pipeline_tokens[-1].position + 1, (len(raw_input),))[0]
+                pipelines.append(self.plan_pipeline(pipeline_tokens, raw_input[start:end].strip()))
+            if and_or.background and len(pipelines) > 1:
+                # Jobs are pipelines, running a chain apart would take a subshell
+                raise ValueError("&& and || lists can't run in the background")
+            lists.append(AndOrPlan(tuple(pipelines), tuple(and_or.operators), and_or.background))
+
+        plan = ListPlan(tuple(lists))
+        self.cache.put(raw_input, plan)
+        if tracing:
+            self.tracer.planned(lexed - started, time.perf_counter() - lexed)
+        return plan
+
+    def plan_pipeline(self, tokens: List[Token], text: str = "") -> PipelinePlan:
+        """Parse the pipes of a pipeline, then the redirects of every command"""
+        # time is a keyword in front of a whole pipeline, not a command
+        timed = len(tokens) > 1 and tokens[0].type is COMMAND and tokens[0].value == "time"
+        if timed:
+            tokens = tokens[1:]
+
+        # So is timeout when a duration and a command follow it, otherwise
+        # the timeout built-in gets it
+        timeout = None
+        if tokens and tokens[0].value == "timeout" and (tokens[0].type is COMMAND or timed):
+            try:
+                parsed = parse_timeout([token.value for token in tokens[1:]])
+            except ValueError as e:
+                raise ValueError(f"timeout: {e}")
+            if parsed is not None:
+                timeout, taken = parsed
+                tokens = tokens[taken + 1:]
+
+        # Parsed as is all the same, so syntax errors show before it runs
+        globs = tuple(tokens) if any(token.glob is not None for token in tokens) else None
+        return PipelinePlan(self.parse_stages(tokens), text, timed, timeout, globs)
+
+    def parse_stages(self, tokens: List[Token]) -> Tuple[StagePlan, ...]:
+        """Parse the pipes of a pipeline, then the redirects of every command"""
+        stages = []
+        for pipe_command in self.pipe_parser.parse(tokens):
+            command_tokens, redirect_instructions = self.redirect_parser.parse(
+                [pipe_command.command] + pipe_command.args
+            )
+            if not command_tokens:
+                raise ValueError("syntax error: missing command")
+
+            stages.append(StagePlan(command_tokens[0], tuple(command_tokens[1:]), tuple(redirect_instructions)))
+        return tuple(stages)
+
+    def expand(self, plan: PipelinePlan) -> PipelinePlan:
+        """
+        The pipeline with its patterns expanded against the filesystem as it
+        is now, right before it runs
+
+        Only the tokens were kept from planning, they go through the
+        globber and then the parsers again. Plans without patterns are
+        returned as they are.
+        """
+        if plan.globs is None:
+            return plan
+        return plan._replace(stages=self.parse_stages(self.globber.expand(plan.globs)), globs=None)
@@ -1,75 +1,92 @@
 from typing import List
-from app.lexical.token import TokenType
+from app.lexical.token import Token, TokenType
 
 class RedirectInstruction:
     """Represents a single redirect instruction"""
+    __slots__ = ("redirect_type", "target", "stream", "append", "duplicate")
+
+    # File descriptor behind each stream
+    FDS = {'stdin': 0, 'stdout': 1, 'stderr': 2}
+
     def __init__(self, redirect_type, target, stream='stdout'):
         self.redirect_type = redirect_type
-        self.target = target  
-        self.stream = stream 
+        self.target = target
+        self.stream = stream
         self.append = redirect_type.endswith('>>')
+        # For '>&' the target is a file descriptor number instead of a file
+        self.duplicate = redirect_type == '>&'
+
+    @property
+    def fd(self) -> int:
+        """File descriptor the redirect applies to"""
+        return self.FDS[self.stream]
 
     def __str__(self):
         return f"RedirectInstruction({self.redirect_type} -> {self.target})"
 
+# Redirect operator of each redirect token type, with the stream it affects
+REDIRECT_OPERATORS = {
+    TokenType.REDIRECT_OUT: ('>', 'stdout'),
+    TokenType.REDIRECT_APPEND: ('>>', 'stdout'),
+    TokenType.REDIRECT_STDOUT: ('1>', 'stdout'),
+    TokenType.REDIRECT_STDOUT_APPEND: ('1>>', 'stdout'),
+    TokenType.REDIRECT_STDERR: ('2>', 'stderr'),
+    TokenType.REDIRECT_STDERR_APPEND: ('2>>', 'stderr'),
+    TokenType.REDIRECT_IN: ('<', 'stdin'),
+}
+
+# Every token type that starts a redirect, checked once per token
+REDIRECT_TYPES = frozenset(REDIRECT_OPERATORS) | {TokenType.REDIRECT_DUP}
+
+REDIRECT_DUP = TokenType.REDIRECT_DUP
+
 class RedirectParser:
     """Parses tokens into command tokens and redirect instructions"""
-    
+
     def __init__(self):
         # Define which token types are redirect operators
-        self.redirect_operators = {
-            'REDIRECT_OUT': '>',
-            'REDIRECT_APPEND': '>>',
-            'REDIRECT_STDOUT': '1>',
-            'REDIRECT_STDOUT_APPEND': '1>>',
-            'REDIRECT_STDERR': '2>',
-            'REDIRECT_STDERR_APPEND': '2>>'
-        }
-    
-    def parse(self, tokens: List[TokenType]) -> tuple:
+        self.redirect_operators = REDIRECT_OPERATORS
+
+    def parse(self, tokens: List[Token]) -> tuple:
         """Split tokens into command_tokens and redirect_instructions"""
+        if not self.has_redirects(tokens):
+            # Nothing to split out, by far the most common case
+            return list(tokens), []
+
         command_tokens = []
         redirect_instructions = []
-        
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            token_type_name = token.type.name
-            
-            # Check if this is a redirect operator
-            if token_type_name in self.redirect_operators:
-                # We need the next token as the target
-                if i + 1 >= len(tokens):
-                    raise ValueError(f"Redirect operator '{self.redirect_operators[token_type_name]}' missing target")
-                
-                target_token = tokens[i + 1]
-                redirect_type = self.redirect_operators[token_type_name]
-
-                stream = self._get_stream_type(token_type_name)
-                
+
+        remaining = iter(tokens)
+        for token in remaining:
+            token_type = token.type
+
+            if token_type not in REDIRECT_TYPES:
+                # Regular command token
+                command_tokens.append(token)
+
+            elif token_type is REDIRECT_DUP:
+                # The operator carries both descriptors, e.g. 2>&1
+                source, target = token.value.split('>&')
+                if target not in ('1', '2'):
+                    raise ValueError(f"{token.value}: bad file descriptor")
+
+                stream = 'stderr' if source == '2' else 'stdout'
+                redirect_instructions.append(RedirectInstruction('>&', target, stream))
+
+            else:
+                redirect_type, stream = self.redirect_operators[token_type]
+
+                # We need the next token as the target, it is consumed here
+                target_token = next(remaining, None)
+                if target_token is None:
+                    raise ValueError(f"Redirect operator '{redirect_type}' missing target")
+
                 # Create redirect instruction
                 instruction = RedirectInstruction(redirect_type, target_token.value, stream)
                 redirect_instructions.append(instruction)
-                
-                # Skip both the operator and target
-                i += 2
-            else:
-                # Regular command token
-                command_tokens.append(token)
-                i += 1
-        
+
         return command_tokens, redirect_instructions
-    
-    def has_redirects(self, tokens: List[TokenType]) -> bool:
+
+    def has_redirects(self, tokens: List[Token]) -> bool:
         """Quick check if tokens contain any redirects"""
-        for token in tokens:
-            if token.type.name in self.redirect_operators:
-                return True
-        return False
-    
-    def _get_stream_type(self, token_type_name: str) -> str:
-        """Determine which stream the redirect affects"""
-        if token_type_name in ['REDIRECT_STDERR', 'REDIRECT_STDERR_APPEND']:
-            return 'stderr'
-        else:
-            return 'stdout'
\ No newline at end of file
+        return not REDIRECT_TYPES.isdisjoint([token.type for token in tokens])
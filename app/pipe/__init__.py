@@ -1,119 +1,720 @@
+import io
+import os
+import resource
+import selectors
+import signal
 import subprocess
-from typing import List, Tuple
+import threading
+import time
+from typing import List, NamedTuple, Tuple
 from app.parser.redirect import RedirectParser
 from app.redirect import RedirectProcessor
-from app.commands import CommandResult
-from app.lexical.token import Token, TokenType
+from app.capture import DEFAULT_LIMIT, CaptureBuffer
+from app.limits import JOB_CONTROL_SIGNALS, KILLED_STATUS, TIMEOUT_STATUS, Timeout, child_setup
+from app.commands import BaseCommand, CommandResult
+from app.commands.base import Cancelled, cancel_on
 from app.parser.pipe import PipeCommand
+from app.parser.plan import PipelinePlan, StagePlan
+from app.trace import read_proc_io
+
+# Size of the reads used when draining pipes
+CHUNK_SIZE = 64 * 1024
+
+# Status of a stage that was stopped by writing to a closed pipe
+SIGPIPE_STATUS = 128 + signal.SIGPIPE
+
+# Exits are watched through a pidfd per process where the OS has them
+HAS_PIDFD = hasattr(os, "pidfd_open")
+
+# Usage of the calling thread alone, where the OS can tell it apart
+RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+# Signals whose default action leaves a process running, built-in stages
+# are not cancelled by them
+NON_FATAL_SIGNALS = frozenset((
+    0, signal.SIGSTOP, signal.SIGTSTP, signal.SIGTTIN, signal.SIGTTOU,
+    signal.SIGCONT, signal.SIGCHLD, signal.SIGWINCH, signal.SIGURG,
+))
+
+
+class ResourceUsage(NamedTuple):
+    """Time and memory used by a stage or a whole pipeline"""
+    real: float
+    user: float
+    sys: float
+    # Peak resident set size in kilobytes
+    max_rss: int
+
+
+class ChildProcess(subprocess.Popen):
+    """
+    Popen that keeps the resource usage of its child once reaped
+
+    Popen reaps through os.waitpid in _try_wait() and _internal_poll(),
+    both are routed through os.wait4 instead so the usage isn't lost.
+    """
+    rusage = None
+    # perf_counter() when the child was reaped
+    ended = None
+    # Read the I/O counters of the child from /proc before it is reaped
+    collect_io = False
+    io = None
+
+    def _wait4(self, pid, flags):
+        if self.collect_io and self.io is None:
+            # Wait without reaping, the counters go away with the process
+            if os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT | (flags & os.WNOHANG)) is None:
+                return 0, 0
+            self.io = read_proc_io(pid)
+        pid, status, rusage = os.wait4(pid, flags)
+        if pid:
+            self.rusage = rusage
+            self.ended = time.perf_counter()
+        return pid, status
+
+    def _try_wait(self, wait_flags):
+        try:
+            return self._wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # Reaped elsewhere, the status is lost like it is with Popen
+            return self.pid, 0
+
+    def _internal_poll(self, _deadstate=None, **kwargs):
+        return super()._internal_poll(_deadstate, _waitpid=self._wait4)
+
+
+class CountingFile(io.FileIO):
+    """FileIO that counts the bytes going through it, for tracing"""
+    transferred = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if data:
+            self.transferred += len(data)
+        return data
+
+    def readall(self):
+        data = super().readall()
+        self.transferred += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        if count:
+            self.transferred += count
+        return count
+
+    def write(self, data):
+        count = super().write(data)
+        if count:
+            self.transferred += count
+        return count
+
+
+class PipelineStage:
+    """Runtime state of a single command while its pipeline is running"""
+
+    def __init__(self, plan: StagePlan, capture_limit: int = DEFAULT_LIMIT, cancelled: threading.Event = None):
+        self.command_name = plan.command.value
+        self.args = plan.args
+        self.redirect_instructions = plan.redirects
+        self.process = None
+        # Result of stages that ran in-process or failed to start
+        self.result = None
+        # Output captured when it isn't streamed out
+        self.stdout = CaptureBuffer(capture_limit)
+        self.stderr = CaptureBuffer(capture_limit)
+        # Whether the stage is run by a built-in
+        self.builtin = False
+        # perf_counter() when the stage was started, and when its process
+        # was spawned or its built-in began running
+        self.started = None
+        self.spawned = None
+        # Usage of stages that ran in-process or failed to start
+        self.thread_usage = None
+        # (read, written) byte counts of a built-in, when tracing
+        self.io_counts = None
+        # Set when the pipeline is cancelled, see RunningPipeline.cancel
+        self.cancelled = cancelled
+        # Signal a built-in stage was cancelled with, its status is 128 + it
+        self.cancel_signal = None
+
+    @property
+    def exit_code(self) -> int:
+        if self.result is not None:
+            return self.result.exit_code
+        if self.process is not None:
+            returncode = self.process.returncode
+            # Report signal deaths the way POSIX shells do (e.g. 141 for SIGPIPE)
+            return 128 - returncode if returncode < 0 else returncode
+        return 0
+
+    @property
+    def usage(self) -> ResourceUsage:
+        """What the stage used, once it is over"""
+        process = self.process
+        if process is not None:
+            rusage = process.rusage
+            if rusage is None:
+                return ResourceUsage(0.0, 0.0, 0.0, 0)
+            return ResourceUsage(process.ended - self.started, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss)
+        return self.thread_usage or ResourceUsage(0.0, 0.0, 0.0, 0)
+
+    @property
+    def bytes_read(self):
+        """Bytes the stage read, when tracing"""
+        if self.process is not None:
+            return self.process.io.get("rchar") if self.process.io else None
+        return self.io_counts[0] if self.io_counts else None
+
+    @property
+    def bytes_written(self):
+        """Bytes the stage wrote, when tracing"""
+        if self.process is not None:
+            return self.process.io.get("wchar") if self.process.io else None
+        return self.io_counts[1] if self.io_counts else None
+
+
+
+class RunningPipeline:
+    """Stages of a pipeline that have all been started"""
+
+    def __init__(self, stages: List[PipelineStage], cancelled: threading.Event = None):
+        self.stages = stages
+        # Set to stop the built-in stages, shared with them
+        self.cancelled = cancelled or threading.Event()
+        # Threads running built-in stages and draining captured output
+        self.workers = []
+        # Process group of the external commands, if they got one
+        self.pgid = None
+        # perf_counter() when the first stage was started
+        self.started = time.perf_counter()
+        # Set once the pipeline ran out of time and was signalled
+        self.timed_out = False
+        # Set once the timeout had to resort to SIGKILL
+        self.killed = False
+        # Timers enforcing the timeout, cancelled once the pipeline is over
+        self.timers = []
+
+    @property
+    def processes(self) -> List[subprocess.Popen]:
+        return [stage.process for stage in self.stages if stage.process is not None]
+
+    def exited(self) -> bool:
+        """Whether every external command has exited and been reaped"""
+        return all(process.returncode is not None for process in self.processes)
+
+    def finished(self) -> bool:
+        """Whether every stage is over, built-ins included, even one run inline"""
+        return (
+            self.exited() and not any(worker.is_alive() for worker in self.workers)
+            and all(stage.result is not None for stage in self.stages if stage.builtin)
+        )
+
+    def wait(self):
+        """Wait for every stage to finish"""
+        processes = [process for process in self.processes if process.returncode is None]
+        if HAS_PIDFD and len(processes) > 1:
+            # Reap processes as they exit rather than in pipeline order, so
+            # their usage says when each one was over
+            with selectors.DefaultSelector() as selector:
+                for process in processes:
+                    try:
+                        selector.register(os.pidfd_open(process.pid), selectors.EVENT_READ, process)
+                    except ProcessLookupError:
+                        process.wait()
+                while selector.get_map():
+                    for key, _ in selector.select():
+                        selector.unregister(key.fd)
+                        os.close(key.fd)
+                        key.data.wait()
+
+        for process in self.processes:
+            process.wait()
+        for worker in self.workers:
+            worker.join()
+        self.cancel_timeout()
+
+    def set_timeout(self, timeout: Timeout):
+        """
+        Signal the external commands and cancel the built-ins once
+        timeout.duration has passed, and kill the commands if they are
+        still there after the grace period
+        """
+        self._start_timer(timeout.duration, self._expire, timeout)
+
+    def cancel_timeout(self):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers = []
+
+    def send_signal(self, signum: int):
+        """
+        Signal the external commands, through their group when they have
+        one, and cancel the built-ins if the signal would end a process
+        """
+        if signum not in NON_FATAL_SIGNALS:
+            self.cancel(signum)
+        if self.pgid is not None:
+            try:
+                os.killpg(self.pgid, signum)
+            except ProcessLookupError:
+                pass
+            return
+        for process in self.processes:
+            if process.returncode is None:
+                process.send_signal(signum)
+
+    def cancel(self, signum: int = signal.SIGTERM):
+        """
+        Stop the built-in stages still running as if signum killed them
+
+        They give up at their next read and close their ends of
+        the pipes, so the stages next to them see the end of their input
+        or a broken pipe and are over soon after.
+        """
+        for stage in self.stages:
+            if stage.builtin and stage.result is None:
+                stage.cancel_signal = signum
+        self.cancelled.set()
+
+    def _expire(self, timeout: Timeout):
+        if self.finished():
+            return
+        self.timed_out = True
+        self.killed = timeout.signal == signal.SIGKILL
+        self.send_signal(timeout.signal)
+        # Stopped processes only see the signal once continued
+        self.send_signal(signal.SIGCONT)
+        if timeout.grace is not None and timeout.signal != signal.SIGKILL:
+            self._start_timer(timeout.grace, self._kill)
+
+    def _kill(self):
+        if not self.exited():
+            self.killed = True
+            self.send_signal(signal.SIGKILL)
+
+    def _start_timer(self, interval: float, function, *args):
+        timer = threading.Timer(interval, function, args)
+        timer.daemon = True
+        timer.start()
+        self.timers.append(timer)
+
+    @property
+    def usage(self) -> ResourceUsage:
+        """What the stages used together, once they are all over"""
+        usages = [stage.usage for stage in self.stages]
+        ended = max(
+            ((stage.started or self.started) + usage.real for stage, usage in zip(self.stages, usages)),
+            default=self.started
+        )
+        return ResourceUsage(
+            ended - self.started,
+            sum(usage.user for usage in usages),
+            sum(usage.sys for usage in usages),
+            max((usage.max_rss for usage in usages), default=0)
+        )
+
+    @property
+    def pipe_status(self) -> List[int]:
+        return [stage.exit_code for stage in self.stages]
+
+    @property
+    def signal(self):
+        """Signal that killed the last stage, or a cancelled built-in one, or None"""
+        if not self.stages:
+            return None
+        process = self.stages[-1].process
+        if process is not None and process.returncode is not None and process.returncode < 0:
+            return -process.returncode
+        return self.stages[-1].cancel_signal
+
+    @property
+    def stdout(self) -> CaptureBuffer:
+        return self.stages[-1].stdout if self.stages else CaptureBuffer()
+
+    @property
+    def stderr(self) -> CaptureBuffer:
+        """Error output of every stage, one stage after the other"""
+        buffers = [stage.stderr for stage in self.stages if stage.stderr]
+        if len(buffers) == 1:
+            return buffers[0]
+        combined = CaptureBuffer(self.stages[0].stderr.limit if self.stages else DEFAULT_LIMIT)
+        for buffer in buffers:
+            buffer.copy_to(combined)
+        return combined
+
+    def close(self):
+        """Drop the captured output"""
+        self.cancel_timeout()
+        for stage in self.stages:
+            stage.stdout.close()
+            stage.stderr.close()
+
 
 class PipeProcessor:
     """Handles execution of command pipelines"""
-    
-    def __init__(self, command_registry):
+
+    def __init__(self, command_registry, capture_limit: int = DEFAULT_LIMIT, job_control: bool = False):
+        """
+        Args:
+            command_registry: CommandRegistry resolving the commands
+            capture_limit: Bytes of captured output a stage keeps in memory
+                before the rest goes to a temporary file
+            job_control: Whether the shell ignores the stop signals, which
+                external commands then get back at their defaults
+        """
         self.registry = command_registry
-    
-    def execute_pipeline(self, pipe_commands: List[PipeCommand]) -> Tuple[int, str, str]:
+        self.capture_limit = capture_limit
+        self.job_control = job_control
+        # Exit status of every stage of the last pipeline, like bash's PIPESTATUS
+        self.pipe_status = []
+
+    def execute_pipeline(self, pipe_commands: List[PipeCommand], stdout_fd=None, stderr_fd=None) -> Tuple[int, bytes, bytes]:
         """
         Execute a pipeline of commands
-        
+
+        Every stage is started up front and connected to its neighbours with
+        os.pipe(), so data streams between the stages instead of being
+        buffered here, and the stages run concurrently. When a stage exits,
+        its end of the pipe is closed and the stage feeding it gets SIGPIPE
+        (or EPIPE for built-ins) on its next write, so `yes | head` finishes.
+
+        The exit status is the last stage's, or with the pipefail option the
+        last non-zero stage status.
+
+        Output is captured and returned unless stdout_fd/stderr_fd are given,
+        in which case the last stage writes straight to stdout_fd and every
+        stage reports errors on stderr_fd as it runs, so nothing is held here.
+
+        Data moves between stages as raw bytes and is never decoded here;
+        only built-ins that declare they work on text see decoded input.
+
         Args:
             pipe_commands: List of PipeCommand objects
-            
+            stdout_fd: File descriptor the pipeline output is streamed to
+            stderr_fd: File descriptor error output is streamed to
+
+        Returns:
+            tuple: (exit_code, final_stdout, final_stderr)
+        """
+        redirect_parser = RedirectParser()
+        stage_plans = []
+        for pipe_command in pipe_commands:
+            tokens = [pipe_command.command] + pipe_command.args
+            command_tokens, redirect_instructions = redirect_parser.parse(tokens)
+            stage_plans.append(StagePlan(command_tokens[0], tuple(command_tokens[1:]), tuple(redirect_instructions)))
+
+        return self.execute_plan(PipelinePlan(tuple(stage_plans)), stdout_fd, stderr_fd)
+
+    def execute_plan(self, plan: PipelinePlan, stdout_fd=None, stderr_fd=None) -> Tuple[int, bytes, bytes]:
+        """
+        Execute an already parsed pipeline, see execute_pipeline
+
+        The plan is only read, so cached plans can be executed again.
+        Captured output is returned as bytes, so it has to fit in memory.
+
         Returns:
             tuple: (exit_code, final_stdout, final_stderr)
         """
-        if len(pipe_commands) == 1:
-            # Single command, no pipe needed
-            return self._execute_single_command(pipe_commands[0], input_data="")
-        
-        # Execute pipeline
-        current_input = ""
-        
-        for i, cmd in enumerate(pipe_commands):
-            is_last = (i == len(pipe_commands) - 1)
-            
-            exit_code, stdout, stderr = self._execute_single_command(cmd, current_input)
-            
-            if exit_code != 0:
-                # Command failed, stop pipeline
-                return exit_code, stdout, stderr
-            
-            if is_last:
-                # Last command, return its output
-                return exit_code, stdout, stderr
+        pipeline = self.start_plan(plan, stdout_fd, stderr_fd)
+        pipeline.wait()
+        exit_code, stdout, stderr = self.finish(pipeline)
+        try:
+            return exit_code, stdout.getvalue(), stderr.getvalue()
+        finally:
+            pipeline.close()
+
+    def start_plan(self, plan: PipelinePlan, stdout_fd=None, stderr_fd=None,
+                   process_group: bool = False, inline: bool = True) -> RunningPipeline:
+        """
+        Start every stage of a pipeline without waiting for any of them
+
+        Args:
+            plan: Parsed pipeline
+            stdout_fd: File descriptor the pipeline output is streamed to
+            stderr_fd: File descriptor error output is streamed to
+            process_group: Put the external commands in a process group of
+                their own, led by the first of them
+            inline: Run a single built-in right away instead of in a thread
+
+        A pipeline with a timeout, its own or the session's, always gets a
+        process group so the timeout reaches everything it started.
+
+        Returns:
+            RunningPipeline: the started stages, to wait on and finish
+        """
+        cancelled = threading.Event()
+        pipeline = RunningPipeline(
+            [PipelineStage(stage_plan, self.capture_limit, cancelled) for stage_plan in plan.stages], cancelled
+        )
+        stdin_fd = None
+        timeout = plan.timeout or self.registry.options.timeout
+        process_group = process_group or timeout is not None
+        if timeout is not None:
+            # Armed first, so a single built-in run inline is covered too
+            pipeline.set_timeout(timeout)
+
+        for i, stage in enumerate(pipeline.stages):
+            if i < len(pipeline.stages) - 1:
+                next_stdin_fd, stage_stdout_fd = os.pipe()
             else:
-                # Use this command's output as next command's input
-                current_input = stdout
-        
-        return 0, "", ""
-    
-    def _execute_single_command(self, pipe_command: PipeCommand, input_data: str) -> Tuple[int, str, str]:
-        """
-        Execute a single command with given input
-        
+                # Last command, its output is streamed out or captured
+                next_stdin_fd = None
+                if stdout_fd is None:
+                    stage_stdout_fd = self._capture(stage.stdout, pipeline.workers)
+                else:
+                    stage_stdout_fd = os.dup(stdout_fd)
+
+            if stderr_fd is None:
+                stage_stderr_fd = self._capture(stage.stderr, pipeline.workers)
+            else:
+                stage_stderr_fd = os.dup(stderr_fd)
+
+            # 0 asks for a new group, which the first process then leads
+            pgid = None if not process_group else pipeline.pgid or 0
+            self._start_stage(stage, [stdin_fd, stage_stdout_fd, stage_stderr_fd], pipeline.workers,
+                              inline=inline and len(pipeline.stages) == 1, pgid=pgid)
+            if process_group and pipeline.pgid is None and stage.process is not None:
+                pipeline.pgid = stage.process.pid
+            stdin_fd = next_stdin_fd
+
+        return pipeline
+
+    def finish(self, pipeline: RunningPipeline) -> Tuple[int, CaptureBuffer, CaptureBuffer]:
+        """
+        Collect the status and output of a pipeline that has been waited on
+
+        The exit status is the last stage's, or with the pipefail option the
+        last non-zero stage status, or 124 if the pipeline timed out, 137
+        if it had to be killed for it like coreutils timeout. Output stays
+        in its capture buffers, to be copied out by the caller and dropped
+        with pipeline.close().
+
         Returns:
-            tuple: (exit_code, stdout, stderr)
+            tuple: (exit_code, final_stdout, final_stderr)
         """
+        self.pipe_status = pipeline.pipe_status
+        return self.status(pipeline), pipeline.stdout, pipeline.stderr
 
-        redirect_parser = RedirectParser()
-        redirect_processor = RedirectProcessor()
-        tokens = [pipe_command.command] + pipe_command.args
-
-        # Parse the single command for redirect instruction
-        command_tokens, redirect_instructions = redirect_parser.parse(tokens)
-
-        # Get the commands from the redirect parser
-        command_name = command_tokens[0].value
-        args = command_tokens[1:]
-        
-        # Check if it's a built-in command
-        command = self.registry.get_command(command_name)
-        
-        # execute commands
-        if self.registry.is_external_command(command_name):
-            # External command - use subprocess with pipes
+    def status(self, pipeline: RunningPipeline) -> int:
+        """Exit status of a pipeline that has been waited on, see finish"""
+        if pipeline.timed_out:
+            return KILLED_STATUS if pipeline.killed else TIMEOUT_STATUS
+        pipe_status = pipeline.pipe_status
+        if self.registry.options.pipefail:
+            return next((status for status in reversed(pipe_status) if status != 0), 0)
+        return pipe_status[-1] if pipe_status else 0
+
+    def _start_stage(self, stage: PipelineStage, fds: List, workers: List[threading.Thread],
+                     inline: bool = False, pgid: int = None):
+        """
+        Launch a single stage of the pipeline
+
+        The stage takes ownership of the [stdin, stdout, stderr] descriptors
+        in fds (stdin is None for the first stage) and of any file opened for
+        its redirects; the parent's copies are closed once the stage has
+        been started. Built-ins run in a worker thread, unless inline is set
+        because there is nothing else for them to run alongside. External
+        commands join the process group pgid unless it is None.
+        """
+        stage.started = time.perf_counter()
+        stderr_fd = fds[2]
+        owned = [fd for fd in fds if fd is not None]
+        success, fds, opened, error_message = RedirectProcessor().open_redirects(stage.redirect_instructions, fds)
+        owned.extend(opened)
+
+        if not success:
+            self._write_all(stderr_fd, error_message.encode())
+            stage.result = CommandResult(exit_code=1)
+            self._close(*owned)
+            return
+
+        command = self._resolve(stage)
+        if command is None:
             try:
-                cmd_list = [command_name] + [arg.value for arg in args]
-                
-                result = subprocess.run(
-                    cmd_list,
-                    input=input_data,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    check=False  # Don't raise exception on non-zero exit
-                )
-                
-                result = CommandResult(
-                    exit_code=result.returncode,
-                    stdout=result.stdout,
-                    stderr=result.stderr
-                )
-            
-            except FileNotFoundError:
-                return 1, "", f"{command_name}: command not found\n"
-            except Exception as e:
-                return 1, "", f"{command_name}: {str(e)}"
-        
-        else:
-            # add the input data to args if available
-            if input_data:
-                args.append(Token(type=TokenType.WORD, value=input_data))
-            result = command.execute(args)
-
-    
-        if redirect_parser.has_redirects(tokens):
-            success, final_output, final_stderr, error_message = redirect_processor.apply_redirects(
-                result.stdout,
-                result.stderr,
-                redirect_instructions
+                self._spawn(stage, fds, pgid)
+            finally:
+                # The child holds its own copies now
+                self._close(*owned)
+            return
+
+        stage.builtin = True
+        if fds[0] is not None and not command.reads_stdin:
+            # Nothing will ever read this pipe, let the producer see EPIPE now
+            owned.remove(fds[0])
+            self._close(fds[0])
+            fds[0] = None
+
+        if inline:
+            self._run_builtin(stage, command, fds, owned)
+            return
+
+        worker = threading.Thread(
+            target=self._run_builtin,
+            args=(stage, command, fds, owned),
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+
+    def _resolve(self, stage: PipelineStage):
+        """
+        Get the built-in that runs the stage, or None to spawn it
+
+        `command NAME ...` runs NAME without its native stand-in, and so do
+        native stand-ins given flags they don't handle.
+        """
+        if stage.command_name == "command" and stage.args and not stage.args[0].value.startswith("-"):
+            stage.command_name, stage.args = stage.args[0].value, stage.args[1:]
+            command = self.registry.get_command(stage.command_name)
+            return None if command is None or command.native else command
+
+        command = self.registry.get_command(stage.command_name)
+        if command is not None and command.native and not command.supports(stage.args):
+            return None
+        return command
+
+    def _spawn(self, stage: PipelineStage, fds: List, pgid: int = None):
+        """Spawn an external command wired straight to its descriptors"""
+        # Resolve through the hash table, so a missing command never forks
+        executable = self.registry.find_executable(stage.command_name)
+        if executable is None:
+            self._write_all(fds[2], f"{stage.command_name}: command not found\n".encode())
+            stage.result = CommandResult(exit_code=1)
+            return
+
+        cmd_list = [stage.command_name] + [arg.value for arg in stage.args]
+        # Limits and signals are set in the child, only when there are any
+        # since preexec_fn rules out the faster vfork and isn't thread-safe,
+        # see app.limits
+        limits = self.registry.options.limits
+        default_signals = JOB_CONTROL_SIGNALS if self.job_control else ()
+
+        try:
+            stage.process = ChildProcess(
+                cmd_list,
+                executable=executable,
+                stdin=subprocess.DEVNULL if fds[0] is None else fds[0],
+                stdout=fds[1],
+                stderr=fds[2],
+                process_group=pgid,
+                preexec_fn=child_setup(limits, default_signals) if limits or default_signals else None
             )
+            stage.spawned = time.perf_counter()
+            stage.process.collect_io = self.registry.options.trace
+        except FileNotFoundError:
+            self._write_all(fds[2], f"{stage.command_name}: command not found\n".encode())
+            stage.result = CommandResult(exit_code=1)
+        except Exception as e:
+            self._write_all(fds[2], f"{stage.command_name}: {str(e)}\n".encode())
+            stage.result = CommandResult(exit_code=1)
 
-            if not success:
-                return 1, "", error_message
-            else:
-                return result.exit_code, final_output, final_stderr
-        
-        return result.exit_code, result.stdout, result.stderr
-            
-        
\ No newline at end of file
+    def _run_builtin(self, stage: PipelineStage, command: BaseCommand, fds: List, owned: List):
+        """
+        Run a built-in against file objects over the stage descriptors
+
+        Output goes straight into the pipe as it is written, so a built-in
+        streams alongside the other stages and blocks when its reader is
+        slow, like any process would.
+        """
+        stage.spawned = time.perf_counter()
+        # Traced built-ins count what they read and write
+        tracing = self.registry.options.trace
+        raw_file = CountingFile if tracing else io.FileIO
+
+        if not command.reads_stdin:
+            stdin = None
+        elif fds[0] is None:
+            # Like external commands, a first stage reads from /dev/null
+            stdin = open(os.devnull, "rb")
+        else:
+            stdin = raw_file(fds[0], "rb", closefd=False)
+        stdout = io.BufferedWriter(raw_file(fds[1], "wb", closefd=False), CHUNK_SIZE)
+        stderr = open(fds[2], "wb", buffering=0, closefd=False)
+        before = resource.getrusage(RUSAGE_THREAD)
+        cancel_on(stage.cancelled)
+
+        try:
+            exit_code = command.run(stage.args, stdin, stdout, stderr)
+            stdout.flush()
+        except BrokenPipeError:
+            exit_code = SIGPIPE_STATUS
+        except Cancelled:
+            # A stage started once the pipeline was already cancelled has no signal yet
+            stage.cancel_signal = stage.cancel_signal or signal.SIGTERM
+            exit_code = 128 + stage.cancel_signal
+        except KeyboardInterrupt:
+            # Only a built-in run inline gets Ctrl-C, it ends like a process would
+            stage.cancel_signal = signal.SIGINT
+            exit_code = 128 + signal.SIGINT
+        except Exception as e:
+            self._write_all(fds[2], f"{stage.command_name}: {str(e)}\n".encode())
+            exit_code = 1
+        finally:
+            cancel_on(None)
+            try:
+                # Drops whatever a closed pipe kept from being written
+                stdout.close()
+            except BrokenPipeError:
+                pass
+            if stdin is not None:
+                stdin.close()
+            stderr.close()
+            self._close(*owned)
+
+        if tracing:
+            stage.io_counts = (getattr(stdin, "transferred", 0), stdout.raw.transferred)
+
+        after = resource.getrusage(RUSAGE_THREAD)
+        stage.thread_usage = ResourceUsage(
+            time.perf_counter() - stage.started,
+            after.ru_utime - before.ru_utime,
+            after.ru_stime - before.ru_stime,
+            # Built-ins share the memory of the shell
+            after.ru_maxrss
+        )
+        stage.result = CommandResult(exit_code=exit_code)
+
+    def _capture(self, buffer: CaptureBuffer, workers: List[threading.Thread]) -> int:
+        """
+        Create a pipe whose output is collected into buffer in the background
+
+        Returns:
+            int: the write end of the pipe
+        """
+        read_fd, write_fd = os.pipe()
+
+        def drain():
+            try:
+                while chunk := os.read(read_fd, CHUNK_SIZE):
+                    buffer.write(chunk)
+            finally:
+                os.close(read_fd)
+
+        worker = threading.Thread(target=drain, daemon=True)
+        worker.start()
+        workers.append(worker)
+        return write_fd
+
+    def _write_all(self, fd, data: bytes) -> bool:
+        """
+        Write data to a pipe, stopping quietly if the reader went away
+
+        Returns:
+            bool: False if the reader closed the pipe before all data was written
+        """
+        view = memoryview(data)
+        try:
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        except BrokenPipeError:
+            return False
+        return True
+
+    def _close(self, *fds):
+        """Close the given file descriptors, ignoring the ones not set"""
+        for fd in fds:
+            if fd is not None:
+                os.close(fd)
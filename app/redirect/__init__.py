@@ -2,53 +2,60 @@ import os
 from typing import List
 
 class RedirectProcessor:
-    """Handles applying redirect instructions to command output"""
-    
-    def apply_redirects(self, output: str, error_output: str, redirect_instructions: List) -> tuple:
-        """Apply redirect instructions to command output"""
-        # If no redirects, return output as-is
-        if not redirect_instructions:
-            return True, output, ""
-        
-        # For now, handle only output redirects (>, >>)
-        final_stdout = output  # What gets printed to terminal
-        final_stderr = error_output  # What gets printed to terminal for stderr
-        
+    """Turns redirect instructions into the file descriptors a command runs with"""
+
+    def open_redirects(self, redirect_instructions: List, fds: List) -> tuple:
+        """
+        Apply redirect instructions to a command's standard streams
+
+        Instructions are applied left to right like POSIX shells do, so
+        `> file 2>&1` sends both streams to file while `2>&1 > file` only
+        sends stdout there. Files are opened once and handed to the command
+        as descriptors, nothing is copied through the shell.
+
+        Args:
+            redirect_instructions: List of RedirectInstruction objects
+            fds: Descriptors for [stdin, stdout, stderr] before the redirects
+
+        Returns:
+            tuple: (success, fds, opened_fds, error_message) where opened_fds
+            are the descriptors opened here that the caller must close
+        """
+        fds = list(fds)
+        opened = []
+
         for instruction in redirect_instructions:
-            if instruction.stream == 'stdout':
-                if instruction.redirect_type in ('>', '1>'):
-                    # Output redirect - write to file (overwrite)
-                    success, error = self._write_to_file(output, instruction.target, mode='w')
-                    if not success:
-                        return False, "", error
-                    final_stdout = ""  # Don't print to terminal
-                    
-                elif instruction.redirect_type in ('>>', '1>>'):
-                    # Append redirect - append to file
-                    success, error = self._write_to_file(output, instruction.target, mode='a')
-                    if not success:
-                        return False, "", error
-                    final_stdout = ""  # Don't print to terminal
-
-            elif instruction.stream == 'stderr':
-                if instruction.redirect_type in ('2>', '2>>'):
-                    # Redirect stderr to file
-                    success, error = self._write_to_file(error_output, instruction.target, mode='w' if instruction.redirect_type == '2>' else 'a')
-                    if not success:
-                        return False, "", error
-                    final_stderr = ""
-        
-        return True, final_stdout, final_stderr, ""
-    
-    def _write_to_file(self, content: str, filename: str, mode: str) -> tuple:
-        """Write content to file"""
+            if instruction.duplicate:
+                fds[instruction.fd] = fds[int(instruction.target)]
+                continue
+
+            success, fd, error = self._open_file(instruction)
+            if not success:
+                for fd in opened:
+                    os.close(fd)
+                return False, fds, [], error
+
+            opened.append(fd)
+            fds[instruction.fd] = fd
+
+        return True, fds, opened, ""
+
+    def _open_file(self, instruction) -> tuple:
+        """Open the target file of a redirect"""
+        filename = instruction.target
+
+        if instruction.stream == 'stdin':
+            flags = os.O_RDONLY
+        else:
+            flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if instruction.append else os.O_TRUNC)
+
         try:
-            with open(filename, mode) as f:
-                f.write(content)
-            return True, ""
+            return True, os.open(filename, flags, 0o666), ""
         except PermissionError:
-            return False, f"Permission denied: {filename}"
+            return False, None, f"Permission denied: {filename}\n"
         except FileNotFoundError:
-            return False, f"No such file or directory: {os.path.dirname(filename)}"
+            if instruction.stream == 'stdin':
+                return False, None, f"No such file or directory: {filename}\n"
+            return False, None, f"No such file or directory: {os.path.dirname(filename)}\n"
         except Exception as e:
-            return False, f"Error writing to {filename}: {str(e)}"
\ No newline at end of file
+            return False, None, f"Error opening {filename}: {str(e)}\n"
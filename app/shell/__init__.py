@@ -0,0 +1,256 @@
+import signal
+import sys
+from typing import Iterable
+from app.capture import DEFAULT_LIMIT
+from app.commands import CommandRegistry, ParseCacheCommand, StatsCommand
+from app.commands.jobs import BgCommand, FgCommand, JobsCommand, KillCommand, WaitCommand
+from app.commands.timing import time_report
+from app.jobs import JobTable
+from app.lexical.token import TokenType
+from app.parser.plan import ListPlan, Planner, PlanCache, PipelinePlan
+from app.pipe import PipeProcessor
+from app.trace import Tracer
+
+AND = TokenType.AND
+
+class Shell:
+    """Execution context shared by every line the shell runs"""
+
+    def __init__(self, history_manager=None, parse_cache_size: int = 256, job_control: bool = False,
+                 capture_limit: int = DEFAULT_LIMIT):
+        """
+        Build the registry, parser and processor once so they are reused
+        for every line, interactive or not
+
+        Args:
+            history_manager: HistoryManager instance, None when running without history
+            parse_cache_size: How many parsed command lines to keep
+            job_control: Run every pipeline in a process group of its own
+                that gets the terminal while in the foreground, so jobs can
+                be stopped and resumed
+            capture_limit: Bytes of captured output kept in memory before
+                it goes to a temporary file
+        """
+        self.history_manager = history_manager
+        self.registry = CommandRegistry(history_manager)
+        self.tracer = Tracer.from_environment(self.registry.options)
+        self.planner = Planner(PlanCache(parse_cache_size), self.tracer)
+        self.pipe_processor = PipeProcessor(self.registry, capture_limit, job_control)
+        self.jobs = JobTable(job_control, sys.stdin.fileno() if job_control else None)
+
+        self.registry.register_builtin("parsecache", ParseCacheCommand, cache=self.planner.cache)
+        self.registry.register_builtin("stats", StatsCommand, tracer=self.tracer)
+        self.registry.register_builtin("jobs", JobsCommand, jobs=self.jobs)
+        self.registry.register_builtin("fg", FgCommand, jobs=self.jobs, processor=self.pipe_processor)
+        self.registry.register_builtin("bg", BgCommand, jobs=self.jobs)
+        self.registry.register_builtin("wait", WaitCommand, jobs=self.jobs, processor=self.pipe_processor)
+        self.registry.register_builtin("kill", KillCommand, jobs=self.jobs)
+        self.registry.register_builtin(
+            "parallel", "app.commands.parallel.ParallelCommand", planner=self.planner, processor=self.pipe_processor
+        )
+        self.registry.register_builtin(
+            "bench", "app.commands.timing.BenchCommand", planner=self.planner, processor=self.pipe_processor
+        )
+
+        # Exit status of the last line that ran
+        self.last_status = 0
+        # Set once the exit builtin has run
+        self.exiting = False
+        # Set when a foreground pipeline was killed by Ctrl-C
+        self.interrupted = False
+
+    def run_line(self, raw_input: str) -> int:
+        """
+        Tokenize, parse and execute a single command line
+
+        Returns:
+            int: exit status of the line
+        """
+        tracer = self.tracer
+        if tracer.enabled:
+            tracer.begin_line(raw_input)
+        # Directory listings are only shared by the patterns of one line
+        self.planner.globber.clear()
+
+        try:
+            # Tokenize and parse, or reuse the plan of an identical line
+            plan = self.planner.plan(raw_input)
+        except Exception as e:
+            print(f"Shell error: {e}", file=sys.stderr)
+            self.last_status = 1
+        else:
+            self.execute(plan)
+
+        if tracer.enabled:
+            tracer.end_line(self.last_status)
+        return self.last_status
+
+    def execute(self, plan: ListPlan) -> int:
+        """
+        Run the and-or lists of a parsed line one after the other
+
+        Lists ending with & are started as jobs and not waited for, so
+        they run alongside whatever follows them. The plan is walked as
+        is, nothing gets tokenized or parsed again.
+
+        Returns:
+            int: exit status of the last pipeline that ran
+        """
+        for and_or in plan.lists:
+            if and_or.background:
+                self._start_job(and_or.pipelines[0])
+                continue
+
+            status = self.run_pipeline(and_or.pipelines[0])
+            for operator, pipeline in zip(and_or.operators, and_or.pipelines[1:]):
+                if self.exiting or self.interrupted:
+                    break
+                # && runs the next pipeline after a success, || after a failure
+                if (operator is AND) == (status == 0):
+                    status = self.run_pipeline(pipeline)
+
+            if self.exiting or self.interrupted:
+                # Ctrl-C stops the whole line, not just the pipeline it hit
+                self.interrupted = False
+                break
+
+        return self.last_status
+
+    def run_pipeline(self, plan: PipelinePlan) -> int:
+        """
+        Run a pipeline in the foreground and print what it output
+
+        Returns:
+            int: exit status of the pipeline
+        """
+        try:
+            plan = self.planner.expand(plan)
+
+            # Start the pipeline, all stages run concurrently
+            process_group = self.jobs.job_control
+            if self.registry.options.stream:
+                sys.stdout.flush()
+                pipeline = self.pipe_processor.start_plan(
+                    plan, sys.stdout.fileno(), sys.stderr.fileno(), process_group=process_group
+                )
+            else:
+                pipeline = self.pipe_processor.start_plan(plan, process_group=process_group)
+
+            if pipeline.pgid is None:
+                try:
+                    pipeline.wait()
+                except KeyboardInterrupt:
+                    # Nothing took the terminal, so Ctrl-C came to the shell:
+                    # tear the built-ins down rather than leave them running
+                    pipeline.cancel(signal.SIGINT)
+                    pipeline.wait()
+                self.interrupted = pipeline.signal == signal.SIGINT
+            else:
+                # The job's processes get the terminal, and with it Ctrl-C and Ctrl-Z
+                job = self.jobs.add(pipeline, plan.text, foreground=True)
+                self.jobs.foreground(job)
+                if job.stopped:
+                    sys.stderr.write(f"\n{self.jobs.describe(job)}\n")
+                    sys.stderr.flush()
+                    self.last_status = 128 + signal.SIGTSTP
+                    return self.last_status
+                self.jobs.remove(job)
+                self.interrupted = pipeline.signal == signal.SIGINT
+
+            exit_code, stdout_output, stderr_output = self.pipe_processor.finish(pipeline)
+
+        except Exception as e:
+            # Handle unexpected errors
+            print(f"Shell error: {e}", file=sys.stderr)
+            self.last_status = 1
+            return self.last_status
+
+        try:
+            # Handle output and errors
+            if exit_code == -1:
+                # Exit signal from built-in command
+                self.exiting = True
+                return self.last_status
+
+            # Any stage of the pipeline may have written to stderr, even
+            # when the last one succeeded. Output is raw bytes, written as-is
+            # so binary data survives, straight from disk if it got that big
+            if stderr_output:
+                stderr_output.copy_to(sys.stderr.buffer)
+                sys.stderr.flush()
+
+            if stdout_output:
+                stdout_output.copy_to(sys.stdout.buffer)
+                sys.stdout.flush()
+        finally:
+            pipeline.close()
+
+        if plan.timed:
+            sys.stderr.write(time_report(pipeline))
+            sys.stderr.flush()
+        if self.tracer.enabled:
+            self.tracer.pipeline(plan, pipeline, exit_code)
+
+        self.last_status = exit_code
+        return exit_code
+
+    def report_jobs(self):
+        """Tell about the jobs that finished since the last prompt"""
+        for job, description in self.jobs.collect_finished():
+            # A job stopped while its output was being captured still has it
+            if job.pipeline.stderr:
+                job.pipeline.stderr.copy_to(sys.stderr.buffer)
+                sys.stderr.flush()
+            if job.pipeline.stdout:
+                job.pipeline.stdout.copy_to(sys.stdout.buffer)
+            job.pipeline.close()
+            sys.stdout.write(f"{description}\n")
+            sys.stdout.flush()
+
+    def _start_job(self, plan: PipelinePlan) -> int:
+        """Start a pipeline in the background, its output goes straight to ours"""
+        try:
+            plan = self.planner.expand(plan)
+            sys.stdout.flush()
+            pipeline = self.pipe_processor.start_plan(
+                plan, sys.stdout.fileno(), sys.stderr.fileno(),
+                process_group=self.jobs.job_control, inline=False
+            )
+        except Exception as e:
+            print(f"Shell error: {e}", file=sys.stderr)
+            self.last_status = 1
+            return self.last_status
+
+        job = self.jobs.add(pipeline, plan.text)
+        if self.tracer.enabled:
+            self.tracer.pipeline(plan, pipeline)
+
+        if self.jobs.job_control:
+            # Announce the job and the pid of its last process
+            print(f"[{job.id}] {job.pids[-1]}" if job.pids else f"[{job.id}]")
+
+        self.last_status = 0
+        return self.last_status
+
+    def run_lines(self, lines: Iterable[str]) -> int:
+        """
+        Run command lines one after the other without any prompt
+
+        Lines are consumed lazily, so a script file or stdin is read one
+        line at a time. Blank lines and lines starting with # are skipped.
+
+        Returns:
+            int: exit status of the last line that ran
+        """
+        for line in lines:
+            line = line.rstrip("\n")
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                continue
+
+            self.run_line(line)
+            if self.exiting:
+                break
+
+        self.tracer.flush()
+        return self.last_status
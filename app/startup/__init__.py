@@ -0,0 +1,150 @@
+"""
+Measurement of where the time goes before the shell is ready
+
+`echo-craft.sh --startup-profile` times each phase of startup, from the
+imports to the first prompt or the first line of a batch, and which
+modules took the longest to import, then prints it all on stderr. Without
+the flag none of this is set up.
+"""
+
+import sys
+import time
+
+PROFILE_FLAG = "--startup-profile"
+
+# How many of the slowest modules are listed
+TOP_IMPORTS = 12
+
+
+class ImportTimer:
+    """
+    Meta path finder timing every module imported while it is installed
+
+    It finds nothing itself: it asks the finders after it for the spec and
+    wraps the loader, so each module's time is measured around its
+    execution, with the modules it imported in turn counted apart.
+    """
+
+    def __init__(self):
+        # Module name -> (total seconds, seconds spent in the module itself)
+        self.times = {}
+        # Time spent importing other modules, per module being executed
+        self.stack = []
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = TimedLoader(spec.loader, name, self)
+        return spec
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+
+class TimedLoader:
+    """Loader measuring how long the loader it wraps takes to run a module"""
+
+    def __init__(self, loader, name: str, timer: ImportTimer):
+        self.loader = loader
+        self.name = name
+        self.timer = timer
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self.timer.stack
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.timer.times[self.name] = (total, total - nested)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class StartupProfile:
+    """
+    Phases of startup and their durations
+
+    Phases are timed with `with profile.phase(name):`, a disabled profile
+    only hands out a context that does nothing.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        # (name, seconds) in the order the phases ran
+        self.phases = []
+        self.imports = ImportTimer() if enabled else None
+        self.reported = False
+
+    @classmethod
+    def from_args(cls, args: list) -> "StartupProfile":
+        """Profile enabled by --startup-profile, which is removed from args"""
+        enabled = PROFILE_FLAG in args
+        if enabled:
+            args.remove(PROFILE_FLAG)
+        profile = cls(enabled)
+        if enabled:
+            profile.imports.install()
+        return profile
+
+    def phase(self, name: str) -> "Phase":
+        return Phase(self, name)
+
+    def report(self, file=None):
+        """Print the profile once, when the shell is ready for its first command"""
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        self.imports.uninstall()
+        total = time.perf_counter() - self.started
+        file = file or sys.stderr
+
+        lines = ["startup profile:"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<24}{seconds * 1e3:8.2f} ms")
+        lines.append(f"  {'total':<24}{total * 1e3:8.2f} ms")
+
+        slowest = sorted(self.imports.times.items(), key=lambda item: item[1][1], reverse=True)[:TOP_IMPORTS]
+        if slowest:
+            lines.append(f"  slowest imports ({len(self.imports.times)} modules):{'self':>9} {'total':>10}")
+            for module, (module_total, module_self) in slowest:
+                lines.append(f"    {module:<30}{module_self * 1e3:6.2f} ms {module_total * 1e3:7.2f} ms")
+        file.write("\n".join(lines) + "\n")
+        file.flush()
+
+
+class Phase:
+    """Context timing one phase of startup"""
+
+    def __init__(self, profile: StartupProfile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile.enabled:
+            self.profile.phases.append((self.name, time.perf_counter() - self.started))
@@ -0,0 +1,197 @@
+"""
+Opt-in tracing of what every command line did
+
+Tracing is on with `set -o trace`, or from the start when ECHOCRAFT_TRACE
+names a file. Each line run while it is on becomes one JSON event, with the
+time spent tokenizing and parsing it, whether its plan came from the cache,
+and for every pipeline the status, runtime, spawn latency and bytes read
+and written by each stage. Events are appended to the ECHOCRAFT_TRACE file
+when there is one; either way they feed the session counters of `stats`.
+A file that can't be written is reported once and tracing goes on with
+the counters only.
+
+When tracing is off the hooks are a single option check.
+"""
+
+import atexit
+import os
+import sys
+import time
+from collections import Counter
+from typing import Optional
+
+# Environment variable naming the file events are appended to
+TRACE_ENV = "ECHOCRAFT_TRACE"
+
+# Events are written in blocks of this size rather than one at a time
+BUFFER_SIZE = 64 * 1024
+
+
+def microseconds(seconds: float) -> int:
+    return round(seconds * 1e6)
+
+
+def read_proc_io(pid: int) -> dict:
+    """I/O counters of a process from /proc, empty where there is no /proc"""
+    try:
+        with open(f"/proc/{pid}/io") as file:
+            return {key: int(value) for key, value in (line.split(": ") for line in file)}
+    except (OSError, ValueError):
+        return {}
+
+
+class TraceWriter:
+    """Appends events to a file as JSON lines, through a large buffer"""
+
+    def __init__(self, path: str):
+        # Only needed once there is an event to write, kept out of startup
+        import json
+        self.file = open(path, "a", buffering=BUFFER_SIZE, encoding="utf-8")
+        self.encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+    def write(self, event: dict):
+        self.file.write(self.encode(event) + "\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Tracer:
+    """Builds the event of each traced line and keeps the session counters"""
+
+    def __init__(self, options, path: Optional[str] = None):
+        """
+        Args:
+            options: ShellOptions whose trace option turns tracing on
+            path: File events are appended to, None to only count them
+        """
+        self.options = options
+        self.path = path
+        self.writer = None
+        # Event of the line being run, None when it isn't traced
+        self.line = None
+        self.line_started = 0.0
+        self.counters = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.options.trace
+
+    def begin_line(self, raw_input: str):
+        self.line = {"time": time.time(), "line": raw_input, "cache": "hit", "pipelines": []}
+        self.line_started = time.perf_counter()
+
+    def planned(self, lex_time: float, parse_time: float):
+        """Record the work of a line that wasn't in the plan cache"""
+        if self.line is None:
+            return
+        self.line.update(cache="miss", lex_us=microseconds(lex_time), parse_us=microseconds(parse_time))
+        self.counters["lex_us"] += self.line["lex_us"]
+        self.counters["parse_us"] += self.line["parse_us"]
+
+    def pipeline(self, plan, pipeline, status: Optional[int] = None):
+        """
+        Record a pipeline of the current line
+
+        Background pipelines are recorded as they are started, without
+        status or usage.
+        """
+        if self.line is None:
+            return
+        counters = self.counters
+        event = {"text": plan.text}
+        self.line["pipelines"].append(event)
+        counters["pipelines"] += 1
+        if status is None:
+            event["background"] = True
+            return
+
+        usage = pipeline.usage
+        event.update(status=status, pipe_status=pipeline.pipe_status, real_us=microseconds(usage.real), stages=[])
+        for stage in pipeline.stages:
+            stage_usage = stage.usage
+            stage_event = {
+                "command": stage.command_name,
+                "builtin": stage.builtin,
+                "exit": stage.exit_code,
+                "spawn_us": microseconds(stage.spawned - stage.started) if stage.spawned else None,
+                "real_us": microseconds(stage_usage.real),
+                "user_us": microseconds(stage_usage.user),
+                "sys_us": microseconds(stage_usage.sys),
+                "max_rss_kb": stage_usage.max_rss,
+                "read_bytes": stage.bytes_read,
+                "written_bytes": stage.bytes_written,
+            }
+            event["stages"].append(stage_event)
+
+            counters["stages"] += 1
+            counters["builtins" if stage.builtin else "externals"] += 1
+            if stage_event["spawn_us"] is not None:
+                counters["spawn_us"] += stage_event["spawn_us"]
+            counters["run_us"] += stage_event["real_us"]
+            counters["read_bytes"] += stage.bytes_read or 0
+            counters["written_bytes"] += stage.bytes_written or 0
+
+    def end_line(self, status: int):
+        """Finish the event of the current line and write it out"""
+        line = self.line
+        if line is None:
+            # Tracing was turned on by the line itself
+            return
+        self.line = None
+        line.update(status=status, real_us=microseconds(time.perf_counter() - self.line_started))
+
+        counters = self.counters
+        counters["lines"] += 1
+        counters["cache_" + line["cache"]] += 1
+        counters["line_us"] += line["real_us"]
+        if status != 0:
+            counters["failures"] += 1
+
+        if self.path is None:
+            return
+        try:
+            if self.writer is None:
+                self.writer = TraceWriter(self.path)
+                atexit.register(self.close)
+            self.writer.write(line)
+        except OSError as e:
+            self._unwritable(e)
+
+    def flush(self):
+        if self.writer is not None:
+            try:
+                self.writer.flush()
+            except OSError as e:
+                self._unwritable(e)
+
+    def close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except OSError as e:
+                self._unwritable(e)
+            self.writer = None
+
+    def _unwritable(self, error: OSError):
+        """Warn once and stop writing events, the counters carry on"""
+        print(f"trace: {self.path}: {error.strerror or error}", file=sys.stderr)
+        self.path = None
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            try:
+                writer.close()
+            except OSError:
+                # The buffered events it fails to flush are lost either way
+                pass
+
+    @classmethod
+    def from_environment(cls, options) -> "Tracer":
+        """Tracer writing to the file ECHOCRAFT_TRACE names, which turns tracing on"""
+        path = os.environ.get(TRACE_ENV) or None
+        if path is not None:
+            options.trace = True
+        return cls(options, path)
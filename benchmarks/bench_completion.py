@@ -0,0 +1,57 @@
+"""
+Benchmark for Tab completion in a large directory and from PATH
+
+Creates a directory of 100k files and times completing in it: the first
+Tab, which lists it, then the next ones served from the cached listing,
+with a prefix matching a few names and with one matching all of them.
+Then times indexing PATH from scratch and completing a command name from
+the index.
+
+Run from the project root, optionally with the number of files:
+    python -m benchmarks.bench_completion [100000]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from app.completion import Completer, ExecutableIndex
+
+RUNS = 20
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def median_ms(function) -> float:
+    return statistics.median(timed(function) for _ in range(RUNS)) * 1e3
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(count):
+            open(os.path.join(directory, f"file{i:06d}.txt"), "w").close()
+        # Old enough for the listing to be trusted as long as the mtime holds
+        os.utime(directory, (time.time() - 60, time.time() - 60))
+
+        completer = Completer(lambda: [])
+        word = directory + "/file00001"
+        print(f"{count} files")
+        print(f"first Tab, listing   {timed(lambda: completer.matches('cat ', word)) * 1e3:8.2f} ms")
+        print(f"Tab, {len(completer.matches('cat ', word)):>3} matches      {median_ms(lambda: completer.matches('cat ', word)):8.2f} ms")
+        every = directory + "/"
+        print(f"Tab, every file      {median_ms(lambda: completer.matches('cat ', every)):8.2f} ms")
+
+    index = ExecutableIndex()
+    seconds = timed(lambda: (index.start(), index.wait()))
+    print(f"PATH index           {seconds * 1e3:8.2f} ms  {len(index.names)} executables")
+    print(f"Tab, command name    {median_ms(lambda: index.complete('py')):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark for the throughput of pipelines fed from a large file
+
+Compares handing the file over as a descriptor (`< file`), the native cat
+sending it with sendfile, the same cat copying it through Python, the
+external cat, and subprocess.run(input=...) holding the whole file in
+memory. The consumer is always the external wc, so only the feeding
+differs. Throughput is mostly bound by wc, the CPU time the shell itself
+spent shows what each way of feeding costs.
+
+Run from the project root, optionally with the size in MiB:
+    python -m benchmarks.bench_file_feed [512]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from app.commands import textutils
+from app.shell import Shell
+
+RUNS = 3
+
+PIPELINES = [
+    ("redirect", "command wc -c < {f}"),
+    ("cat, sendfile", "cat {f} | command wc -c"),
+    ("cat, copied", "cat {f} | command wc -c"),
+    ("external cat", "command cat {f} | command wc -c"),
+]
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(run) -> tuple:
+    """Best wall time of a few runs, and the shell's CPU time per run"""
+    best = float("inf")
+    cpu = cpu_time()
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best, (cpu_time() - cpu) / RUNS
+
+
+def bench(shell: Shell, line: str) -> tuple:
+    plan = shell.planner.plan(line).lists[0].pipelines[0]
+    return measure(lambda: shell.pipe_processor.execute_plan(plan))
+
+
+def bench_input(path: str) -> tuple:
+    def run():
+        with open(path, "rb") as file:
+            subprocess.run(["wc", "-c"], input=file.read(), capture_output=True)
+    return measure(run)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    shell = Shell()
+    send_file = textutils.send_file
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input.bin")
+        with open(path, "wb") as file:
+            block = os.urandom(1024 * 1024)
+            for _ in range(size):
+                file.write(block)
+
+        results = []
+        for name, template in PIPELINES:
+            # The copied run is the native cat with sendfile out of the way
+            textutils.send_file = (lambda file, stdout: False) if name == "cat, copied" else send_file
+            results.append((name, bench(shell, template.format(f=path))))
+        textutils.send_file = send_file
+        results.append(("subprocess input=", bench_input(path)))
+
+        for name, (seconds, cpu) in results:
+            print(f"{name:<20} {seconds * 1e3:8.1f} ms  {size / seconds:8.0f} MiB/s  shell cpu {cpu * 1e3:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark for pathname expansion on large trees
+
+Creates a directory of 200k files and a source tree of 1000 directories
+holding 100 files each, then times expanding *.ext in the large directory,
+src/**/*.py over the tree, and a line repeating patterns on the same
+directory, which lists it once. The first expansion of a line lists the
+directories, the next ones of the same line reuse the listings, so both
+are shown.
+
+Run from the project root, optionally with the number of files:
+    python -m benchmarks.bench_glob [200000]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from app.globbing import Globber
+from app.lexical import MyLex
+
+RUNS = 10
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def median_ms(function) -> float:
+    return statistics.median(timed(function) for _ in range(RUNS)) * 1e3
+
+
+def first_ms(globber: Globber, function) -> float:
+    """Median of runs that each list the directories again, as a new line does"""
+    def run():
+        globber.clear()
+        function()
+    return median_ms(run)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir("big")
+        for i in range(count):
+            open(f"big/file{i:06d}.{'log' if i % 10 == 0 else 'txt'}", "w").close()
+        for i in range(1000):
+            package = f"src/pkg{i // 100:02d}/mod{i:03d}"
+            os.makedirs(package)
+            for j in range(100):
+                open(f"{package}/f{j:02d}.{'py' if j % 2 else 'c'}", "w").close()
+
+        globber = Globber()
+        print(f"{count} files in one directory, 100k files in 1000 directories")
+        for pattern in ("big/*.log", "big/file0001??.txt", "src/**/*.py"):
+            matches = len(globber.glob(pattern))
+            print(f"{pattern:<20} {matches:>6} paths  first {first_ms(globber, lambda: globber.glob(pattern)):8.2f} ms"
+                  f"  cached {median_ms(lambda: globber.glob(pattern)):8.2f} ms")
+
+        tokens = MyLex("ls big/*.log big/*0.txt big/file1* big/[ab]*").parse()
+        globber.clear()
+        globber.scans = 0
+        globber.expand(tokens)
+        print(f"4 patterns, one line  {globber.scans} listing   {first_ms(globber, lambda: globber.expand(tokens)):8.2f} ms")
+        os.chdir("/")
+
+
+if __name__ == "__main__":
+    main()
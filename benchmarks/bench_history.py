@@ -0,0 +1,79 @@
+"""
+Benchmark for the history store on a large history
+
+Writes a history of a million varied commands, then times building its
+index, opening it again the way a new session does, loading the last
+entries for readline, and searching it. Then builds the fuzzy index of
+the picker from it and times every keystroke of a few queries typed one
+character at a time.
+
+Run from the project root, optionally with the number of entries:
+    python -m benchmarks.bench_history [1000000]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from app.history.fuzzy import FuzzyIndex
+from app.history.store import HistoryStore, encode_entry
+
+COMMANDS = [
+    "git commit -m 'fix {w}'", "git checkout {w}", "ls -la {w}", "cd ~/src/{w}", "grep -rn {w} .",
+    "python -m pytest tests/test_{w}.py", "vim {w}.py", "docker run --rm {w}", "make {w}", "cat {w}.log | wc -l",
+]
+
+SEARCHES = ["pytest", "docker run", "fix w1234", "zz-no-such-command", "cd"]
+
+TYPED = ["gitco", "pytw123", "dockrmw42", "fixw12345", "zzq"]
+
+DIRECTORIES = ["/home/user/src", "/home/user/src/app", "/tmp"]
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history")
+        with open(path, "wb") as file:
+            for i in range(count):
+                command = rng.choice(COMMANDS).format(w=f"w{rng.randrange(100_000)}")
+                file.write(encode_entry(command, rng.choice((0, 0, 0, 1)), rng.choice(DIRECTORIES), 1.7e9 + i))
+        print(f"{count} entries, {os.path.getsize(path) / 2**20:.1f} MiB")
+
+        seconds, _ = timed(lambda: len(HistoryStore(path)))
+        print(f"first index build  {seconds * 1e3:9.1f} ms")
+
+        seconds, store = timed(lambda: HistoryStore(path))
+        seconds, _ = timed(lambda: len(store))
+        print(f"open with index    {seconds * 1e3:9.2f} ms")
+        seconds, _ = timed(lambda: HistoryStore(path).last(1000))
+        print(f"last 1000 entries  {seconds * 1e3:9.2f} ms")
+
+        for pattern in SEARCHES:
+            seconds, matches = timed(lambda: sum(1 for _ in store.search(pattern)))
+            print(f"search {pattern!r:<22} {seconds * 1e3:8.2f} ms  {matches} matches")
+        print(f"index size         {os.path.getsize(store.index_path) / 2**20:9.1f} MiB")
+
+        index = FuzzyIndex()
+        seconds, _ = timed(lambda: index.extend((entry.command, entry.cwd, entry.time) for entry in store.entries()))
+        print(f"fuzzy index build  {seconds * 1e3:9.1f} ms  {len(index)} distinct commands")
+        for query in TYPED:
+            keystrokes = [timed(lambda: index.search(query[:i], DIRECTORIES[0]))[0] for i in range(1, len(query) + 1)]
+            print(f"typing {query!r:<12} per key {statistics.median(keystrokes) * 1e3:6.2f} ms median, "
+                  f"{max(keystrokes) * 1e3:6.2f} ms max")
+        seconds, _ = timed(lambda: index.add("git commit -m 'fix w1'", DIRECTORIES[0], time.time()))
+        print(f"fuzzy add          {seconds * 1e3:9.2f} ms")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark for the lexer on huge generated command lines
+
+Run from the project root:
+    python -m benchmarks.bench_lexer
+"""
+
+import random
+import time
+from app.lexical import MyLex
+
+LINE_SIZE = 1_000_000
+ROUNDS = 5
+
+
+def generate_line(word_factory) -> str:
+    """Build an xargs-style command line of about LINE_SIZE characters"""
+    words = ["xargs"]
+    size = 0
+    while size < LINE_SIZE:
+        word = word_factory(len(words))
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+def plain_word(n: int) -> str:
+    return f"src/dir{random.randint(0, 999)}/file{n}.txt"
+
+
+def quoted_word(n: int) -> str:
+    return random.choice([
+        plain_word(n),
+        f"'single quoted {n}'",
+        f'"double \\"quoted\\" {n}"',
+        f"escaped\\ space{n}",
+        f"--flag={n}",
+    ])
+
+
+def bench(name: str, line: str):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        tokens = MyLex(line).parse()
+        best = min(best, time.perf_counter() - start)
+
+    print(f"{name:<8} {len(line) / 1e6:.1f} MB  {len(tokens):>7} tokens  "
+          f"{best * 1000:8.1f} ms  {len(line) / best / 1e6:6.1f} MB/s")
+
+
+def main():
+    random.seed(0)
+    bench("plain", generate_line(plain_word))
+    bench("quoted", generate_line(quoted_word))
+
+
+if __name__ == "__main__":
+    main()
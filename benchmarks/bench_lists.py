@@ -0,0 +1,60 @@
+"""
+Benchmark for parsing long command lists, to keep the parser linear
+
+The time per pipeline should stay flat as chains get longer; a parser
+that rescans or nests would show it growing with the length.
+
+Run from the project root:
+    python -m benchmarks.bench_lists
+"""
+
+import gc
+import time
+from app.parser.plan import PlanCache, Planner
+
+LENGTHS = [1_000, 10_000, 100_000]
+ROUNDS = 5
+
+# Cycled through to build the chains, mixing every list operator
+PIECES = ["true", " && ", "grep -v x file.txt", " || ", "echo 'a;b' > out.txt", "; ", "sleep 0", " & "]
+
+
+def generate_chain(pipelines: int) -> str:
+    """A line of the given number of pipelines joined by list operators"""
+    parts = []
+    for i in range(pipelines * 2 - 1):
+        parts.append(PIECES[i % len(PIECES)])
+    return "".join(parts)
+
+
+def bench(pipelines: int) -> float:
+    line = generate_chain(pipelines)
+    # Nothing cached, every round parses the line again
+    planner = Planner(PlanCache(0))
+
+    # Collections get slower as the heap grows, which would hide how the
+    # parser itself scales, so they are kept out like timeit does
+    gc.disable()
+    try:
+        best = float("inf")
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            planner.plan(line)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best
+
+
+def main():
+    first = None
+    for pipelines in LENGTHS:
+        best = bench(pipelines)
+        per_pipeline = best / pipelines * 1e9
+        first = first or per_pipeline
+        print(f"{pipelines:>7} pipelines  {best * 1000:8.1f} ms  "
+              f"{per_pipeline:8.0f} ns/pipeline  x{per_pipeline / first:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark for the latency of short pipelines over small inputs
+
+Runs each pipeline with the native text utilities and again with
+`command` in front of every stage, which forces the external binaries.
+
+Run from the project root:
+    python -m benchmarks.bench_pipelines
+"""
+
+import os
+import tempfile
+import time
+from app.shell import Shell
+
+RUNS = 200
+
+PIPELINES = [
+    "cat {f} | grep alpha | wc -l",
+    "grep -c beta {f}",
+    "head -n 5 {f} | tail -n 2",
+    "cat {f} | tee {out} | wc",
+]
+
+
+def bench(shell: Shell, line: str) -> float:
+    plan = shell.planner.plan(line).lists[0].pipelines[0]
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        shell.pipe_processor.execute_plan(plan)
+    return (time.perf_counter() - start) / RUNS
+
+
+def external(line: str) -> str:
+    return " | ".join(f"command {stage.strip()}" for stage in line.split("|"))
+
+
+def main():
+    shell = Shell()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input.txt")
+        with open(path, "w") as file:
+            for i in range(100):
+                file.write(f"line {i} {'alpha' if i % 3 else 'beta'}\n")
+
+        for template in PIPELINES:
+            line = template.format(f=path, out=os.path.join(directory, "out.txt"))
+            native = bench(shell, line)
+            forked = bench(shell, external(line))
+            print(f"{template:<32} native {native * 1e6:8.0f} us  "
+                  f"external {forked * 1e6:8.0f} us  {forked / native:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
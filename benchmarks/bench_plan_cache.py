@@ -0,0 +1,63 @@
+"""
+Benchmark for the cache of parsed plans on a realistic stream of lines
+
+Replays 100k lines drawn from 1000 distinct ones with a Zipf-like skew,
+the way a loop in a script or a session's history repeats a few commands
+much more than the rest, and times planning them all with the cache at
+its default size and with it turned off. Prints the hit rate and the
+time per line of both.
+
+Run from the project root:
+    python -m benchmarks.bench_plan_cache
+"""
+
+import random
+import time
+from app.parser.plan import PlanCache, Planner
+
+LINES = 100_000
+DISTINCT = 1_000
+ROUNDS = 3
+
+# Shapes of the distinct lines, filled in with a number
+TEMPLATES = [
+    "cat file{0}.txt | grep -v 'pattern {0}' | sort | uniq -c > out{0}.txt",
+    "echo build {0} && make target{0} 2>> errors.log || echo failed {0}",
+    "ls -la dir{0} | head -n 20",
+    "git log --oneline -n {0} | wc -l",
+]
+
+
+def generate_lines() -> list:
+    rng = random.Random(0)
+    distinct = [TEMPLATES[i % len(TEMPLATES)].format(i) for i in range(DISTINCT)]
+    weights = [1 / (rank + 1) for rank in range(DISTINCT)]
+    return rng.choices(distinct, weights, k=LINES)
+
+
+def bench(lines: list, cache_size: int):
+    """Best time to plan every line, and the cache of that round"""
+    best, cache = float("inf"), None
+    for _ in range(ROUNDS):
+        cache = PlanCache(cache_size)
+        planner = Planner(cache)
+        start = time.perf_counter()
+        for line in lines:
+            planner.plan(line)
+        best = min(best, time.perf_counter() - start)
+    return best, cache
+
+
+def main():
+    lines = generate_lines()
+    uncached, _ = bench(lines, 0)
+    cached, cache = bench(lines, PlanCache().max_size)
+    hit_rate = cache.hits / (cache.hits + cache.misses)
+    print(f"{LINES} lines, {DISTINCT} distinct")
+    print(f"no cache        {uncached / LINES * 1e6:8.2f} us/line")
+    print(f"cache of {cache.max_size:<5}  {cached / LINES * 1e6:8.2f} us/line  "
+          f"hit rate {hit_rate:.1%}  evictions {cache.evictions}  x{uncached / cached:.1f}")
+
+
+if __name__ == "__main__":
+    main()
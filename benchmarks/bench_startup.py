@@ -0,0 +1,93 @@
+"""
+Benchmark for how long a fresh shell takes to be ready
+
+Starts the shell many times: in batch mode running `true`, and
+interactively on a pseudo-terminal until the first prompt shows up. Each
+start is compared to a bare interpreter doing nothing, and the median of
+what the shell adds on top of it has to stay within the budget, or the
+benchmark exits with status 1. The history file lives in a temporary home
+directory so the user's own doesn't skew the numbers.
+
+Run from the project root:
+    python -m benchmarks.bench_startup
+"""
+
+import os
+import pty
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 30
+
+# Milliseconds a shell may take on top of a bare interpreter
+BUDGET_MS = {"batch": 60, "interactive": 60}
+
+PROMPT = b"$ "
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def time_batch(env) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "app.main", "-c", "true"], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def time_bare(env) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def time_interactive(env) -> float:
+    """Time from starting the shell on a terminal to its first prompt"""
+    master, slave = pty.openpty()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.main"], stdin=slave, stdout=slave, stderr=slave, env=env,
+        start_new_session=True
+    )
+    os.close(slave)
+    output = b""
+    try:
+        while not output.endswith(PROMPT):
+            if not select.select([master], [], [], 10)[0]:
+                raise TimeoutError("no prompt")
+            output += os.read(master, 65536)
+        return time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+        os.close(master)
+
+
+def median_ms(measure, env) -> float:
+    # One run first, so every measured one finds the files in the page cache
+    measure(env)
+    return statistics.median(measure(env) for _ in range(RUNS)) * 1e3
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, PYTHONPATH=PROJECT_ROOT, HOME=home)
+        bare = median_ms(time_bare, env)
+        print(f"{'bare interpreter':<14} {bare:7.1f} ms")
+
+        over_budget = False
+        for name, measure in (("batch", time_batch), ("interactive", time_interactive)):
+            total = median_ms(measure, env)
+            added = total - bare
+            budget = BUDGET_MS[name]
+            verdict = "ok" if added <= budget else "OVER BUDGET"
+            over_budget = over_budget or added > budget
+            print(f"{name:<14} {total:7.1f} ms  +{added:5.1f} ms over the interpreter, budget {budget} ms: {verdict}")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
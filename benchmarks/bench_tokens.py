@@ -0,0 +1,71 @@
+"""
+Benchmark for the memory footprint of tokens and the speed of parsing them
+
+Run from the project root:
+    python -m benchmarks.bench_tokens
+"""
+
+import time
+import tracemalloc
+from app.lexical import MyLex
+from app.lexical.token import Token, TokenType
+from app.parser.pipe import PipeParser
+from app.parser.redirect import RedirectParser
+
+TOKEN_COUNT = 1_000_000
+ROUNDS = 5
+
+
+class DictToken:
+    """Token the way it used to be stored, with a per-instance __dict__"""
+
+    def __init__(self, type: TokenType = TokenType.WORD, value: str = "", position: int = 0):
+        self.type = type
+        self.value = value
+        self.position = position
+
+
+def bytes_per_token(factory) -> float:
+    """Memory allocated per token, not counting the shared value strings"""
+    value = "word"
+    tracemalloc.start()
+    tokens = [factory(TokenType.WORD, value, 0) for _ in range(TOKEN_COUNT)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tokens
+    return size / TOKEN_COUNT
+
+
+def generate_line() -> str:
+    """A long pipeline with a redirect every few words"""
+    stages = []
+    words = 0
+    while words < TOKEN_COUNT:
+        stages.append(f"grep -v pattern{words} file{words}.txt 2> err{words}.log")
+        words += 7
+    return " | ".join(stages)
+
+
+def bench_parse(tokens: list):
+    pipe_parser = PipeParser()
+    redirect_parser = RedirectParser()
+
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for pipe_command in pipe_parser.parse(tokens):
+            redirect_parser.parse([pipe_command.command] + pipe_command.args)
+        best = min(best, time.perf_counter() - start)
+
+    print(f"parse    {len(tokens):>7} tokens  {best * 1000:8.1f} ms  "
+          f"{best / len(tokens) * 1e9:6.1f} ns/token")
+
+
+def main():
+    print(f"memory   dict-backed {bytes_per_token(DictToken):6.1f} B/token  "
+          f"Token {bytes_per_token(Token):6.1f} B/token")
+    bench_parse(MyLex(generate_line()).parse())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import pytest
+from app.shell import Shell
+
+
+@pytest.fixture
+def shell():
+    return Shell()
+
+
+@pytest.fixture
+def run(shell):
+    """Run the first pipeline of a line in the shell fixture, returning (exit_code, stdout, stderr)"""
+    def run(line):
+        return shell.pipe_processor.execute_plan(shell.planner.plan(line).lists[0].pipelines[0])
+    return run
@@ -0,0 +1,156 @@
+import subprocess
+import os
+import time
+
+SHELL_SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "echo-craft.sh"))
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def run_batch(args, tmp_path, stdin=None):
+    env = os.environ.copy()
+    env["PYTHONPATH"] = PROJECT_ROOT
+
+    return subprocess.run(
+        [SHELL_SCRIPT] + args,
+        cwd=str(tmp_path),
+        env=env,
+        input=stdin,
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+
+
+def test_command_string(tmp_path):
+    result = run_batch(["-c", "echo hello world | tr a-z A-Z"], tmp_path)
+    assert result.stdout == "HELLO WORLD\n"
+    assert result.returncode == 0
+
+
+def test_script_file(tmp_path):
+    script = tmp_path / "script.ecs"
+    script.write_text("# comment\necho one > out.txt\n\necho two >> out.txt\ncat out.txt\nls missing-file\n")
+
+    result = run_batch([str(script)], tmp_path)
+    assert result.stdout == "one\ntwo\n"
+    assert "missing-file" in result.stderr
+    # No banner or prompt in batch mode
+    assert "$ " not in result.stdout
+    assert result.returncode == 2
+
+
+def test_commands_on_stdin(tmp_path):
+    result = run_batch([], tmp_path, stdin="echo first\nexit\necho never\n")
+    assert result.stdout == "first\n"
+
+
+def test_history_not_available(tmp_path):
+    result = run_batch(["-c", "history; history -s x"], tmp_path)
+    assert result.stderr == "history: not available in batch mode\n" * 2
+    assert result.returncode == 1
+
+
+def test_parse_cache(tmp_path):
+    result = run_batch(["-c", "echo a > x.txt\necho a > x.txt\ncat x.txt\nparsecache\nparsecache -s 1\nparsecache"], tmp_path)
+    lines = result.stdout.splitlines()
+    assert lines[0] == "a"
+    stats = dict(line.split(None, 1) for line in lines[1:5])
+    assert stats == {"size": "3/256", "hits": "1", "misses": "3", "evictions": "0"}
+    assert lines[5].split() == ["size", "1/1"]
+    assert lines[7].split() == ["misses", "5"]
+
+
+def test_background_job_and_wait(tmp_path):
+    result = run_batch(["-c", "sh -c 'sleep 0.2; echo late' &\necho early\njobs\nwait\necho done"], tmp_path)
+    assert result.stdout == "early\n[1]+  Running                 sh -c 'sleep 0.2; echo late' &\nlate\ndone\n"
+
+
+def test_command_lists(tmp_path):
+    result = run_batch(["-c", "echo a; false && echo no || echo b; true || echo no; cd nowhere 2>/dev/null && echo no"], tmp_path)
+    assert result.stdout == "a\nb\n"
+    assert result.returncode == 1
+
+
+def test_kill_builtin_job(tmp_path):
+    result = run_batch(["-c", "cat /dev/zero | wc -c & kill %1; wait; echo done"], tmp_path)
+    assert result.stdout == "done\n"
+
+
+def test_time_keyword(tmp_path):
+    result = run_batch(["-c", "time echo hi | tr a-z A-Z"], tmp_path)
+    assert result.stdout == "HI\n"
+    lines = result.stderr.splitlines()
+    assert [line.split("\t")[0] for line in lines[1:5]] == ["real", "user", "sys", "maxrss"]
+    assert lines[-2].endswith("  echo hi") and lines[-1].endswith("  tr a-z A-Z")
+
+
+def test_glob_expansion(tmp_path):
+    (tmp_path / "b.log").write_text("")
+    (tmp_path / "a.log").write_text("")
+    result = run_batch(["-c", "echo *.log '*.log' *.none; touch c.log; echo *.log"], tmp_path)
+    assert result.stdout == "a.log b.log *.log *.none\na.log b.log c.log\n"
+
+
+def test_bench(tmp_path):
+    result = run_batch(["-c", "bench -n 4 -w 0 'echo hi | command cat'\nbench false"], tmp_path)
+    lines = result.stdout.splitlines()
+    assert lines[0] == "bench: echo hi | command cat"
+    assert [line.split()[0] for line in lines[1:]] == ["mean", "median", "p95", "range"]
+    assert lines[-1].endswith("4 runs")
+    assert result.stderr == "bench: command failed with exit code 1, use -i to ignore failures\n"
+
+
+def test_timeout(tmp_path):
+    script = (
+        "timeout 0.2 sh -c 'sleep 5 & wait' || echo group timed out\n"
+        "timeout -k 0.1 0.1 sh -c 'trap \"\" TERM; sleep 5' || echo killed\n"
+        "timeout -d 0.2\ntimeout\nsleep 5 || echo default timed out\n"
+        "timeout -d 0\nsleep 0.3 && echo no default"
+    )
+    result = run_batch(["-c", script], tmp_path)
+    assert result.stdout == "group timed out\nkilled\ntimeout -k 5 -s TERM -d 0.2\ndefault timed out\nno default\n"
+
+
+def test_timeout_kill_status(tmp_path):
+    # Like coreutils timeout, a pipeline that had to be killed exits with 128 + SIGKILL
+    result = run_batch(["-c", "timeout -s KILL 0.1 sleep 5"], tmp_path)
+    assert result.returncode == 137
+    result = run_batch(["-c", "timeout -k 0.1 0.1 sh -c 'trap \"\" TERM; sleep 5'"], tmp_path)
+    assert result.returncode == 137
+    result = run_batch(["-c", "timeout -s INT 0.1 sleep 5"], tmp_path)
+    assert result.returncode == 124
+
+
+def test_timeout_builtin_pipeline(tmp_path):
+    start = time.monotonic()
+    result = run_batch(["-c", "timeout 1 cat /dev/zero | wc -c"], tmp_path)
+    assert result.returncode == 124
+    result = run_batch(["-c", "timeout -d 1\ncat /dev/zero > /dev/null"], tmp_path)
+    assert result.returncode == 124
+    assert time.monotonic() - start < 5
+
+
+def test_ulimit(tmp_path):
+    result = run_batch(["-c", "ulimit -n 32\nulimit -n\nsh -c 'ulimit -n'\nulimit -t 1\nsh -c 'while :; do :; done'"], tmp_path)
+    assert result.stdout == "32\n32\n"
+    # Killed once out of CPU time, soft and hard limits being the same
+    assert result.returncode == 128 + 9
+
+
+def test_startup_profile(tmp_path):
+    result = run_batch(["--startup-profile", "-c", "echo hi"], tmp_path)
+    assert result.stdout == "hi\n"
+    lines = result.stderr.splitlines()
+    assert lines[0] == "startup profile:"
+    assert [line.split()[0] for line in lines[1:4]] == ["imports", "shell", "total"]
+    assert lines[4].startswith("  slowest imports")
+
+
+def test_startup_skips_unused_modules(tmp_path):
+    unused = ["readline", "concurrent.futures", "tempfile", "json", "statistics", "app.commands.textutils"]
+    code = f"import sys; from app.shell import Shell; Shell(); print([m for m in {unused!r} if m in sys.modules])"
+    result = subprocess.run(
+        ["python3", "-c", code], cwd=str(tmp_path), env=dict(os.environ, PYTHONPATH=PROJECT_ROOT),
+        capture_output=True, text=True, timeout=10
+    )
+    assert result.stdout == "[]\n"
@@ -0,0 +1,48 @@
+import io
+import mmap
+from app.capture import CaptureBuffer
+from app.shell import Shell
+
+
+def test_small_output_stays_in_memory():
+    buffer = CaptureBuffer(limit=16)
+    buffer.write(b"abc")
+    buffer.write(memoryview(b"def"))
+
+    assert not buffer.spilled
+    assert len(buffer) == 6
+    assert buffer.view() == b"abcdef"
+    assert buffer.getvalue() == b"abcdef"
+
+
+def test_large_output_spills_to_a_file():
+    buffer = CaptureBuffer(limit=16)
+    for i in range(100):
+        buffer.write(b"%09d\n" % i)
+    expected = b"".join(b"%09d\n" % i for i in range(100))
+
+    assert buffer.spilled
+    assert len(buffer) == len(expected)
+    with buffer.view() as view:
+        assert isinstance(view, mmap.mmap)
+        assert view[:] == expected
+    assert buffer.getvalue() == expected
+
+    copy = io.BytesIO()
+    buffer.copy_to(copy)
+    assert copy.getvalue() == expected
+
+    buffer.close()
+    assert not buffer.spilled and len(buffer) == 0
+
+
+def test_pipeline_output_beyond_the_limit():
+    shell = Shell(capture_limit=1024)
+    plan = shell.planner.plan("seq 1 100000").lists[0].pipelines[0]
+    pipeline = shell.pipe_processor.start_plan(plan)
+    pipeline.wait()
+
+    stdout = pipeline.stdout
+    assert stdout.spilled
+    assert stdout.getvalue() == "".join(f"{i}\n" for i in range(1, 100001)).encode()
+    pipeline.close()
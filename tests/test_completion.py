@@ -0,0 +1,75 @@
+import os
+from app.completion import Completer, DirectoryCache, ExecutableIndex, word_start
+
+
+def make_executable(path):
+    with open(path, "w") as file:
+        file.write("#!/bin/sh\n")
+    os.chmod(path, 0o755)
+
+
+def set_mtime(path, seconds):
+    os.utime(path, ns=(seconds * 10**9, seconds * 10**9))
+
+
+def test_directory_listing_is_cached_until_the_mtime_changes(tmp_path):
+    (tmp_path / "alpha").write_text("")
+    set_mtime(tmp_path, 1000)
+    cache = DirectoryCache()
+
+    assert cache.listing(str(tmp_path)).names == ["alpha"]
+    (tmp_path / "beta").write_text("")
+    set_mtime(tmp_path, 1000)
+    assert cache.listing(str(tmp_path)).names == ["alpha"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    set_mtime(tmp_path, 2000)
+    assert cache.listing(str(tmp_path)).names == ["alpha", "beta"]
+    assert cache.listing(str(tmp_path / "missing")) is None
+
+
+def test_recently_changed_directory_is_listed_again(tmp_path):
+    cache = DirectoryCache()
+    cache.listing(str(tmp_path))
+    cache.listing(str(tmp_path))
+    assert cache.misses == 2
+
+
+def test_executable_index_follows_path_changes(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    make_executable(bin_dir / "frobnicate")
+    (bin_dir / "notes.txt").write_text("")
+    monkeypatch.setenv("PATH", str(bin_dir))
+    index = ExecutableIndex()
+
+    assert index.complete("frob") == ["frobnicate"]
+    assert index.refresh()
+
+    make_executable(bin_dir / "frobulate")
+    set_mtime(bin_dir, 5000)
+    assert not index.refresh()
+    index.wait()
+    assert index.complete("frob") == ["frobnicate", "frobulate"]
+    assert index.complete("notes") == []
+
+
+def test_completes_commands_then_paths(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    make_executable(bin_dir / "hashcat")
+    monkeypatch.setenv("PATH", str(bin_dir))
+    (tmp_path / "some dir").mkdir()
+    (tmp_path / "some dir" / "file.txt").write_text("")
+    (tmp_path / ".hidden").write_text("")
+    monkeypatch.chdir(tmp_path)
+    completer = Completer(lambda: ["hash", "history"])
+
+    assert completer.matches("", "has") == ["hash", "hashcat"]
+    assert completer.matches("echo hi | ", "hi") == ["history "]
+    assert completer.matches("cat ", "so") == ["some\\ dir/"]
+    assert completer.matches("cat ", "some\\ dir/f") == ["some\\ dir/file.txt "]
+    assert completer.matches("cat ", "") == ["bin/", "some\\ dir/"]
+    assert completer.matches("cat ", ".h") == [".hidden "]
+    assert completer.matches("", "./b") == ["./bin/"]
+    assert word_start("cat some\\ dir/f", 15) == 4
@@ -0,0 +1,95 @@
+import os
+from app.globbing import Globber, compile_segment, escape
+from app.lexical import MyLex
+
+
+def make_tree(root, paths):
+    for path in paths:
+        path = root / path
+        if str(path).endswith("/"):
+            path.mkdir(parents=True, exist_ok=True)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("")
+
+
+def expand(line):
+    return [token.value for token in Globber().expand(MyLex(line).parse())]
+
+
+def test_wildcards_and_classes(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["a.log", "b.log", "ab.log", "c.txt", ".hidden.log", "d]"])
+    monkeypatch.chdir(tmp_path)
+    globber = Globber()
+
+    assert globber.glob("*.log") == ["a.log", "ab.log", "b.log"]
+    assert globber.glob("?.log") == ["a.log", "b.log"]
+    assert globber.glob("[ab].log") == ["a.log", "b.log"]
+    assert globber.glob("[!a]*") == ["b.log", "c.txt", "d]"]
+    assert globber.glob("a*g") == ["a.log", "ab.log"]
+    assert globber.glob(".*.log") == [".hidden.log"]
+    assert globber.glob("d[]]") == ["d]"]
+    assert globber.glob("*.none") == []
+
+
+def test_directories_and_double_star(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["src/m.py", "src/a/n.py", "src/a/b/o.py", "src/.git/p.py", "src/a/readme", "top.py"])
+    os.symlink(tmp_path / "src" / "a", tmp_path / "src" / "link")
+    monkeypatch.chdir(tmp_path)
+    globber = Globber()
+
+    assert globber.glob("src/**/*.py") == ["src/a/b/o.py", "src/a/n.py", "src/m.py"]
+    assert globber.glob("src/a/**") == ["src/a/b", "src/a/b/o.py", "src/a/n.py", "src/a/readme"]
+    assert globber.glob("*/") == ["src/"]
+    assert globber.glob("src/*/n.py") == ["src/a/n.py", "src/link/n.py"]
+    assert globber.glob(str(tmp_path) + "/*.py") == [str(tmp_path / "top.py")]
+
+
+def test_words_expanded_in_place(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["x.log", "y.log"])
+    monkeypatch.chdir(tmp_path)
+
+    assert expand("echo *.log end") == ["echo", "x.log", "y.log", "end"]
+    assert expand("echo '*.log' *.none") == ["echo", "*.log", "*.none"]
+    assert expand("cat < *.log") == ["cat", "<", "*.log"]
+    assert expand("*.log") == ["*.log"]
+    assert expand("ls | *.log") == ["ls", "|", "*.log"]
+
+
+def test_listings_are_shared_by_a_line(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["a.log", "b.txt"])
+    monkeypatch.chdir(tmp_path)
+    globber = Globber()
+
+    globber.expand(MyLex("echo *.log *.txt ?.*").parse())
+    assert globber.scans == 1
+    (tmp_path / "c.log").write_text("")
+    os.utime(tmp_path, ns=(1, 1))
+    assert globber.glob("*.log") == ["a.log", "c.log"]
+    assert globber.scans == 2
+
+    globber.clear()
+    globber.glob("*.log")
+    assert globber.scans == 3
+
+
+def test_escaped_characters_are_literal(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["a*b", "axb"])
+    monkeypatch.chdir(tmp_path)
+
+    assert Globber().glob(escape("a*") + "*") == ["a*b"]
+    assert compile_segment("a[*]b").literal == "a*b"
+    assert compile_segment("*.log").suffix == ".log"
+
+
+def test_posix_character_classes(tmp_path, monkeypatch):
+    make_tree(tmp_path, ["a1", "B2", "33", "_x", "d e"])
+    monkeypatch.chdir(tmp_path)
+    globber = Globber()
+
+    assert globber.glob("[[:alpha:]]*") == ["B2", "a1", "d e"]
+    assert globber.glob("[![:alpha:]]*") == ["33", "_x"]
+    assert globber.glob("[[:digit:]_]?") == ["33", "_x"]
+    assert globber.glob("*[[:space:]]*") == ["d e"]
+    assert globber.glob("[[:upper:][:lower:]][[:digit:]]") == ["B2", "a1"]
+    assert globber.glob("[[:nonsense:]]*") == []
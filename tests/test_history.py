@@ -0,0 +1,147 @@
+import pytest
+from app.history import HistoryManager
+from app.history import fuzzy
+from app.history import store as history_store
+from app.history.fuzzy import FuzzyIndex, RankWeights, parse_weights
+from app.history.picker import HistoryPicker, split_keys
+from app.history.store import HistoryStore
+
+
+def test_entries_keep_status_and_directory(tmp_path):
+    store = HistoryStore(str(tmp_path / "history"))
+    store.append("echo 'a\tb'", 0, "/tmp", 1.5)
+    store.append("printf 'x\\ny'", None, "/home", 2.0)
+
+    first, second = store.entries()
+    assert (first.number, first.time, first.status, first.cwd, first.command) == (1, 1.5, 0, "/tmp", "echo 'a\tb'")
+    assert (second.status, second.command) == (None, "printf 'x\\ny'")
+    assert store.last(1) == ["printf 'x\\ny'"]
+
+
+def test_search_sees_entries_of_other_sessions(tmp_path):
+    path = str(tmp_path / "history")
+    store, other = HistoryStore(path), HistoryStore(path)
+    store.append("git status")
+    assert [entry.command for entry in other.search("status")] == ["git status"]
+
+    store.append("git push origin main")
+    other.append("ls")
+    assert [entry.number for entry in other.search("git")] == [1, 2]
+    assert [entry.command for entry in store.search("l")] == ["ls"]
+    assert list(store.search("missing")) == []
+
+
+def test_search_through_a_merged_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, "MERGE_THRESHOLD", 40)
+    path = str(tmp_path / "history")
+    store = HistoryStore(path)
+    for i in range(100):
+        store.append(f"make target{i}")
+        # Search in between so entries are indexed a few at a time
+        if i % 7 == 0:
+            list(store.search("target"))
+
+    assert store.index is not None
+    assert [entry.number for entry in store.search("target5")] == [6] + list(range(51, 61))
+    # A new session opens the index file and indexes what comes after it
+    assert [entry.command for entry in HistoryStore(path).search("target99")] == ["make target99"]
+
+
+def test_truncated_history_drops_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, "MERGE_THRESHOLD", 4)
+    path = tmp_path / "history"
+    store = HistoryStore(str(path))
+    for i in range(10):
+        store.append(f"echo {i}")
+    assert len(store) == 10
+
+    path.write_bytes(b"")
+    store.append("echo again")
+    assert [entry.command for entry in store.search("echo")] == ["echo again"]
+
+
+def test_manager_writes_commands_once_finished(tmp_path):
+    manager = HistoryManager(str(tmp_path / "history"))
+    manager.add_command("false")
+    assert manager.get_history() == [(1, "false")]
+    assert len(manager.store) == 0
+
+    manager.finish_command(1)
+    manager.add_command("echo done")
+    manager.save_history()
+
+    assert [(entry.command, entry.status) for entry in manager.store.entries()] == [("false", 1), ("echo done", None)]
+    assert [entry.cwd for entry in manager.store.entries()] == [str(tmp_path.cwd())] * 2
+
+
+def test_fuzzy_ranks_by_frequency_recency_and_directory():
+    index = FuzzyIndex()
+    index.extend([("git status", "/a", 1.0), ("git stash", "/a", 2.0), ("git status", "/a", 3.0)])
+    assert index.search("gst", "/b") == ["git status", "git stash"]
+
+    # Half a week later, one more run makes up for the runs of the other
+    index.add("git stash", "/b", 3.5 * 86400.0)
+    assert index.search("gst", "/elsewhere") == ["git stash", "git status"]
+    assert index.search("gst", "/a") == ["git status", "git stash"]
+    assert index.search("GST", "/b") == []
+    assert index.search("git sta", "/b", limit=1) == ["git stash"]
+
+
+def test_fuzzy_weights_are_configurable():
+    runs = [("make", "/src", 1.0), ("make", "/src", 2.0), ("make test", "/", 86400.0)]
+    by_recency, by_frequency = FuzzyIndex(RankWeights(frequency=0, cwd=0)), FuzzyIndex(RankWeights(recency=0, cwd=0))
+    by_recency.extend(runs)
+    by_frequency.extend(runs)
+
+    assert by_recency.search("mk", "/src") == ["make test", "make"]
+    assert by_frequency.search("mk", "/") == ["make", "make test"]
+    assert parse_weights("recency=2, cwd=0") == RankWeights(recency=2.0, cwd=0.0)
+    with pytest.raises(ValueError):
+        parse_weights("age=1")
+
+
+def test_fuzzy_rare_matches_are_searched_all_at_once(monkeypatch):
+    monkeypatch.setattr(fuzzy, "WALK_LIMIT", 4)
+    index = FuzzyIndex()
+    index.extend((f"echo {i}", "/", float(i)) for i in range(50))
+    index.add("Echo rare", "/", 100.0)
+
+    assert index.search("e7", "/") == ["echo 47", "echo 37", "echo 27", "echo 17", "echo 7"]
+    # Narrowed down from the last search
+    assert index.search("e47", "/") == ["echo 47"]
+    assert index.search("Er", "/") == ["Echo rare"]
+
+
+def test_picker_keys():
+    commands = ["git status", "git stash", "grep -rn todo"]
+    picker = HistoryPicker(lambda query, limit: [c for c in commands if query in c][:limit], "gi")
+    assert picker.matches == ["git status", "git stash"]
+
+    assert picker.press("\x1b[A") is None
+    assert picker.choice == "git stash"
+    for key in "t sh":
+        picker.press(key)
+    assert (picker.query, picker.choice) == ("git sh", None)
+    picker.press("\x15")
+    picker.press("r")
+    assert picker.press("\r") is True
+    assert picker.choice == "grep -rn todo"
+    assert picker.press("\x1b") is False
+    assert split_keys("a\x1b[Ab\x1b") == ["a", "\x1b[A", "b", "\x1b"]
+
+
+def test_manager_counts_commands_in_the_fuzzy_index_once(tmp_path):
+    path = str(tmp_path / "history")
+    manager, other = HistoryManager(path), HistoryManager(path)
+    manager.add_command("ls -l")
+    manager.finish_command(0)
+    assert manager.fuzzy_search("ls") == ["ls -l"]
+
+    manager.add_command("ls -a")
+    manager.finish_command(0)
+    other.add_command("ls -a")
+    other.finish_command(0)
+    other.save_history()
+
+    assert manager.fuzzy_search("ls") == ["ls -a", "ls -l"]
+    assert manager.fuzzy.runs[manager.fuzzy.numbers["ls -a"]] == 2
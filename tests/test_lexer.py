@@ -0,0 +1,84 @@
+import pytest
+from app.lexical import MyLex
+from app.lexical.token import TokenType
+
+
+def tokens(line):
+    return [(token.type, token.value) for token in MyLex(line).parse()]
+
+
+W, C = TokenType.WORD, TokenType.COMMAND
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("echo hello world", [(C, "echo"), (W, "hello"), (W, "world")]),
+    ("ls", [(W, "ls")]),
+    ("echo 'a  b' \"c  d\"", [(C, "echo"), (W, "a  b"), (W, "c  d")]),
+    ("echo 'x'\"y\"z", [(C, "echo"), (W, "xyz")]),
+    ("echo a\\ b \\'q\\'", [(C, "echo"), (W, "a b"), (W, "'q'")]),
+    ("echo \"a\\\"b\\$c\\d\"", [(C, "echo"), (W, "a\"b$c\\d")]),
+    ("echo 'a\\nb'", [(C, "echo"), (W, "a\\nb")]),
+    ("echo '' x", [(C, "echo"), (W, "x")]),
+    ("'my cmd' arg", [(C, "'my cmd'"), (W, "arg")]),
+    ("echo \"a | b\"", [(C, "echo"), (W, "a | b")]),
+])
+def test_words_and_quotes(line, expected):
+    assert tokens(line) == expected
+
+
+def test_pipes_type_commands():
+    assert tokens("cat f| grep x |wc -l") == [
+        (C, "cat"), (W, "f"), (TokenType.PIPE, "|"),
+        (C, "grep"), (W, "x"), (TokenType.PIPE, "|"),
+        (C, "wc"), (W, "-l"),
+    ]
+
+
+@pytest.mark.parametrize("operator, token_type", [
+    (">", TokenType.REDIRECT_OUT),
+    ("1>", TokenType.REDIRECT_STDOUT),
+    (">>", TokenType.REDIRECT_APPEND),
+    ("1>>", TokenType.REDIRECT_APPEND),
+    ("2>", TokenType.REDIRECT_STDERR),
+    ("2>>", TokenType.REDIRECT_STDERR_APPEND),
+    ("<", TokenType.REDIRECT_IN),
+    ("2>&1", TokenType.REDIRECT_DUP),
+    (">&2", TokenType.REDIRECT_DUP),
+])
+def test_redirect_operators(operator, token_type):
+    assert tokens(f"cmd a{operator}file") == [(C, "cmd"), (W, "a"), (token_type, operator), (W, "file")]
+
+
+def test_background_operator():
+    assert tokens("sleep 1 & echo a&b \"c&d\"") == [
+        (C, "sleep"), (W, "1"), (TokenType.BACKGROUND, "&"),
+        (C, "echo"), (W, "a"), (TokenType.BACKGROUND, "&"), (C, "b"), (W, "c&d"),
+    ]
+
+
+def test_list_operators():
+    assert tokens("a &&b|| c;d 'e;f'") == [
+        (C, "a"), (TokenType.AND, "&&"), (C, "b"), (TokenType.OR, "||"),
+        (C, "c"), (TokenType.SEMICOLON, ";"), (C, "d"), (W, "e;f"),
+    ]
+    lexer = MyLex("a && b; c")
+    lexer.parse()
+    assert lexer.operator_spans == {1: (2, 4), 3: (6, 7)}
+
+
+def test_positions_are_sequential():
+    assert [token.position for token in MyLex("a 'b' | c > d").parse()] == [0, 1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("line, pattern", [
+    ("ls *.log", "*.log"),
+    ("ls [ab]?.txt", "[ab]?.txt"),
+    ("ls \"*.log\"", None),
+    ("ls '*'", None),
+    ("ls a\\*b", None),
+    ("ls x\"y\"*", "xy*"),
+    ("ls 'a*'b*", "a[*]b*"),
+    ("ls plain", None),
+])
+def test_glob_patterns(line, pattern):
+    assert MyLex(line).parse()[-1].glob == pattern
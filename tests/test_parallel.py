@@ -0,0 +1,45 @@
+import time
+import pytest
+
+
+def test_inputs_from_stdin_in_order(run):
+    assert run("seq 5 | parallel -k -j 3 echo item-{}") == (
+        0, b"item-1\nitem-2\nitem-3\nitem-4\nitem-5\n", b""
+    )
+
+
+def test_input_appended_without_placeholder(run):
+    assert run("parallel -k echo 'a b' ::: x y") == (0, b"a b x\na b y\n", b"")
+
+
+def test_single_word_template_is_a_pipeline(run):
+    assert run("parallel -k 'echo {} | tr 1 X' ::: 1 21") == (0, b"X\n2X\n", b"")
+
+
+def test_jobs_run_concurrently(run):
+    start = time.perf_counter()
+    run("parallel -j 4 sleep ::: 0.3 0.3 0.3 0.3")
+    assert time.perf_counter() - start < 1.0
+
+
+def test_unordered_output_follows_completion(run):
+    exit_code, stdout, _ = run("parallel -j 3 sh -c 'sleep 0.{}; echo {}' ::: 4 1 2")
+    assert stdout == b"1\n2\n4\n"
+
+
+def test_failures_and_summary(run):
+    exit_code, _, stderr = run("parallel -k --summary sh -c 'exit {}' ::: 0 3 4")
+    assert exit_code == 2
+    lines = stderr.decode().splitlines()
+    assert [line.split()[0] for line in lines[1:4]] == ["0", "3", "4"]
+    assert lines[-1].startswith("parallel: 3 jobs, 2 failed in ")
+
+
+@pytest.mark.parametrize("line, message", [
+    ("parallel -j 0 echo", b"parallel: 0: invalid number of jobs\n"),
+    ("parallel", b"parallel: usage:"),
+    ("parallel 'echo ;' ::: a", b"parallel: syntax error near unexpected token `;'\n"),
+])
+def test_errors(run, line, message):
+    exit_code, _, stderr = run(line)
+    assert exit_code == 2 and stderr.startswith(message)
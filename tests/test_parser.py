@@ -0,0 +1,83 @@
+import pytest
+from app.lexical import MyLex
+from app.parser.command_list import ListParser
+from app.parser.pipe import PipeParser
+from app.parser.plan import Planner
+from app.parser.redirect import RedirectParser
+
+
+def parse(line):
+    return PipeParser().parse(MyLex(line).parse())
+
+
+def test_pipeline_stages():
+    commands = parse("cat f | grep -v x | wc -l")
+    assert [(command.command.value, [arg.value for arg in command.args]) for command in commands] == [
+        ("cat", ["f"]), ("grep", ["-v", "x"]), ("wc", ["-l"]),
+    ]
+    assert repr(commands[1]) == "PipeCommand('grep', ['-v', 'x'])"
+
+
+def test_redirects_split_out():
+    command = parse("sort -r < in.txt > out.txt 2>&1")[0]
+    command_tokens, instructions = RedirectParser().parse([command.command] + command.args)
+
+    assert [token.value for token in command_tokens] == ["sort", "-r"]
+    assert [(i.redirect_type, i.target, i.stream) for i in instructions] == [
+        ("<", "in.txt", "stdin"), (">", "out.txt", "stdout"), (">&", "1", "stderr"),
+    ]
+
+
+def test_command_lists():
+    lists = ListParser().parse(MyLex("a | b && c || d; e & f").parse())
+    assert [repr(and_or) for and_or in lists] == [
+        "AndOrList(['a | b', 'c', 'd'], ['and', 'or'], background=False)",
+        "AndOrList(['e'], [], background=True)",
+        "AndOrList(['f'], [], background=False)",
+    ]
+
+
+def test_list_plan_keeps_pipeline_text():
+    plan = Planner().plan("sleep 1 | cat &  echo 'a;b' && false;")
+    assert [(and_or.background, [pipeline.text for pipeline in and_or.pipelines]) for and_or in plan.lists] == [
+        (True, ["sleep 1 | cat"]), (False, ["echo 'a;b'", "false"]),
+    ]
+
+
+def test_long_chains_parse_flat():
+    # Far deeper than the recursion limit, nothing nests
+    line = " && ".join(["true"] * 50_000) + "; echo done"
+    plan = Planner().plan(line)
+    assert [len(and_or.pipelines) for and_or in plan.lists] == [50_000, 1]
+
+
+def test_timeout_keyword():
+    plan = Planner().plan("time timeout -k 1 -s INT 2m sleep 5 | cat").lists[0].pipelines[0]
+    assert plan.timed and plan.timeout == (120.0, 1.0, 2)
+    assert [stage.command.value for stage in plan.stages] == ["sleep", "cat"]
+
+    # Without a command after it, timeout is left to the built-in
+    plan = Planner().plan("timeout -d 30").lists[0].pipelines[0]
+    assert plan.timeout is None and plan.stages[0].command.value == "timeout"
+
+
+@pytest.mark.parametrize("line, message", [
+    ("; echo", "unexpected token `;'"),
+    ("a && && b", "unexpected token `&&'"),
+    ("a ||", "unexpected end of line"),
+    ("&", "unexpected token `&'"),
+    ("a && b &", "can't run in the background"),
+    ("timeout 5x sleep 1", "invalid time interval '5x'"),
+])
+def test_list_errors(line, message):
+    with pytest.raises(ValueError, match=message):
+        Planner().plan(line)
+
+
+@pytest.mark.parametrize("line, message", [
+    ("echo a >", "missing target"),
+    ("echo a 2>&3", "bad file descriptor"),
+])
+def test_redirect_errors(line, message):
+    with pytest.raises(ValueError, match=message):
+        RedirectParser().parse(MyLex(line).parse())
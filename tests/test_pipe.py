@@ -0,0 +1,77 @@
+import itertools
+import pytest
+from app.commands import StreamCommand
+from app.pipe import SIGPIPE_STATUS
+
+
+class EndlessCommand(StreamCommand):
+    """Writes numbered lines until its reader goes away"""
+    reads_stdin = False
+
+    def __init__(self):
+        self.written = 0
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        for self.written in itertools.count(1):
+            stdout.write(f"{self.written}\n".encode())
+        return 0
+
+
+class CountCommand(StreamCommand):
+    """Counts its input lines while recording the size of each read"""
+
+    def __init__(self):
+        self.reads = []
+
+    def run(self, args, stdin, stdout, stderr) -> int:
+        lines = 0
+        while chunk := stdin.read(4096):
+            self.reads.append(len(chunk))
+            lines += chunk.count(b"\n")
+        stdout.write(f"{lines}\n".encode())
+        return 0
+
+
+def test_builtin_producer_stops_on_closed_pipe(shell, run):
+    endless = EndlessCommand()
+    shell.registry.register_builtin("endless", endless)
+
+    assert run("endless | command head -n 2") == (0, b"1\n2\n", b"")
+    assert shell.pipe_processor.pipe_status == [SIGPIPE_STATUS, 0]
+    # Backpressure stopped it long before it could fill memory
+    assert endless.written < 1_000_000
+
+
+def test_builtin_consumer_streams_its_input(shell, run):
+    count = CountCommand()
+    shell.registry.register_builtin("count", count)
+
+    assert run("seq 1 200000 | count") == (0, b"200000\n", b"")
+    # The input arrived piece by piece, not as one argument
+    assert len(count.reads) > 1 and max(count.reads) <= 4096
+
+
+def test_stream_command_must_implement_run():
+    class Forgetful(StreamCommand):
+        name = "forgetful"
+
+    with pytest.raises(TypeError):
+        Forgetful()
+
+
+def test_execute_builtins_in_pipeline(run):
+    assert run("echo hello | command tr a-z A-Z") == (0, b"HELLO\n", b"")
+    assert run("yes | echo done") == (0, b"done\n", b"")
+
+
+def test_stage_resource_usage(shell):
+    plan = shell.planner.plan("time python3 -c 'sum(range(3_000_000))' | sleep 0.2").lists[0].pipelines[0]
+    assert plan.timed
+
+    pipeline = shell.pipe_processor.start_plan(plan)
+    pipeline.wait()
+    busy, sleeping = (stage.usage for stage in pipeline.stages)
+    # The busy stage exited first and was reaped as it did
+    assert busy.user > 0.01 and busy.real < sleeping.real
+    assert sleeping.real >= 0.2 and sleeping.user < busy.user
+    assert pipeline.usage.real >= sleeping.real and pipeline.usage.max_rss > 0
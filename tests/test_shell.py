@@ -1,26 +1,49 @@
 import pexpect
 import pytest
 import os
+import signal
+import time
 
-@pytest.fixture
-def shell_process(tmp_path):
+PROMPT = r'(?:\x1b\[[0-9;]*m)*\$ '
+
+
+def spawn_shell(tmp_path, tmp_path_factory, under_job_control=False, **kwargs):
+    """
+    Start the shell on a pty
+
+    With under_job_control it is started by sh -m, in a process group of
+    its own like from a login shell. Otherwise it leads an orphaned group,
+    which the terminal's stop signals never reach.
+    """
     shell_script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "echo-craft.sh"))
     project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
     env = os.environ.copy()
     env["PYTHONPATH"] = project_root
+    env["ECHOCRAFT_HISTORY"] = str(tmp_path_factory.mktemp("home") / "history")
+
+    args = []
+    if under_job_control:
+        shell_script_path, args = "/bin/sh", ["-mc", f"'{shell_script_path}'; echo parent is back"]
 
     proc = pexpect.spawn(
         shell_script_path,
+        args,
         cwd=str(tmp_path),
         env=env,             
         encoding='utf-8',
-        timeout=5
+        timeout=5,
+        **kwargs
     )
 
     # Wait for *any* prompt after banner (just once)
-    proc.expect(r'(?:\x1b\[[0-9;]*m)*\$ ')
+    proc.expect(PROMPT)
+    return proc
+
 
+@pytest.fixture
+def shell_process(tmp_path, tmp_path_factory):
+    proc = spawn_shell(tmp_path, tmp_path_factory)
     yield proc
     proc.terminate(force=True)
 
@@ -95,4 +118,188 @@ def test_history(shell_process):
     output = [line.strip().split(" ", 1)[1].strip() for line in output]
     
     # Expecting the last two commands in history
-    assert output[-3:] == ["echo first", "ls", "history"]
\ No newline at end of file
+    assert output[-3:] == ["echo first", "ls", "history"]
+
+def test_pipeline_streams_large_output(shell_process):
+    output = run_shell_command(shell_process, "seq 1 200000 | grep 7 | wc -l")
+    assert [line.strip() for line in output] == ["81902"]
+
+
+def test_pipeline_stops_producer_when_reader_exits(shell_process):
+    output = run_shell_command(shell_process, "yes | head -n 2")
+    assert output == ["y", "y"]
+
+    output = run_shell_command(shell_process, "yes | echo done")
+    assert output == ["done"]
+
+
+def test_output_streams_before_command_exits(shell_process):
+    shell_process.sendline('sh -c "echo first; sleep 2; echo second"')
+    # The first line must show up while the command is still running
+    shell_process.expect("first", timeout=1)
+    shell_process.expect(r'(?:\x1b\[[0-9;]*m)*\$ ', timeout=5)
+    assert "second" in shell_process.before
+
+
+def test_input_redirection(shell_process):
+    run_shell_command(shell_process, "echo banana > in.txt")
+    run_shell_command(shell_process, "echo apple >> in.txt")
+    output = run_shell_command(shell_process, "sort < in.txt")
+    assert output == ["apple", "banana"]
+
+
+def test_stderr_duplicated_to_stdout(shell_process):
+    run_shell_command(shell_process, "ls missing-file > out.txt 2>&1")
+    output = run_shell_command(shell_process, "cat out.txt")
+    assert len(output) == 1 and "missing-file" in output[0]
+
+
+def test_binary_pipeline(shell_process):
+    output = run_shell_command(shell_process, "head -c 100000 /dev/urandom | gzip -c | gunzip | wc -c")
+    assert [line.strip() for line in output] == ["100000"]
+
+    # Captured output is passed through as raw bytes as well
+    run_shell_command(shell_process, "set +o stream")
+    output = run_shell_command(shell_process, "head -c 100000 /dev/urandom | gzip -c | gunzip | wc -c")
+    assert [line.strip() for line in output] == ["100000"]
+
+
+def test_hash_builtin(shell_process):
+    run_shell_command(shell_process, "ls")
+    run_shell_command(shell_process, "ls")
+    output = run_shell_command(shell_process, "hash")
+    assert output[0].split() == ["hits", "command"]
+    assert any(line.split()[1].endswith("/ls") and line.split()[0] == "2" for line in output[1:])
+
+    run_shell_command(shell_process, "hash -r")
+    output = run_shell_command(shell_process, "hash")
+    assert output == ["hash: hash table empty"]
+
+
+def test_background_jobs(shell_process):
+    output = run_shell_command(shell_process, "sleep 30 &")
+    assert output[0].startswith("[1] ")
+
+    output = run_shell_command(shell_process, "jobs")
+    assert output == ["[1]+  Running                 sleep 30 &"]
+
+    run_shell_command(shell_process, "kill %1")
+    run_shell_command(shell_process, "wait %1")
+    assert run_shell_command(shell_process, "jobs") == []
+
+
+def test_stop_and_resume_job(shell_process):
+    shell_process.sendline("sh -c 'sleep 1; echo woke'")
+    shell_process.expect("sleep 1; echo woke'")
+    # Let the job take the terminal over first
+    time.sleep(0.3)
+    shell_process.sendcontrol("z")
+    shell_process.expect(r'(?:\x1b\[[0-9;]*m)*\$ ')
+    assert "Stopped" in shell_process.before
+
+    output = run_shell_command(shell_process, "fg")
+    assert output[-1] == "woke"
+
+
+@pytest.fixture
+def job_controlled_shell(tmp_path, tmp_path_factory):
+    proc = spawn_shell(tmp_path, tmp_path_factory, under_job_control=True)
+    yield proc
+    proc.terminate(force=True)
+
+
+def test_ctrl_z_never_stops_the_shell(job_controlled_shell):
+    shell_process = job_controlled_shell
+    shell_process.sendcontrol("z")
+    assert run_shell_command(shell_process, "echo at prompt") == ["at prompt"]
+
+    # Built-ins run in the shell's own process
+    shell_process.sendline("cat /dev/zero | wc -c")
+    shell_process.expect("wc -c")
+    time.sleep(0.3)
+    shell_process.sendcontrol("z")
+    time.sleep(0.3)
+    shell_process.sendcontrol("c")
+    shell_process.expect(PROMPT)
+    assert run_shell_command(shell_process, "echo still running") == ["still running"]
+
+
+def test_stop_job_when_started_with_stops_ignored(tmp_path, tmp_path_factory):
+    def ignore_stops():
+        signal.signal(signal.SIGTSTP, signal.SIG_IGN)
+
+    proc = spawn_shell(tmp_path, tmp_path_factory, preexec_fn=ignore_stops)
+    try:
+        proc.sendline("sleep 5")
+        proc.expect("sleep 5")
+        time.sleep(0.3)
+        proc.sendcontrol("z")
+        proc.expect(PROMPT)
+        assert "Stopped" in proc.before
+    finally:
+        proc.terminate(force=True)
+
+
+def test_interrupt_stops_command_list(shell_process):
+    shell_process.sendline("sleep 5; echo after")
+    shell_process.expect("echo after")
+    time.sleep(0.3)
+    shell_process.sendcontrol("c")
+    shell_process.expect(r'(?:\x1b\[[0-9;]*m)*\$ ')
+    assert "after" not in shell_process.before
+
+def cpu_seconds(pid):
+    """User and system time a process used so far"""
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def test_interrupt_stops_builtin_pipeline(shell_process):
+    shell_process.sendline("cat /dev/zero | wc -c")
+    shell_process.expect("wc -c")
+    time.sleep(0.5)
+    shell_process.sendcontrol("c")
+    shell_process.expect(r'(?:\x1b\[[0-9;]*m)*\$ ')
+
+    # The built-in stages are gone, not left spinning in their threads
+    before = cpu_seconds(shell_process.pid)
+    time.sleep(1)
+    assert cpu_seconds(shell_process.pid) - before < 0.2
+    assert run_shell_command(shell_process, "echo still here") == ["still here"]
+
+def test_history_search(shell_process):
+    run_shell_command(shell_process, "echo needle")
+    run_shell_command(shell_process, "false")
+    output = run_shell_command(shell_process, "history -s needle")
+
+    assert [line.split(None, 1)[1] for line in output] == ["echo needle", "history -s needle"]
+
+
+def test_fuzzy_history_picker(shell_process):
+    for command in ["echo alpha", "echo beta", "echo alpha"]:
+        run_shell_command(shell_process, command)
+
+    # Ctrl-R with "ea" typed: the picker opens on it, Enter puts the best match on the prompt
+    shell_process.send("ea\x12")
+    shell_process.expect("history> ea")
+    shell_process.send("\x1b[A\r")
+    shell_process.expect("echo beta")
+    output = run_shell_command(shell_process, "")
+
+    assert output[-1] == "beta"
+
+
+def test_tab_completion(shell_process, tmp_path):
+    (tmp_path / "some dir").mkdir()
+    (tmp_path / "some dir" / "notes.txt").write_text("completed\n")
+
+    shell_process.send("ech\t")
+    shell_process.expect("echo ")
+    shell_process.send("\x15cat so\t")
+    shell_process.expect(r"some\\ dir/")
+    shell_process.send("n\t")
+    shell_process.expect("notes.txt ")
+    output = run_shell_command(shell_process, "")
+
+    assert output[-1] == "completed"
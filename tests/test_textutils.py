@@ -0,0 +1,115 @@
+import pytest
+from app.lexical import MyLex
+from app.shell import Shell
+
+
+@pytest.fixture
+def shell(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input.txt").write_bytes(
+        b"alpha beta\n\nGamma  delta\talpha\nnaive na\xc3\xafve\n" + b"line\n" * 30 + b"no newline alpha"
+    )
+    (tmp_path / "other.txt").write_bytes(b"one\ntwo alpha\nthree\n")
+    (tmp_path / "empty.txt").write_bytes(b"")
+    (tmp_path / "bin.dat").write_bytes(b"alpha\0beta\nalpha again\n")
+    (tmp_path / "dir").mkdir()
+    return Shell()
+
+
+@pytest.mark.parametrize("line", [
+    "cat input.txt",
+    "cat input.txt - other.txt",
+    "cat input.txt missing.txt other.txt",
+    "head input.txt",
+    "head -n 3 input.txt",
+    "head -2 input.txt other.txt",
+    "head -n 1 input.txt -2",
+    "head -c 15 input.txt",
+    "head -n 0 input.txt",
+    "head -n 100 input.txt missing.txt other.txt",
+    "tail input.txt",
+    "tail -n 3 input.txt",
+    "tail -n 1 other.txt input.txt",
+    "tail -2 input.txt",
+    "tail -c 7 input.txt",
+    "tail -n 0 input.txt empty.txt",
+    "tail missing.txt other.txt",
+    "wc input.txt",
+    "wc -l input.txt",
+    "wc -lw input.txt other.txt",
+    "wc -c input.txt missing.txt empty.txt",
+    "wc missing.txt input.txt",
+    "wc -l missing.txt other.txt",
+    "wc missing.txt dir other.txt",
+    "wc dir",
+    "grep alpha input.txt",
+    "grep -n alpha input.txt other.txt",
+    "grep -c alpha input.txt other.txt",
+    "grep -vc alpha input.txt",
+    "grep -il gamma input.txt other.txt",
+    "grep -hw na input.txt other.txt",
+    "grep -x line input.txt",
+    "grep -E 'al(ph|f)a|^t' input.txt other.txt",
+    "grep 'a+|b' input.txt",
+    "grep -F 'a.b' input.txt",
+    "grep '^n.*e$' input.txt",
+    "grep alpha bin.dat",
+    "grep -c alpha bin.dat",
+    "grep -q alpha missing.txt input.txt",
+    "grep alpha missing.txt dir input.txt",
+    "grep nothing input.txt",
+])
+def test_matches_utility(run, line):
+    assert run(line) == run(f"command {line}")
+
+
+@pytest.mark.parametrize("source, line", [
+    ("cat input.txt", "head -n 2"),
+    ("cat input.txt", "tail -n 2"),
+    ("cat input.txt", "wc"),
+    ("cat input.txt", "wc -w"),
+    ("cat input.txt", "grep -H alpha"),
+    ("cat input.txt", "cat - other.txt"),
+    ("cat input.txt", "tee copy.txt"),
+    ("yes", "head -n 3"),
+])
+def test_matches_utility_on_pipe(run, source, line):
+    assert run(f"{source} | {line}") == run(f"{source} | command {line}")
+
+
+def test_tee_writes_files(run, tmp_path):
+    assert run("cat other.txt | tee copy.txt | wc -l") == (0, b"3\n", b"")
+    assert (tmp_path / "copy.txt").read_bytes() == b"one\ntwo alpha\nthree\n"
+
+
+def test_cat_sends_files_in_the_kernel(shell, run, tmp_path):
+    data = bytes(range(256)) * 4096
+    (tmp_path / "big.bin").write_bytes(data)
+    shell.registry.options.trace = True
+
+    # Sent into a pipe, spliced out of one, and appended, where sendfile
+    # refuses and the data is copied
+    plan = shell.planner.plan("cat big.bin | cat - big.bin | command cat >> out.bin").lists[0].pipelines[0]
+    pipeline = shell.pipe_processor.start_plan(plan)
+    pipeline.wait()
+    assert pipeline.pipe_status == [0, 0, 0]
+    assert [stage.bytes_written for stage in pipeline.stages[:2]] == [len(data), 2 * len(data)]
+    pipeline.close()
+    assert run("cat big.bin big.bin >> out.bin") == (0, b"", b"")
+    assert (tmp_path / "out.bin").read_bytes() == data * 4
+
+
+@pytest.mark.parametrize("line", [
+    "grep -o alpha input.txt",
+    "grep '\\(a\\)' input.txt",
+    "grep '[[:alpha:]]' input.txt",
+    "head -n -2 input.txt",
+    "tail -n +2 input.txt",
+    "wc -m input.txt",
+    "cat -n input.txt",
+])
+def test_unsupported_flags_fall_back(shell, run, line):
+    tokens = MyLex(line).parse()
+    command = shell.registry.get_command(tokens[0].value)
+    assert not command.supports(tokens[1:])
+    assert run(line) == run(f"command {line}")
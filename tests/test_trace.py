@@ -0,0 +1,90 @@
+import json
+from app.shell import Shell
+
+
+def traced_shell(path=None):
+    shell = Shell()
+    shell.registry.options.trace = True
+    shell.tracer.path = path
+    return shell
+
+
+def read_events(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_events_written_as_json_lines(tmp_path, capfd):
+    path = tmp_path / "trace.jsonl"
+    shell = traced_shell(str(path))
+    shell.run_line("seq 1000 | grep 7 | command wc -l")
+    shell.run_line("seq 1000 | grep 7 | command wc -l")
+    shell.run_line("false || true; exit-not-found")
+    shell.tracer.flush()
+
+    first, second, third = read_events(path)
+    assert (first["cache"], second["cache"], third["cache"]) == ("miss", "hit", "miss")
+    assert first["lex_us"] >= 0 and first["parse_us"] >= 0 and "lex_us" not in second
+
+    seq, grep, wc = first["pipelines"][0]["stages"]
+    assert [stage["builtin"] for stage in (seq, grep, wc)] == [False, True, False]
+    # What a stage wrote is what the next one read
+    assert seq["written_bytes"] == grep["read_bytes"]
+    assert grep["written_bytes"] == len("".join(f"{n}\n" for n in range(1, 1001) if "7" in str(n)))
+    assert all(stage["spawn_us"] is not None and stage["real_us"] > 0 for stage in (seq, grep, wc))
+
+    assert [pipeline["status"] for pipeline in third["pipelines"]] == [1, 0, 1]
+    assert third["status"] == 1
+
+
+def test_stats_counts_traced_lines(capfd):
+    shell = traced_shell()
+    shell.run_line("echo a | command cat")
+    shell.run_line("false")
+    capfd.readouterr()
+
+    shell.run_line("stats")
+    stats = dict(line.split(None, 1) for line in capfd.readouterr().out.splitlines())
+    assert stats["tracing"] == "on"
+    assert stats["lines"].startswith("2, 1 failed")
+    assert stats["stages"] == "3, 1 built-in, 2 external"
+
+    shell.run_line("stats -r")
+    # Only the line that reset them is left
+    assert shell.tracer.counters["lines"] == shell.tracer.counters["stages"] == 1
+
+
+def test_disabled_tracer_records_nothing(tmp_path):
+    shell = Shell()
+    shell.tracer.path = str(tmp_path / "trace.jsonl")
+    shell.run_line("echo a > /dev/null")
+    assert not shell.tracer.counters
+    assert not (tmp_path / "trace.jsonl").exists()
+
+    # Turned on by the line itself, it starts with the next line
+    shell.run_line("set -o trace")
+    shell.run_line("echo b > /dev/null")
+    assert shell.tracer.counters["lines"] == 1
+
+
+def test_trace_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv("ECHOCRAFT_TRACE", str(tmp_path / "trace.jsonl"))
+    shell = Shell()
+    assert shell.registry.options.trace and shell.tracer.path == str(tmp_path / "trace.jsonl")
+
+    monkeypatch.delenv("ECHOCRAFT_TRACE")
+    assert not Shell().registry.options.trace
+
+
+def test_unwritable_trace_file_warns_once(tmp_path, capfd):
+    path = str(tmp_path / "missing" / "trace.jsonl")
+    shell = traced_shell(path)
+    shell.run_line("echo a")
+    shell.run_line("echo b")
+    shell.tracer.flush()
+
+    captured = capfd.readouterr()
+    assert captured.out == "a\nb\n"
+    assert captured.err == f"trace: {path}: No such file or directory\n"
+    # Still counted, only no longer written
+    assert shell.tracer.counters["lines"] == 2 and shell.tracer.path is None